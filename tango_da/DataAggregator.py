@@ -1,16 +1,39 @@
 import asyncio
+import collections
+import importlib.util
+import itertools
+import json
+import math
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-import h5py
 import numpy as np
 import tango
 import tango.server as ts
 
+from tango_da.buffers import RingBuffer
+from tango_da.deadband import ChangeFilter
+from tango_da.decimation import DECIMATION_COLUMNS, Decimator
+from tango_da.schedule import AdaptivePeriod, Schedule
+from tango_da.storage import (COMPRESSION_FILTERS, STORAGE_BACKENDS,
+                              StorageBackend, create_storage)
+from tango_da.telemetry import Telemetry
+from tango_da.worker import DAWorkerPool, shard
+from tango_da.writer import DAWriter, BACKPRESSURE_POLICIES
+
 
 # ----------------------------------------------------------------------
 # helper methods and utility classes
 # ----------------------------------------------------------------------
+# buffer: tango's client side event queue, drained with get_events()
+# callback: push_event() fills a preallocated RingBuffer
+EVENT_MODES = ("buffer", "callback")
+# buffer load at which a drain counts as a near miss of an overflow
+NEAR_MISS_LOAD = 0.9
+
+
 def is_start_allowed(device):
     if device.get_state() == tango.DevState.ON:
         return True
@@ -25,26 +48,111 @@ def is_stop_allowed(device):
         return False
 
 
+def attr_options(attr):
+    """
+    Optional per-attribute settings of a config entry, sent by the run
+    configurator as a json string after device, attribute and aggregator.
+
+    Returns
+    -------
+    dict
+    """
+    if len(attr['value']) > 3 and attr['value'][3]:
+        return json.loads(attr['value'][3])
+    return {}
+
+
 class DAData:
     def __init__(self, attr_id, attr_key,
                  attr_type="run_attribute",
-                 size_buffer=None
+                 size_buffer=None,
+                 timeout=None,
+                 dev_proxy=None,
+                 options=None,
+                 event_mode="buffer",
+                 size_ring=None,
+                 drain_period=None,
+                 drain_control=None
                  ):
         self.attr_id = attr_id
         self.attr_key = attr_key
         self.attr_type = attr_type
-        self.attr_proxy = tango.AttributeProxy(attr_id)
+        self.options = options or {}
+        self.dev_name, self.attr_name = attr_id.rsplit("/", 1)
 
-        self._event_id = None
-        if attr_type == "push_attribute":
-            self._event_id = self.attr_proxy.subscribe_event(
-                tango.EventType.CHANGE_EVENT,
-                size_buffer)
+        if dev_proxy is None:
+            dev_proxy = tango.DeviceProxy(self.dev_name)
+        if timeout is not None:
+            # release the reading thread at about the time the aggregator
+            # gives up waiting for it, also on a shared device proxy
+            dev_proxy.set_timeout_millis(int(timeout * 1000))
+        self.dev_proxy = dev_proxy
 
-        self._d_attr_obj = self.attr_proxy.read()
+        self._d_attr_obj = self.dev_proxy.read_attribute(self.attr_name)
 
         self.last_error = None
 
+        # change-only storage of poll attributes, None stores every value
+        self.change_filter = None
+        if attr_type == "poll_attribute":
+            self.change_filter = ChangeFilter.from_options(self.options)
+
+        # event accounting of push attributes, since the start of a run
+        self.n_event_errors = 0
+        self.n_overflows = 0
+        self.n_gaps = 0
+        self.max_gap = 0.0
+        self._t_last = None
+        self.gap_max = self.options.get("max_gap")
+        if self.gap_max is None and self.options.get("rate"):
+            self.gap_max = 2.0 / float(self.options["rate"])
+
+        self.size_buffer = size_buffer
+        self.event_mode = self.options.get("event_mode", event_mode)
+        self.ring = None
+        self._event_id = None
+        if attr_type == "push_attribute":
+            if self.event_mode == "callback":
+                self.ring = RingBuffer.from_size(
+                    size_ring,
+                    shape=self.data_shape[1::],
+                    dtype=self.store_dtype,
+                    rate=self.options.get("rate"),
+                    period=drain_period
+                )
+                self.size_buffer = self.ring.capacity
+                self._event_id = self.dev_proxy.subscribe_event(
+                    self.attr_name,
+                    tango.EventType.CHANGE_EVENT,
+                    self.push_event)
+            else:
+                self._event_id = self.dev_proxy.subscribe_event(
+                    self.attr_name,
+                    tango.EventType.CHANGE_EVENT,
+                    size_buffer)
+
+        # drain period of push attributes, adapted to the buffer load if
+        # drain_control holds the settings of AdaptivePeriod
+        self.drain_period = drain_period or 0.0
+        self.drain = None
+        self.n_near_misses = 0
+        if attr_type == "push_attribute" and drain_control is not None:
+            period = drain_period or drain_control["period_max"]
+            rate = self.options.get("rate")
+            if rate:
+                # don't let the buffer pass the high-water mark until the
+                # first drain
+                high_water = drain_control.get("high_water", 0.5)
+                period = min(period, high_water * self.size_buffer / rate)
+            self.drain = AdaptivePeriod(period, **drain_control)
+            self.drain_period = self.drain.period
+
+        # hdf5 datasets, cached while the file of a run is open. Datasets
+        # are preallocated, only the first 'n_rows' rows are valid
+        self.dset_timestamp = None
+        self.dset_data = None
+        self.n_rows = 0
+
     @property
     def dim_x(self):
         return self._d_attr_obj.dim_x
@@ -74,7 +182,8 @@ class DAData:
         """
         d_shape = (1, self._d_attr_obj.dim_x)
         if self._d_attr_obj.dim_y > 0:
-            d_shape = d_shape + (self._d_attr_obj.dim_y,)
+            # images are extracted as arrays of shape (dim_y, dim_x)
+            d_shape = (1, self._d_attr_obj.dim_y, self._d_attr_obj.dim_x)
         return d_shape
 
     @property
@@ -89,41 +198,476 @@ class DAData:
         d_shape_max = (None,) + d_shape[1::]
         return d_shape_max
 
-    def get_data(self):
+    @property
+    def row_size(self):
+        """
+        Returns
+        -------
+        int
+            approximate number of bytes per recorded value
+        """
+        itemsize = max(np.dtype(self.store_dtype).itemsize, 8)
+        return itemsize * math.prod(self.data_shape[1::])
+
+    @property
+    def store_dtype(self):
+        """
+        Returns
+        -------
+        numpy.dtype
+            dtype of recorded data, strings are kept as python objects
+        """
+        if self.data_type is str:
+            return np.dtype(object)
+        return np.dtype(self.data_type)
+
+    def get_batch(self):
         """Poll newest data
 
         Returns
         -------
-        data_new : list of tuple
-            [(val_1, timestamp_1), .... , (val_n, timestamp_n)]
+        timestamp : numpy.ndarray
+            shape (n, 1)
+        data : numpy.ndarray
+            shape (n,) + data_shape[1:], n = 0 if no data was captured
+        """
+        if self.ring is not None:
+            timestamp, data = self.ring.drain()
+            self._check_events(timestamp)
+            self._adapt_drain(len(timestamp))
+            return timestamp[:, np.newaxis], data
+
+        elif self.attr_type == "push_attribute":
+            events = self.dev_proxy.get_events(self._event_id)
+            if len(events) >= self.size_buffer:
+                # tango's event queue was full, older events may be lost
+                self.n_overflows += 1
+            attr_objs = [e.attr_value for e in events if not e.err]
+            self.n_event_errors += len(events) - len(attr_objs)
+            timestamp = np.fromiter(
+                (attr_obj.time.totime() for attr_obj in attr_objs),
+                dtype=float,
+                count=len(attr_objs)
+            )
+            self._check_events(timestamp)
+            self._adapt_drain(len(events))
+            data = self._to_array([attr_obj.value for attr_obj in attr_objs])
+            return timestamp[:, np.newaxis], data
+
+        try:
+            d_attr_obj = self.dev_proxy.read_attribute(self.attr_name)
+            return self.unpack(d_attr_obj)
+        except (tango.DevFailed, tango.ConnectionFailed) as err:
+            # ToDo: More detailed error handling
+            self.last_error = err
+        except tango.DevError:
+            # ToDo: More detailed error handling
+            pass
+        return self._to_array([], [])
+
+    def unpack(self, d_attr_obj):
+        """Convert a freshly read attribute value
+
+        Parameters
+        ----------
+        d_attr_obj : tango.DeviceAttribute
+
+        Returns
+        -------
+        timestamp : numpy.ndarray
+        data : numpy.ndarray
+            see get_batch(), empty if reading the attribute failed
+        """
+        if d_attr_obj.has_failed:
+            self.last_error = d_attr_obj.get_err_stack()
+            return self._to_array([], [])
+        self.last_error = None
+        return self._to_array([d_attr_obj.value], [d_attr_obj.time.totime()])
+
+    def _to_array(self, values, timestamps=None):
+        """
+        Stack values, as extracted by tango, into one contiguous array of
+        rows. If timestamps are given, return (timestamp, data) instead.
+        """
+        data = np.asarray(values, dtype=self.store_dtype)
+        data = data.reshape((len(values),) + self.data_shape[1::])
+        if timestamps is None:
+            return data
+        timestamp = np.asarray(timestamps, dtype=float).reshape(-1, 1)
+        return timestamp, data
+
+    def push_event(self, event):
+        # used in subscribe_event() callback mode, called by tango's event
+        # thread
+        if event.err:
+            self.n_event_errors += 1
+            return
+        attr_obj = event.attr_value
+        self.ring.append(attr_obj.value, attr_obj.time.totime())
+
+    @property
+    def n_lost(self):
+        """
+        Returns
+        -------
+        int
+            events overwritten in the ring buffer before being drained. In
+            buffer mode, lost events can't be counted, see n_overflows.
+        """
+        if self.ring is None:
+            return 0
+        return self.ring.n_overwritten
+
+    def event_counters(self):
+        """
+        Returns
+        -------
+        dict
+            event accounting of a push attribute
+        """
+        return dict(
+            n_event_errors=self.n_event_errors,
+            n_lost=self.n_lost,
+            n_overflows=self.n_overflows,
+            n_gaps=self.n_gaps,
+            max_gap=self.max_gap,
+            drain_period=self.drain_period,
+            n_near_misses=self.n_near_misses,
+        )
+
+    def _adapt_drain(self, n_drained):
+        """
+        Count drains that found the buffer nearly full, and adapt the drain
+        period to the load of the buffer.
+        """
+        load = n_drained / self.size_buffer
+        if load >= NEAR_MISS_LOAD:
+            self.n_near_misses += 1
+        if self.drain is not None:
+            self.drain_period = self.drain.update(load)
+
+    def _check_events(self, timestamp):
+        """
+        Track gaps between the timestamps of consecutive events, also across
+        drains. A gap is a time between two events longer than gap_max.
+        """
+        if len(timestamp) == 0:
+            return
+        if self._t_last is not None:
+            timestamp = np.concatenate(([self._t_last], timestamp))
+        self._t_last = timestamp[-1]
+        if len(timestamp) < 2:
+            return
+        dt = np.diff(timestamp)
+        self.max_gap = max(self.max_gap, float(dt.max()))
+        if self.gap_max:
+            self.n_gaps += int(np.count_nonzero(dt > self.gap_max))
+
+    def reset(self):
+        """
+        Prepare a handle that is kept from a previous run for a new one.
+        Data that arrived in between runs is discarded.
         """
-        data_new = []
         if self.attr_type == "push_attribute":
-            events = self.attr_proxy.get_events(self._event_id)
-            for e in events:
-                if not e.err:
-                    attr_obj = e.attr_value
-                    attr_obj.timestamp = attr_obj.time.totime()
-                    data_new.append((attr_obj.value, attr_obj.timestamp))
-        else:
+            self.get_batch()
+        # shape and dtype of the new run, e.g. a spectrum may have changed
+        # its length in between
+        self._d_attr_obj = self.dev_proxy.read_attribute(self.attr_name)
+        if self.ring is not None:
+            self.ring.n_overwritten = 0
+        self.n_event_errors = 0
+        self.n_overflows = 0
+        self.n_near_misses = 0
+        self.n_gaps = 0
+        self.max_gap = 0.0
+        self._t_last = None
+        if self.change_filter is not None:
+            self.change_filter.reset()
+        self.last_error = None
+        self.dset_timestamp = None
+        self.dset_data = None
+        self.n_rows = 0
+
+    def close(self):
+        """
+        Unsubscribe from events, the handle can't be used afterwards.
+        """
+        if self._event_id is not None:
             try:
-                d_attr_obj = self.attr_proxy.read()
-                timestamp = d_attr_obj.time.totime()
-                val = d_attr_obj.value
-                data_new.append((val, timestamp))
-                self.last_error = None
-            except (tango.DevFailed, tango.ConnectionFailed) as err:
-                # ToDo: More detailed error handling
-                self.last_error = err
-            except tango.DevError:
-                # ToDo: More detailed error handling
+                self.dev_proxy.unsubscribe_event(self._event_id)
+            except tango.DevFailed:
                 pass
+            self._event_id = None
+
+
+class DAGroup:
+    """
+    Poll attributes of a single device. All attributes are fetched with one
+    read_attributes() call, i.e. one network round trip per device and cycle.
+    """
+    def __init__(self, dev_proxy, handles):
+        self.dev_proxy = dev_proxy
+        self.handles = list(handles)
+        self._attr_names = [p_handle.attr_name for p_handle in self.handles]
+
+    def get_batch(self):
+        """Poll newest data of all attributes in the group
+
+        Returns
+        -------
+        batches : list of tuple
+            (timestamp, data) per attribute, in the order of ``handles``
+        """
+        try:
+            d_attr_objs = self.dev_proxy.read_attributes(self._attr_names)
+        except (tango.DevFailed, tango.ConnectionFailed) as err:
+            for p_handle in self.handles:
+                p_handle.last_error = err
+            return [p_handle._to_array([], []) for p_handle in self.handles]
+
+        return [
+            p_handle.unpack(d_attr_obj)
+            for p_handle, d_attr_obj in zip(self.handles, d_attr_objs)
+        ]
+
+
+class DAPackedTable:
+    """
+    Scalar poll attributes of the same poll period, stored as the columns of
+    one table. The table is recorded like a single spectrum attribute:
+    every row holds the values of one cycle, with a shared timestamp, the
+    mean timestamp of its values. Values are stored as float64, values that
+    could not be read are NaN.
+
+    Parameters
+    ----------
+    attr_key : str
+        key of the table, e.g. 'scalars_3s'
+    handles : list
+        DAData or equivalent handles of the columns
+    poll_period : float
+    """
+    attr_type = "poll_attribute"
+    data_format = "SPECTRUM"
+    data_type = np.dtype(float)
+    store_dtype = np.dtype(float)
+
+    def __init__(self, attr_key, handles, poll_period):
+        self.attr_key = attr_key
+        self.attr_id = f"packed/{attr_key}"
+        self.handles = list(handles)
+        self.options = {"poll_period": poll_period}
+        self.columns = [p_handle.attr_key for p_handle in self.handles]
+        self.index = {key: i for i, key in enumerate(self.columns)}
+        self.last_error = None
+        self._t_row = []
+        self._row = None
 
-        return data_new
+        self.dset_timestamp = None
+        self.dset_data = None
+        self.n_rows = 0
 
-    def push_event(self):
-        # used in subscribe_event() callback mode
-        pass
+    @property
+    def data_shape(self):
+        return (1, len(self.columns))
+
+    @property
+    def data_shape_max(self):
+        return (None, len(self.columns))
+
+    @property
+    def row_size(self):
+        return 8 * len(self.columns)
+
+    def stream_attrs(self):
+        """
+        Returns
+        -------
+        dict
+            mapping of columns to attributes
+        """
+        return {
+            'columns': self.columns,
+            'column_ids': [p_handle.attr_id for p_handle in self.handles],
+            'column_dtypes': [
+                str(p_handle.store_dtype) for p_handle in self.handles
+            ],
+        }
+
+    def get_batch(self):
+        """
+        Returns
+        -------
+        timestamp, data : numpy.ndarray
+            first row of the table, from the first value of every column
+        """
+        for p_handle in self.handles:
+            self.put(p_handle.attr_key, *StorageBackend.first_batch(p_handle))
+        return self.pop_row()
+
+    def put(self, attr_key, t_new, d_new):
+        """
+        Enter the newest value of a column into the pending row.
+        """
+        if len(t_new) == 0:
+            return
+        if self._row is None:
+            self._row = np.full((1, len(self.columns)), np.nan)
+        self._row[0, self.index[attr_key]] = d_new[-1].item()
+        self._t_row.append(t_new[-1, 0])
+
+    def pop_row(self):
+        """
+        Returns
+        -------
+        timestamp : numpy.ndarray
+            shape (n, 1)
+        data : numpy.ndarray
+            shape (n, number of columns), n = 0 without pending values
+        """
+        if self._row is None:
+            return np.zeros((0, 1)), np.zeros((0, len(self.columns)))
+        timestamp = np.array([[np.mean(self._t_row)]])
+        row = self._row
+        self._row = None
+        self._t_row = []
+        return timestamp, row
+
+
+class DADecimatedStream:
+    """
+    Decimated copy of a recorded numeric attribute: min, max, mean and count
+    per time bin, stored next to the raw data as '<key>/decimated_<width>s'.
+
+    Parameters
+    ----------
+    p_handle : DAData or equivalent
+        handle of the recorded attribute
+    width : float
+        bin width in seconds
+    """
+    # one row per bin, i.e. at a regular rate like a poll attribute
+    attr_type = "poll_attribute"
+    data_type = np.dtype(float)
+    store_dtype = np.dtype(float)
+
+    def __init__(self, p_handle, width):
+        self.source_key = p_handle.attr_key
+        self.attr_key = f"{p_handle.attr_key}/decimated_{width:g}s"
+        self.attr_id = p_handle.attr_id
+        self.options = {
+            key: value for key, value in p_handle.options.items()
+            if key in ("compression", "compression_level", "shuffle")
+        }
+        self.options["poll_period"] = float(width)
+        shape = tuple(p_handle.data_shape[1::])
+        if p_handle.data_format == "SCALAR":
+            shape = ()
+        self.data_format = "SPECTRUM" if not shape else "IMAGE"
+        self.decimator = Decimator(width, shape)
+        self.last_error = None
+
+        self.dset_timestamp = None
+        self.dset_data = None
+        self.n_rows = 0
+
+    @property
+    def data_shape(self):
+        return (1, len(DECIMATION_COLUMNS)) + self.decimator.shape
+
+    @property
+    def data_shape_max(self):
+        return (None,) + self.data_shape[1::]
+
+    @property
+    def row_size(self):
+        return 8 * math.prod(self.data_shape[1::])
+
+    def stream_attrs(self):
+        return {
+            'source': self.source_key,
+            'bin_width': self.decimator.width,
+            'columns': list(DECIMATION_COLUMNS),
+        }
+
+    def get_batch(self):
+        """
+        Returns
+        -------
+        timestamp, data : numpy.ndarray
+            no rows, a stream starts empty
+        """
+        return self.decimator.finish()
+
+    def update(self, t_new, d_new):
+        """
+        Returns
+        -------
+        timestamp, data : numpy.ndarray
+            bins completed by the new values of the recorded attribute
+        """
+        return self.decimator.update(
+            t_new, d_new.reshape((len(d_new),) + self.decimator.shape)
+        )
+
+    def finish(self):
+        """
+        Returns
+        -------
+        timestamp, data : numpy.ndarray
+            the incomplete last bin
+        """
+        return self.decimator.finish()
+
+
+class DAConnectionCache:
+    """
+    Device proxies and attribute handles, kept from one run to the next.
+
+    A handle is reused as long as its configuration stays the same, which
+    saves connecting, subscribing and the initial read at the start of every
+    run. Handles that are no longer configured or have failed are evicted,
+    device proxies once no handle refers to them anymore.
+    """
+    def __init__(self):
+        self.dev_proxies = {}
+        self.handles = {}
+
+    @staticmethod
+    def signature(tango_id, attr_key, attr_type, options, **kwargs):
+        """
+        Returns
+        -------
+        tuple
+            hashable key, equal for identical attribute configurations
+        """
+        return (
+            tango_id, attr_key, attr_type,
+            json.dumps(options, sort_keys=True),
+            json.dumps(kwargs, sort_keys=True, default=str)
+        )
+
+    def evict(self, signatures=()):
+        """
+        Drop all handles, whose signature is not in signatures or that have
+        failed during the last run, and all device proxies not used anymore.
+
+        Returns
+        -------
+        n_evicted : int
+        """
+        n_evicted = 0
+        for sig, p_handle in list(self.handles.items()):
+            if sig not in signatures or p_handle.last_error is not None:
+                p_handle.close()
+                del self.handles[sig]
+                n_evicted += 1
+
+        dev_names = {p_handle.dev_name for p_handle in self.handles.values()}
+        for dev_name in list(self.dev_proxies):
+            if dev_name not in dev_names:
+                del self.dev_proxies[dev_name]
+        return n_evicted
 
 
 # ----------------------------------------------------------------------
@@ -140,17 +684,37 @@ class DataAggregator(ts.Device):
     _var_poll = _v_init
     _var_push = _v_init
     _proxy_handles = []
+    _readers = []
     _run_task = None
+    _executor = None
+    _writer = None
+    _handles_by_key = {}
+    _packed = {}
+    _decimated = {}
+    _storage_open = None
+    _pending_puts = set()
+    _cache = None
+    _workers = None
+    _worker_stats = {}
+    _pump = None
+    _pump_stop = None
+    _telemetry = None
 
     _name_da = ""
-    _file_number = 1
     _file_path = ""
-    _file_name = ""
-    _file_size = 0.0
+    _storage = None
+    _flush_interval = 10.0
+    _flush_size = 64 * 1024 ** 2
 
     _poll_period = 3.0
+    _read_timeout = 3.0
     _cycle_duration = 0.0
-    _n_buffer_current = 0
+    _buffer_load = 0.0
+    # buffer load per push attribute and attributes without data, as of
+    # their last read
+    _loads = {}
+    _no_data = {}
+    _schedule = None
 
     # reduce maximum buffer size in order to avoid memory problems
     _size_buffer_stream = 1000
@@ -159,6 +723,61 @@ class DataAggregator(ts.Device):
     # class and device properties
     # ------------------------------------------------------------------
     buffer_size = ts.device_property(dtype=int, default_value=1000)
+    # storage layout, may be overridden per attribute in the config file.
+    # 'chunk_rows' = 0 derives the chunk size from row size and poll period
+    chunk_rows = ts.device_property(dtype=int, default_value=0)
+    compression = ts.device_property(dtype=str, default_value="")
+    compression_level = ts.device_property(dtype=int, default_value=4)
+    shuffle = ts.device_property(dtype=bool, default_value=True)
+    # hand-over of recorded data to the writer thread, see DAWriter
+    write_queue_size = ts.device_property(dtype=int, default_value=100)
+    backpressure = ts.device_property(dtype=str, default_value="block")
+    # push attributes: 'event_mode' selects the event buffering, see
+    # EVENT_MODES. In callback mode every attribute owns a ring buffer of at
+    # most 'push_buffer_size' MB
+    event_mode = ts.device_property(dtype=str, default_value="buffer")
+    push_buffer_size = ts.device_property(dtype=float, default_value=64.0)
+    # push attributes are drained on their own cadence: the drain period
+    # shrinks when a drain finds the buffer fuller than 'drain_high_water'
+    # and grows when it is below 'drain_low_water' (fractions of the buffer
+    # size), within 'drain_period_min' and 'drain_period_max' seconds. 0 as
+    # maximum is the polling period. See AdaptivePeriod
+    drain_adaptive = ts.device_property(dtype=bool, default_value=True)
+    drain_period_min = ts.device_property(dtype=float, default_value=0.01)
+    drain_period_max = ts.device_property(dtype=float, default_value=0.0)
+    drain_high_water = ts.device_property(dtype=float, default_value=0.5)
+    drain_low_water = ts.device_property(dtype=float, default_value=0.1)
+    read_workers = ts.device_property(dtype=int, default_value=8)
+    read_timeout = ts.device_property(dtype=float, default_value=3.0)
+    # store scalar poll attributes of the same poll period as the columns of
+    # one table, see DAPackedTable. The option 'pack' of a config entry
+    # overrides it
+    pack_scalars = ts.device_property(dtype=bool, default_value=False)
+    # bin widths in seconds of the decimated streams of numeric push
+    # attributes, see DADecimatedStream. The option 'decimate' of a config
+    # entry overrides it, also for poll attributes
+    decimation_levels = ts.device_property(
+        dtype=tango.DevVarDoubleArray,
+        default_value=[1.0, 10.0, 60.0]
+    )
+    # storage of recorded data, one of STORAGE_BACKENDS
+    storage_backend = ts.device_property(dtype=str, default_value="hdf5")
+    # write hdf5 files in single writer multiple reader mode, so they can be
+    # read while they are recorded, see HDF5Storage
+    swmr = ts.device_property(dtype=bool, default_value=False)
+    # flush the hdf5 file after 'flush_interval' seconds, or as soon as
+    # 'flush_size' MB have been written since the last flush
+    flush_interval = ts.device_property(dtype=float, default_value=10.0)
+    flush_size = ts.device_property(dtype=float, default_value=64.0)
+    # continue in a new file after 'rollover_size' MB or 'rollover_time'
+    # seconds, 0 disables the respective limit
+    rollover_size = ts.device_property(dtype=float, default_value=0.0)
+    rollover_time = ts.device_property(dtype=float, default_value=0.0)
+    # read attributes in 'worker_processes' processes instead of threads of
+    # the device server, 0 disables worker processes. Every worker hands its
+    # data over through 'worker_shm_size' MB of shared memory
+    worker_processes = ts.device_property(dtype=int, default_value=0)
+    worker_shm_size = ts.device_property(dtype=float, default_value=64.0)
 
     # ------------------------------------------------------------------
     # Init
@@ -169,10 +788,45 @@ class DataAggregator(ts.Device):
         self.set_state(tango.DevState.INIT)
 
         self._name_da = self.get_name().split("/")[-1]
+        if self.compression not in COMPRESSION_FILTERS:
+            raise ValueError(f"Allowed compression: {COMPRESSION_FILTERS}")
+        if self.backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Allowed backpressure: {BACKPRESSURE_POLICIES}")
+        if self.event_mode not in EVENT_MODES:
+            raise ValueError(f"Allowed event modes: {EVENT_MODES}")
+        if self.storage_backend not in STORAGE_BACKENDS:
+            raise ValueError(f"Allowed storage backends: {STORAGE_BACKENDS}")
+        if (self.storage_backend == "parquet"
+                and importlib.util.find_spec("pyarrow") is None):
+            raise ValueError("storage backend 'parquet' requires pyarrow")
+        if self.swmr and self.storage_backend != "hdf5":
+            raise ValueError("swmr requires the storage backend 'hdf5'")
+        if not 0.0 <= self.drain_low_water < self.drain_high_water <= 1.0:
+            raise ValueError("drain water marks require "
+                             "0 <= drain_low_water < drain_high_water <= 1")
+        if self.drain_period_min <= 0.0:
+            raise ValueError("drain_period_min has to be positive")
         self._size_buffer_stream = self.buffer_size
+        self._read_timeout = self.read_timeout
+        self._flush_interval = self.flush_interval
+        self._flush_size = int(self.flush_size * 1024 ** 2)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.read_workers,
+            thread_name_prefix=f"{self._name_da}_read"
+        )
+        self._cache = DAConnectionCache()
+        self._telemetry = Telemetry()
 
         self.set_state(tango.DevState.ON)
 
+    async def delete_device(self):
+        if self._cache is not None:
+            self._cache.evict()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        await super().delete_device()
+
     # ------------------------------------------------------------------
     # attributes
     # ------------------------------------------------------------------
@@ -224,14 +878,15 @@ class DataAggregator(ts.Device):
     @file_path.write
     async def file_path(self, file_path):
         self._file_path = file_path
-        self._file_number = 1
 
     @ts.attribute(
         label="File Name",
         dtype=str,
     )
     async def file_name(self):
-        return self._file_name
+        if self._storage is None:
+            return ""
+        return self._storage.file_name
 
     @ts.attribute(
         label="File Size",
@@ -240,7 +895,22 @@ class DataAggregator(ts.Device):
         format="%3.3f",
     )
     async def file_size(self):
-        return self._file_size
+        if self._storage is None:
+            return 0.0
+        return self._storage.file_size / (1024 ** 2)
+
+    @ts.attribute(
+        label="Total file size",
+        doc="size of all files of the current recording",
+        dtype=float,
+        unit="MB",
+        format="%3.3f",
+    )
+    async def file_size_total(self):
+        if self._storage is None:
+            return 0.0
+        storage = self._storage
+        return (storage.size_closed + storage.file_size) / (1024 ** 2)
 
     @ts.attribute(
         label="Cycle processing time",
@@ -250,6 +920,19 @@ class DataAggregator(ts.Device):
     async def cycle_duration(self):
         return self._cycle_duration * 1000.0
 
+    @ts.attribute(
+        label="Missed ticks",
+        doc="poll and drain ticks skipped, because a previous cycle "
+            "took too long",
+        dtype=int,
+    )
+    async def missed_ticks(self):
+        if self._workers is not None:
+            return sum(self._workers.n_missed.values())
+        if self._schedule is None:
+            return 0
+        return self._schedule.n_missed
+
     @ts.attribute(
         label="Maximum buffer load",
         dtype=float,
@@ -257,7 +940,187 @@ class DataAggregator(ts.Device):
         format="%3.2f",
     )
     async def buffer_load(self):
-        return self._n_buffer_current / self._size_buffer_stream * 100.0
+        return self._buffer_load * 100.0
+
+    @ts.attribute(
+        label="Write queue depth",
+        dtype=int,
+    )
+    async def write_queue_depth(self):
+        if self._writer is None:
+            return 0
+        return self._writer.queue_depth
+
+    @ts.attribute(
+        label="Write latency",
+        unit="ms",
+        dtype=float,
+    )
+    async def write_latency(self):
+        if self._writer is None:
+            return 0.0
+        return self._writer.write_latency * 1000.0
+
+    @ts.attribute(
+        label="Dropped batches",
+        dtype=int,
+    )
+    async def batches_dropped(self):
+        if self._writer is None:
+            return 0
+        return self._writer.n_dropped
+
+    @ts.attribute(
+        label="Telemetry keys",
+        doc="attribute keys, in the order of all per-attribute telemetry",
+        dtype=(str,),
+        max_dim_x=10000,
+    )
+    async def telemetry_keys(self):
+        return list(self._telemetry.attrs)
+
+    @ts.attribute(
+        label="Read latency p50",
+        unit="ms",
+        dtype=(float,),
+        max_dim_x=10000,
+    )
+    async def read_latency_p50(self):
+        return self._telemetry_column(
+            lambda s: s.read_latency.percentile(50) * 1000.0
+        )
+
+    @ts.attribute(
+        label="Read latency p99",
+        unit="ms",
+        dtype=(float,),
+        max_dim_x=10000,
+    )
+    async def read_latency_p99(self):
+        return self._telemetry_column(
+            lambda s: s.read_latency.percentile(99) * 1000.0
+        )
+
+    @ts.attribute(
+        label="Write time p99",
+        doc="hdf5 write time per batch",
+        unit="ms",
+        dtype=(float,),
+        max_dim_x=10000,
+    )
+    async def write_time_p99(self):
+        return self._telemetry_column(
+            lambda s: s.write_time.percentile(99) * 1000.0
+        )
+
+    @ts.attribute(
+        label="Values received",
+        dtype=(int,),
+        max_dim_x=10000,
+    )
+    async def values_received(self):
+        return self._telemetry_column(lambda s: s.n_received)
+
+    @ts.attribute(
+        label="Values dropped",
+        doc="events overwritten in the ring buffer before being drained",
+        dtype=(int,),
+        max_dim_x=10000,
+    )
+    async def values_dropped(self):
+        return self._telemetry_column(lambda s: s.n_lost)
+
+    @ts.attribute(
+        label="Values skipped",
+        doc="values of poll attributes within their deadband, not stored",
+        dtype=(int,),
+        max_dim_x=10000,
+    )
+    async def values_skipped(self):
+        return self._telemetry_column(lambda s: s.n_skipped)
+
+    @ts.attribute(
+        label="Error events",
+        doc="events of push attributes that carried an error",
+        dtype=(int,),
+        max_dim_x=10000,
+    )
+    async def event_errors(self):
+        return self._telemetry_column(lambda s: s.n_event_errors)
+
+    @ts.attribute(
+        label="Event buffer overflows",
+        doc="drains that found the event buffer full, events may have been "
+            "lost before",
+        dtype=(int,),
+        max_dim_x=10000,
+    )
+    async def event_overflows(self):
+        return self._telemetry_column(lambda s: s.n_overflows)
+
+    @ts.attribute(
+        label="Drain period",
+        doc="current time between two drains of push attributes",
+        unit="s",
+        dtype=(float,),
+        max_dim_x=10000,
+    )
+    async def drain_period(self):
+        return self._telemetry_column(lambda s: s.drain_period)
+
+    @ts.attribute(
+        label="Drain near misses",
+        doc="drains of push attributes that found the event buffer nearly "
+            "full, or full",
+        dtype=(int,),
+        max_dim_x=10000,
+    )
+    async def drain_near_misses(self):
+        return self._telemetry_column(lambda s: s.n_near_misses)
+
+    @ts.attribute(
+        label="Event gaps",
+        doc="times between consecutive events longer than the option "
+            "'max_gap', or twice the inverse of 'rate'",
+        dtype=(int,),
+        max_dim_x=10000,
+    )
+    async def event_gaps(self):
+        return self._telemetry_column(lambda s: s.n_gaps)
+
+    @ts.attribute(
+        label="Maximum event gap",
+        unit="s",
+        dtype=(float,),
+        max_dim_x=10000,
+    )
+    async def event_max_gap(self):
+        return self._telemetry_column(lambda s: s.max_gap)
+
+    @ts.attribute(
+        label="Read errors",
+        dtype=(int,),
+        max_dim_x=10000,
+    )
+    async def read_errors(self):
+        return self._telemetry_column(lambda s: s.n_errors)
+
+    @ts.attribute(
+        label="Bytes written",
+        dtype=(int,),
+        max_dim_x=10000,
+    )
+    async def bytes_written(self):
+        return self._telemetry_column(lambda s: s.n_bytes)
+
+    @ts.attribute(
+        label="Telemetry",
+        doc="json summary of stage histograms and per-attribute metrics, "
+            "times in seconds",
+        dtype=str,
+    )
+    async def telemetry(self):
+        return json.dumps(self._telemetry.summary())
 
     # ------------------------------------------------------------------
     # commands
@@ -265,14 +1128,21 @@ class DataAggregator(ts.Device):
     @ts.command(fisallowed=is_start_allowed)
     async def Start(self):
         self.debug_stream('start measurement, ...')
-        self.set_status("starting .....")
-
-        self._run_task = set()
-        task = asyncio.create_task(self._da_thread())
-        self._run_task.add(task)
-        task.add_done_callback(self._run_task.discard)
+        await self._start()
 
-        self.set_state(tango.DevState.RUNNING)
+    @ts.command(
+        fisallowed=is_start_allowed,
+        dtype_in=float,
+        doc_in="time of the first poll tick, seconds since the epoch",
+    )
+    async def StartAt(self, t_start):
+        """
+        Start recording on a tick grid that begins at t_start. Used by the
+        run configurator to let all data aggregators of a run begin on the
+        same tick.
+        """
+        self.debug_stream(f'start measurement at {t_start}, ...')
+        await self._start(t_start)
 
     @ts.command()
     async def Stop(self):
@@ -282,10 +1152,13 @@ class DataAggregator(ts.Device):
         try:
             task = self._run_task.pop()
             task.cancel()
-            with h5py.File(self._file_name, 'a') as f:
-                f.attrs["time_stop"] = time.time()
+            await asyncio.wait([task])
+            await self._stop_workers()
+            await self._stop_writer()
+            await self._close_storage()
             del self._proxy_handles
             self._proxy_handles = []
+            self._readers = []
 
         except asyncio.CancelledError as err:
             self.debug_stream(f"cancelling run-task: {err}")
@@ -293,7 +1166,11 @@ class DataAggregator(ts.Device):
 
         except (KeyError, AttributeError):
             self.warn_stream("tried to cancel a non-existent task ....")
+            await self._stop_workers()
+            await self._stop_writer()
+            await self._close_storage()
             self._proxy_handles = []
+            self._readers = []
             pass
 
         self.set_state(tango.DevState.ON)
@@ -301,201 +1178,670 @@ class DataAggregator(ts.Device):
     # ------------------------------------------------------------------
     # internal methods
     # ------------------------------------------------------------------
-    async def _da_thread(self):
+    async def _da_thread(self, t_start=None):
         """
         Main thread of data aggregator.
 
-        Note
-        ----
-        wait some time before starting the actual thread. This is necessary
-        in order to avoid timeouts on a run configurator, when using multiple
-        instances running on the same device server.
+        Parameters
+        ----------
+        t_start : float, optional
+            time of the first tick, shared by all data aggregators of a run.
+            By default, the first tick is one polling period after connecting.
         """
-        await asyncio.sleep(3.0)
-
-        # connect to attribute proxies
-        attr_fail = []
-        self._proxy_handles = []
-
-        for attr in self._var_run[1]:
-            tango_id = attr['value'][0] + "/" + attr['value'][1]
-            try:
-                pxy_handle = DAData(
-                    tango_id,
-                    attr['name'],
-                    attr_type="run_attribute"
-                )
-                self._proxy_handles.append(pxy_handle)
-            except tango.DevFailed:
-                attr_fail.append(tango_id)
-        self.debug_stream("created proxies for run attributes, ...")
-
-        for attr in self._var_poll[1]:
-            tango_id = attr['value'][0] + "/" + attr['value'][1]
-            try:
-                pxy_handle = DAData(
-                    tango_id,
-                    attr['name'],
-                    attr_type="poll_attribute"
-                )
-                self._proxy_handles.append(pxy_handle)
-            except tango.DevFailed:
-                attr_fail.append(tango_id)
-        self.debug_stream("created proxies for poll attributes, ...")
-
-        for attr in self._var_push[1]:
-            tango_id = attr['value'][0] + "/" + attr['value'][1]
-            try:
-                pxy_handle = DAData(
-                    tango_id,
-                    attr['name'],
-                    attr_type="push_attribute",
-                    size_buffer=self._size_buffer_stream
-                )
-                self._proxy_handles.append(pxy_handle)
-            except tango.DevFailed:
-                attr_fail.append(tango_id)
-
-        self.debug_stream("created proxies for stream attributes, ...")
+        self._telemetry = Telemetry()
+        self._pending_puts = set()
+        self._loads = {}
+        self._no_data = {}
+        if self.worker_processes > 0:
+            attr_fail = await self._connect_workers()
+        else:
+            dev_proxies, attr_fail = await self._connect()
+        self.debug_stream("created proxies for all attributes, ...")
         self.set_status(f"Recording. Discard: {str(attr_fail)}")
 
-        # initialize hdf5 file
-        self._file_name = await self._init_file()
+        # initialize storage, e.g. the hdf5 file
+        self._storage = self._create_storage()
+        decimated = self._decimate()
+        storage_handles = self._pack_scalars() + [
+            stream for streams in decimated.values() for stream in streams
+        ]
+        self._decimated = decimated
+        loop = asyncio.get_running_loop()
+        # cancelling the run task doesn't stop the thread that opens the
+        # storage, Stop waits for it before closing the storage
+        self._storage_open = loop.run_in_executor(
+            None, self._storage.open_run, storage_handles, t_start
+        )
+        await asyncio.shield(self._storage_open)
+        self._handles_by_key = {p.attr_key: p for p in storage_handles}
+        self._writer = DAWriter(
+            self._write_batch,
+            size_queue=self.write_queue_size,
+            policy=self.backpressure,
+            dir_spill=os.path.join(self._file_path, f".spill_{self._name_da}"),
+            name=f"{self._name_da}_write"
+        )
+        self._writer.start()
 
         # remove run attributes
         for p in list(self._proxy_handles):
             if p.attr_type == "run_attribute":
                 self._proxy_handles.remove(p)
 
-        # start recording
+        if t_start is None:
+            t_start = time.time() + self._poll_period
+        if self._workers is not None:
+            await self._run_workers(t_start)
+            return
+
+        # bucket poll attributes by device and poll period, push attributes
+        # are drained individually, once per polling period or at their
+        # adaptive drain period
+        poll_handles = collections.defaultdict(list)
+        self._schedule = Schedule(t_start)
+        self._readers = []
+        for p in self._proxy_handles:
+            if p.attr_type == "poll_attribute":
+                poll_period = self._poll_period_of(p)
+                poll_handles[(p.dev_name, poll_period)].append(p)
+            else:
+                self._readers.append(p)
+                self._schedule.add(p, p.drain_period or self._poll_period)
+        for (dev_name, poll_period), handles in poll_handles.items():
+            reader = DAGroup(dev_proxies[dev_name], handles)
+            self._readers.append(reader)
+            self._schedule.add(reader, poll_period)
+
+        # start recording, on the absolute tick grid of the schedule
         while True:
-            self._file_size = os.stat(self._file_name).st_size / (1024 ** 2)
-
             self.debug_stream("Wait...")
-            await asyncio.sleep(self._poll_period)
+            t_next = self._schedule.next_deadline()
+            t_wait = min(t_next - time.time(), self._poll_period)
+            await asyncio.sleep(max(t_wait, 0.0))
             t_start = time.time()
+            readers = self._schedule.pop_due(t_start)
 
             self.debug_stream("capturing polled data...")
-            await self._store_data()
+            await self._store_data(readers)
+            for reader in readers:
+                if getattr(reader, "drain", None) is not None:
+                    self._schedule.set_period(reader, reader.drain.period)
             t_cycle = time.time() - t_start
             self._cycle_duration = (self._cycle_duration + t_cycle) / 2.0
+            self._telemetry.stages["cycle"].record(t_cycle)
+            self._telemetry.stages["queue_depth"].record(
+                self._writer.queue_depth
+            )
             self.debug_stream(f"processed chunk in {self._cycle_duration} s")
 
-    async def _init_file(self):
+    async def _start(self, t_start=None):
+        self.set_status("starting .....")
+
+        self._run_task = set()
+        task = asyncio.create_task(self._da_thread(t_start))
+        self._run_task.add(task)
+        task.add_done_callback(self._run_task.discard)
+
+        self.set_state(tango.DevState.RUNNING)
+
+    async def _connect(self):
         """
-        Initialize hdf5 file and create first entries.
+        Connect to all configured attributes. Proxies and handles of the
+        previous run are taken from the connection cache, as long as their
+        configuration hasn't changed. New device proxies and attribute
+        handles are created concurrently in the read thread pool, the event
+        loop stays responsive meanwhile. One device proxy per device is shared
+        by all attributes of that device.
 
         Returns
         -------
-        filename : str
-        """
-        if os.path.isfile(f"{self._file_path}/{self._name_da}_{self._file_number}.h5"):
-            self._file_number += 1
-        filename = f"{self._file_path}/{self._name_da}_{self._file_number}.h5"
-        t_start = time.time()
-
-        with h5py.File(filename, 'a') as f:
-            self.info_stream(f"creating {filename}")
-
-            f.create_group(f"data_run")
-            f.create_group(f"data_recorded")
-
-            for p_handle in self._proxy_handles:
-                attr_type = {
-                    "run_attribute": "data_run",
-                    "poll_attribute": "data_recorded",
-                    "push_attribute": "data_recorded",
-                }[p_handle.attr_type]
-                group_name = f"{attr_type}/{p_handle.attr_key}"
-                f.create_group(group_name)
-                await self._create_dset(f, p_handle, group_name)
-
-            f.attrs['time_start'] = t_start
-            f.attrs['name_experiment'] = self._file_path.split("/")[-2]
-            f.attrs['poll_period'] = self._poll_period
-            f.attrs['size_buffer_stream'] = self._size_buffer_stream
-
-        return filename
-
-    async def _create_dset(self, f, p_handle, group_name):
-        if p_handle.attr_type == "run_attribute":
-            self.debug_stream("initialize run attributes ...")
-            val, tstamp = p_handle.get_data()[0]
-
-            f[group_name].create_dataset(
-                'timestamp',
-                data=tstamp
+        dev_proxies : dict
+            {dev_name: tango.DeviceProxy}
+        attr_fail : list of str
+            attributes that could not be connected
+        """
+        loop = asyncio.get_running_loop()
+        attr_configs = [
+            (self._cache.signature(tango_id, attr_key, attr_type, options,
+                                   **kwargs),
+             tango_id, attr_key, attr_type, options, kwargs)
+            for tango_id, attr_key, attr_type, options, kwargs
+            in self._attr_configs()
+        ]
+
+        n_evicted = self._cache.evict({config[0] for config in attr_configs})
+        self.debug_stream(f"evicted {n_evicted} cached attribute handles")
+
+        def connect_device(dev_name):
+            dev_proxy = tango.DeviceProxy(dev_name)
+            dev_proxy.set_timeout_millis(int(self._read_timeout * 1000))
+            return dev_proxy
+
+        dev_proxies = self._cache.dev_proxies
+        dev_names = sorted({
+            config[1].rsplit("/", 1)[0] for config in attr_configs
+        } - set(dev_proxies))
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self._executor, connect_device, dev_name)
+              for dev_name in dev_names),
+            return_exceptions=True
+        )
+        for dev_name, dev_proxy in zip(dev_names, results):
+            if not isinstance(dev_proxy, BaseException):
+                dev_proxies[dev_name] = dev_proxy
+
+        def connect_attribute(sig, tango_id, attr_key, attr_type, options,
+                              kwargs):
+            p_handle = self._cache.handles.get(sig)
+            if p_handle is not None:
+                p_handle.reset()
+                return p_handle
+            return DAData(
+                tango_id,
+                attr_key,
+                attr_type=attr_type,
+                dev_proxy=dev_proxies[tango_id.rsplit("/", 1)[0]],
+                timeout=self._read_timeout,
+                options=options,
+                **kwargs
             )
 
-            f[group_name].create_dataset(
-                'data',
-                data=val
-            )
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self._executor, connect_attribute, *config)
+              for config in attr_configs),
+            return_exceptions=True
+        )
+        attr_fail = []
+        self._proxy_handles = []
+        for config, pxy_handle in zip(attr_configs, results):
+            sig, tango_id = config[0:2]
+            if isinstance(pxy_handle, (tango.DevFailed, KeyError)):
+                attr_fail.append(tango_id)
+                stale = self._cache.handles.pop(sig, None)
+                if stale is not None:
+                    stale.close()
+            elif isinstance(pxy_handle, BaseException):
+                raise pxy_handle
+            else:
+                self._cache.handles[sig] = pxy_handle
+                self._proxy_handles.append(pxy_handle)
+        return dev_proxies, attr_fail
 
-        else:
-            self.debug_stream("initialize poll and push attributes ...")
-            val, tstamp = p_handle.get_data()[0]
-
-            f[group_name].create_dataset(
-                "timestamp",
-                (1, 1),
-                maxshape=(None, 1),
-                dtype=float
-            )
-            f[f"{group_name}/timestamp"][0] = tstamp
+    def _attr_configs(self):
+        """
+        Settings of all configured attributes, as received from the run
+        configurator.
 
-            f[group_name].create_dataset(
-                "data",
-                p_handle.data_shape,
-                maxshape=p_handle.data_shape_max,
-                dtype=p_handle.data_type
+        Returns
+        -------
+        list of tuple
+            [(tango_id, attr_key, attr_type, options, kwargs), ...], kwargs
+            are passed on to DAData
+        """
+        attr_configs = []
+        for attr_type, var_attrs in (("run_attribute", self._var_run),
+                                     ("poll_attribute", self._var_poll),
+                                     ("push_attribute", self._var_push)):
+            for attr in var_attrs[1]:
+                tango_id = attr['value'][0] + "/" + attr['value'][1]
+                kwargs = {}
+                if attr_type == "push_attribute":
+                    kwargs = dict(
+                        size_buffer=self._size_buffer_stream,
+                        event_mode=self.event_mode,
+                        size_ring=int(self.push_buffer_size * 1024 ** 2),
+                        drain_period=self._poll_period,
+                        drain_control=self._drain_control()
+                    )
+                attr_configs.append(
+                    (tango_id, attr['name'], attr_type, attr_options(attr),
+                     kwargs)
+                )
+        return attr_configs
+
+    def _drain_control(self):
+        """
+        Returns
+        -------
+        dict or None
+            settings of the AdaptivePeriod of push attributes, None if their
+            drain period is the polling period
+        """
+        if not self.drain_adaptive:
+            return None
+        period_max = self.drain_period_max or self._poll_period
+        return dict(
+            period_min=min(self.drain_period_min, period_max),
+            period_max=period_max,
+            high_water=self.drain_high_water,
+            low_water=self.drain_low_water,
+        )
+
+    async def _connect_workers(self):
+        """
+        Shard all configured attributes across worker processes and let the
+        workers connect to them. The handles of this process only describe
+        the attributes, the connection cache is not used.
+
+        Returns
+        -------
+        attr_fail : list of str
+            attributes that could not be connected
+        """
+        attr_configs = [
+            (attr_key, tango_id, attr_type, options, kwargs)
+            for tango_id, attr_key, attr_type, options, kwargs
+            in self._attr_configs()
+        ]
+        settings = dict(
+            poll_period=self._poll_period,
+            read_timeout=self._read_timeout,
+            read_workers=self.read_workers,
+        )
+        self._workers = DAWorkerPool(
+            shard(attr_configs, self.worker_processes),
+            settings,
+            size_shm=int(self.worker_shm_size * 1024 ** 2),
+            name=f"{self._name_da}_worker"
+        )
+        loop = asyncio.get_running_loop()
+        self._proxy_handles, attr_fail = await loop.run_in_executor(
+            None, self._workers.connect
+        )
+        return attr_fail
+
+    async def _run_workers(self, t_start):
+        """
+        Record with worker processes. A pump thread hands their batches over
+        to the writer, the event loop only keeps the status up to date.
+        """
+        self._worker_stats = {}
+        self._pump_stop = threading.Event()
+        self._pump = threading.Thread(
+            target=self._pump_workers,
+            name=f"{self._name_da}_pump",
+            daemon=True
+        )
+        self._pump.start()
+        self._workers.start(t_start)
+
+        while True:
+            await asyncio.sleep(self._poll_period)
+            stats = list(self._worker_stats.values())
+            if not stats:
+                continue
+            self._cycle_duration = max(s["t_cycle"] for s in stats)
+            self._buffer_load = max(s["buffer_load"] for s in stats)
+            self._set_recording_status(
+                list(itertools.chain(*(s["error_dev"] for s in stats)))
             )
-            f[f"{group_name}/data"][0] = val
 
-        f[group_name].attrs['attribute_id'] = p_handle.attr_id
-        f[group_name].attrs['attribute_type'] = p_handle.attr_type
+    def _pump_workers(self):
+        while not self._pump_stop.is_set():
+            batch, stats = self._workers.get(timeout=0.1)
+            if stats:
+                self._worker_stats[stats["i_worker"]] = stats
+                self._record_worker_stats(batch, stats)
+            if batch:
+                self._writer.put(batch)
+
+    def _record_worker_stats(self, batch, stats):
+        telemetry = self._telemetry
+        telemetry.stages["cycle"].record(stats["t_cycle"])
+        telemetry.stages["queue_depth"].record(self._writer.queue_depth)
+        for attr_key, t_read in stats["latency"].items():
+            telemetry.attr(attr_key).read_latency.record(t_read)
+        for attr_key, counters in stats["events"].items():
+            telemetry.attr(attr_key).update_events(counters)
+        for attr_key in stats["errors"]:
+            telemetry.attr(attr_key).n_errors += 1
+        for attr_key, n_skipped in stats["skipped"].items():
+            attr_stats = telemetry.attr(attr_key)
+            # skipped values were received but aren't in the batch
+            attr_stats.n_received += n_skipped - attr_stats.n_skipped
+            attr_stats.n_skipped = n_skipped
+        for attr_key, t_new, _ in batch or []:
+            telemetry.attr(attr_key).n_received += len(t_new)
+
+    async def _stop_workers(self):
+        """
+        Stop the worker processes and hand all batches still in transit over
+        to the writer.
+        """
+        if self._workers is None:
+            return
+
+        def stop():
+            if self._pump is not None:
+                self._pump_stop.set()
+                self._pump.join()
+            for batch, _ in self._workers.stop():
+                if batch and self._writer is not None:
+                    self._writer.put(batch)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stop)
+        self._workers = None
+        self._pump = None
+
+    async def _stop_writer(self):
+        """
+        Let the writer thread store all pending batches and end it.
+        """
+        if self._writer is None:
+            return
+        if self._pending_puts:
+            await asyncio.wait(list(self._pending_puts))
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._writer.stop)
+        if self._writer.n_dropped:
+            self.warn_stream(f"dropped {self._writer.n_dropped} batches")
+        self._writer = None
+
+    def _write_batch(self, batch):
+        """
+        Store a batch of recorded data, called in the writer thread.
 
-    async def _store_data(self):
-        with h5py.File(self._file_name, 'a') as f:
-            self.debug_stream("dumping data ....")
-            n_buffer_max = 0
-            error_dev = []
+        Parameters
+        ----------
+        batch : list of tuple
+            [(attr_key, t_new, d_new), ...]
+        """
+        def append(attr_key, t_new, d_new):
+            t_append = time.perf_counter()
+            n_bytes = self._storage.append(
+                self._handles_by_key[attr_key], t_new, d_new
+            )
+            stats = self._telemetry.attr(attr_key)
+            stats.write_time.record(time.perf_counter() - t_append)
+            stats.n_bytes += n_bytes
+
+        t_batch = time.perf_counter()
+        tables = []
+        for attr_key, t_new, d_new in batch:
+            for stream in self._decimated.get(attr_key, ()):
+                t_bins, d_bins = stream.update(t_new, d_new)
+                if len(t_bins):
+                    self._storage.append(stream, t_bins, d_bins)
+            table = self._packed.get(attr_key)
+            if table is None:
+                append(attr_key, t_new, d_new)
+                continue
+            table.put(attr_key, t_new, d_new)
+            if table not in tables:
+                tables.append(table)
+        # one row per packed table and batch
+        for table in tables:
+            append(table.attr_key, *table.pop_row())
+        self._storage.flush()
+        self._telemetry.stages["write"].record(time.perf_counter() - t_batch)
+        if self._storage.rollover_due():
+            self._storage.rollover()
+
+    def _create_storage(self):
+        """
+        Returns
+        -------
+        StorageBackend
+            for the recording about to start, configured by the device
+            properties
+        """
+        def stream_attrs(p_handle):
+            if isinstance(p_handle, (DAPackedTable, DADecimatedStream)):
+                return p_handle.stream_attrs()
+            # counted since the start of the run
+            stats = self._telemetry.attr(p_handle.attr_key)
+            if p_handle.attr_type == "push_attribute":
+                return stats.event_counters()
+            change_filter = ChangeFilter.from_options(p_handle.options)
+            if change_filter is None:
+                return {}
+            return dict(change_filter.settings(), n_skipped=stats.n_skipped)
+
+        backend_options = {}
+        if self.storage_backend == "hdf5":
+            backend_options["swmr"] = self.swmr
+        return create_storage(
+            self.storage_backend,
+            self._file_path,
+            self._name_da,
+            self,
+            chunk_rows=self.chunk_rows,
+            compression=self.compression,
+            compression_level=self.compression_level,
+            shuffle=self.shuffle,
+            flush_interval=self._flush_interval,
+            flush_size=self._flush_size,
+            rollover_size=int(self.rollover_size * 1024 ** 2),
+            rollover_time=self.rollover_time,
+            poll_period=self._poll_period,
+            file_attrs={
+                'name_experiment': self._file_path.split("/")[-2],
+                'poll_period': self._poll_period,
+                'size_buffer_stream': self._size_buffer_stream,
+            },
+            stream_attrs=stream_attrs,
+            **backend_options
+        )
+
+    def _pack_scalars(self):
+        """
+        Collect scalar poll attributes into packed tables, one per poll
+        period, and per worker process in worker mode: a row then only holds
+        values that arrive in the same batch.
 
-            for p_handle in self._proxy_handles:
-                data_new = p_handle.get_data()
-                n_new = len(data_new)
-                if p_handle.last_error is not None:
-                    self.debug_stream(f"{p_handle.last_error}")
-                if n_new == 0:
-                    error_dev.append(p_handle.attr_key)
-                    self.debug_stream("no data captured")
-                    continue
-                n_buffer_max = max(n_new, n_buffer_max)
+        Returns
+        -------
+        list
+            handles to store, packed attributes replaced by their tables
+        """
+        self._packed = {}
+        members = collections.defaultdict(list)
+        handles = []
+        for p_handle in self._proxy_handles:
+            if self._is_packed(p_handle):
+                i_worker = getattr(p_handle, "i_worker", 0)
+                poll_period = self._poll_period_of(p_handle)
+                members[(poll_period, i_worker)].append(p_handle)
+            else:
+                handles.append(p_handle)
+
+        for (poll_period, i_worker), columns in members.items():
+            attr_key = f"scalars_{poll_period:g}s"
+            if self._workers is not None:
+                attr_key += f"_{i_worker}"
+            table = DAPackedTable(attr_key, columns, poll_period)
+            handles.append(table)
+            for p_handle in columns:
+                self._packed[p_handle.attr_key] = table
+        return handles
+
+    def _decimate(self):
+        """
+        Returns
+        -------
+        dict
+            {attr_key: [DADecimatedStream, ...]} of all attributes with
+            decimated streams
+        """
+        decimated = {}
+        for p_handle in self._proxy_handles:
+            widths = self._decimation_widths(p_handle)
+            if widths:
+                decimated[p_handle.attr_key] = [
+                    DADecimatedStream(p_handle, width) for width in widths
+                ]
+        return decimated
+
+    def _decimation_widths(self, p_handle):
+        if p_handle.attr_type == "push_attribute":
+            widths = p_handle.options.get("decimate", self.decimation_levels)
+        elif p_handle.attr_type == "poll_attribute":
+            widths = p_handle.options.get("decimate", [])
+        else:
+            return []
+        if p_handle.data_format not in ("SCALAR", "SPECTRUM"):
+            return []
+        if p_handle.store_dtype.kind not in "biuf":
+            return []
+        return [float(width) for width in widths or []]
+
+    def _is_packed(self, p_handle):
+        if p_handle.attr_type != "poll_attribute":
+            return False
+        if p_handle.data_format != "SCALAR":
+            return False
+        if p_handle.store_dtype.kind not in "biuf":
+            return False
+        if ChangeFilter.from_options(p_handle.options) is not None:
+            # a table row needs a value of every column
+            return False
+        return bool(p_handle.options.get("pack", self.pack_scalars))
+
+    async def _close_storage(self):
+        """
+        Close the storage of the current recording, e.g. the hdf5 file and
+        the master file, once it has been opened completely.
+        """
+        if self._storage_open is not None:
+            await asyncio.wait([self._storage_open])
+            self._storage_open = None
+        storage = self._storage
+        if storage is None:
+            return
+
+        def close():
+            # bins that are still open when the recording stops
+            for streams in self._decimated.values():
+                for stream in streams:
+                    t_bins, d_bins = stream.finish()
+                    if len(t_bins):
+                        storage.append(stream, t_bins, d_bins)
+            storage.close()
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, close)
+        finally:
+            self._decimated = {}
+            self._storage = None
 
-                t_new = np.zeros((n_new, 1), dtype=float)
-                d_new = np.zeros(
-                    (n_new,) + p_handle.data_shape[1::],
-                    dtype=p_handle.data_type
-                )
+    def _poll_period_of(self, p_handle):
+        """
+        Poll period of an attribute, its config entry may override the
+        polling period of the data aggregator.
+        """
+        return float(p_handle.options.get("poll_period", self._poll_period))
+
+    async def _read_data(self, reader):
+        """
+        Fetch newest data of a single reader in the read thread pool.
 
-                for i, d in zip(range(n_new), data_new):
-                    t_new[i] = d[1]
-                    d_new[i] = d[0]
+        Parameters
+        ----------
+        reader : DAData or DAGroup
 
-                group_name = f"data_recorded/{p_handle.attr_key}"
-                dset = f[f"{group_name}/timestamp"]
-                dset.resize(dset.shape[0]+n_new, axis=0)
-                dset[-n_new::] = t_new
+        Returns
+        -------
+        data_new : list of tuple
+            [(p_handle_1, t_new_1, d_new_1), ...], empty arrays for all
+            attributes of the reader if it did not complete within the read
+            timeout
+        """
+        handles = reader.handles if isinstance(reader, DAGroup) else [reader]
 
-                dset = f[f"{group_name}/data"]
-                dset.resize(dset.shape[0]+n_new, axis=0)
-                dset[-n_new::] = d_new
+        def get_batch():
+            t_read = time.perf_counter()
+            batches = reader.get_batch()
+            return batches, time.perf_counter() - t_read
 
-            self._n_buffer_current = n_buffer_max
-            status_string = "Recording ....."
-            if error_dev:
-                status_string = f"Recording. Problem occurred: {str(error_dev)}"
-            self.set_status(status_string)
+        loop = asyncio.get_running_loop()
+        try:
+            batches, t_read = await asyncio.wait_for(
+                loop.run_in_executor(self._executor, get_batch),
+                timeout=self._read_timeout
+            )
+        except asyncio.TimeoutError:
+            for p_handle in handles:
+                p_handle.last_error = f"no reply within {self._read_timeout} s"
+            batches = [p_handle._to_array([], []) for p_handle in handles]
+            t_read = self._read_timeout
+        for p_handle in handles:
+            self._telemetry.attr(p_handle.attr_key).read_latency.record(t_read)
+
+        if not isinstance(reader, DAGroup):
+            batches = [batches]
+        return [
+            (p_handle, t_new, d_new)
+            for p_handle, (t_new, d_new) in zip(handles, batches)
+        ]
+
+    async def _store_data(self, readers):
+        # issue all reads of this cycle at once, the cycle then takes about
+        # as long as the slowest read instead of the sum of all reads
+        data_all = await asyncio.gather(
+            *(self._read_data(reader) for reader in readers)
+        )
+
+        self.debug_stream("dumping data ....")
+        batch = []
+
+        for p_handle, t_new, d_new in itertools.chain(*data_all):
+            n_new = len(t_new)
+            stats = self._telemetry.attr(p_handle.attr_key)
+            stats.n_received += n_new
+            if p_handle.attr_type == "push_attribute":
+                stats.update_events(p_handle.event_counters())
+            if p_handle.last_error is not None:
+                self.debug_stream(f"{p_handle.last_error}")
+            if p_handle.attr_type == "push_attribute":
+                self._loads[p_handle.attr_key] = n_new / p_handle.size_buffer
+            if n_new == 0:
+                if p_handle.last_error is not None:
+                    stats.n_errors += 1
+                self._no_data[p_handle.attr_key] = True
+                self.debug_stream("no data captured")
+                continue
+            self._no_data.pop(p_handle.attr_key, None)
+            if p_handle.change_filter is not None:
+                t_new, d_new = p_handle.change_filter.apply(t_new, d_new)
+                stats.n_skipped = p_handle.change_filter.n_skipped
+                if len(t_new) == 0:
+                    continue
+            batch.append((p_handle.attr_key, t_new, d_new))
+
+        # hand over to the writer thread, a slow disk must not delay the
+        # next acquisition cycle
+        if batch:
+            loop = asyncio.get_running_loop()
+            put = loop.run_in_executor(None, self._writer.put, batch)
+            # a put in progress when the run task is cancelled still hands
+            # its batch over, see _stop_writer()
+            self._pending_puts.add(put)
+            put.add_done_callback(self._pending_puts.discard)
+            await asyncio.shield(put)
+
+        # of all attributes as of their last read, not only the due ones
+        self._buffer_load = max(self._loads.values(), default=0.0)
+        self._set_recording_status(list(self._no_data))
+
+    def _telemetry_column(self, metric):
+        """
+        Returns
+        -------
+        list
+            metric(AttributeStats) per attribute, in the order of
+            telemetry_keys
+        """
+        return [metric(stats) for stats in list(self._telemetry.attrs.values())]
+
+    def _set_recording_status(self, error_dev):
+        status_string = "Recording ....."
+        if error_dev:
+            status_string = f"Recording. Problem occurred: {str(error_dev)}"
+        if self._writer.last_error is not None:
+            status_string += f"\nWriter: {self._writer.last_error}"
+        self.set_status(status_string)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,16 @@
+import asyncio
 import os
 import json
 import collections
 import time
 
+import numpy as np
 import tango
 import tango.server as ts
 
+from tango_da.placement import AUTO, assign, capacity_from_run, estimate_load
+from tango_da.telemetry import merge_summaries
+
 
 # ------------------------------------------------------------------
 # helper methods
@@ -31,6 +36,7 @@ class RunConfigurator(ts.Device):
     _var_poll = _v_init
     _var_push = _v_init
     _data_aggregators = {}
+    _da_proxies = {}
     _group_da = tango.Group("data_aggregators")
     _config_file = "./attr_list.json"
 
@@ -41,6 +47,10 @@ class RunConfigurator(ts.Device):
 
     _poll_period = 3.0
     _time_start = 0.0
+    _da_report = {}
+    _da_load = {}
+    _da_n_attrs = {}
+    _da_capacity = {}
 
     # ------------------------------------------------------------------
     # class and device properties
@@ -50,6 +60,16 @@ class RunConfigurator(ts.Device):
         dtype=tango.DevVarStringArray,
         mandatory=True
     )
+    # all data aggregators start recording 'start_delay' seconds after
+    # StartRecording, on the same tick
+    start_delay = ts.device_property(dtype=float, default_value=5.0)
+    # timeout for commands sent to the data aggregators
+    da_timeout = ts.device_property(dtype=float, default_value=10.0)
+    # data aggregators for attributes with data aggregator "auto"
+    data_aggregator_pool = ts.device_property(
+        dtype=tango.DevVarStringArray,
+        default_value=[]
+    )
 
     # ------------------------------------------------------------------
     # Init
@@ -165,9 +185,58 @@ class RunConfigurator(ts.Device):
     async def run_duration(self):
         t_out = 0.0
         if self.get_state() == tango.DevState.RUNNING:
-            t_out = (time.time() - self._time_start)
+            t_out = max(time.time() - self._time_start, 0.0)
         return t_out
 
+    @ts.attribute(
+        label="Aggregator report",
+        doc="result of the last command per data aggregator",
+        dtype=(str,),
+        max_dim_x=1024,
+    )
+    async def aggregator_report(self):
+        return [f"{da}: {result}" for da, result in self._da_report.items()]
+
+    @ts.attribute(
+        label="Aggregator load",
+        doc="estimated data rate per data aggregator of the loaded "
+            "configuration",
+        dtype=(str,),
+        max_dim_x=1024,
+    )
+    async def aggregator_load(self):
+        return [
+            f"{da}: {load / 1024**2:.3f} MB/s, "
+            f"{self._da_n_attrs.get(da, 0)} attributes, "
+            f"capacity {self._da_capacity.get(da, 1.0):.2f}"
+            for da, load in self._da_load.items()
+        ]
+
+    @ts.attribute(
+        label="Aggregator telemetry",
+        doc="json summary of the telemetry of all data aggregators, stage "
+            "histograms are merged, times in seconds",
+        dtype=str,
+    )
+    async def aggregator_telemetry(self):
+        def read_telemetry(dev_da):
+            return json.loads(dev_da.read_attribute("telemetry").value)
+
+        loop = asyncio.get_running_loop()
+        da_names = list(self._da_proxies)
+        results = await asyncio.gather(
+            *(loop.run_in_executor(None, read_telemetry, self._da_proxies[da])
+              for da in da_names),
+            return_exceptions=True
+        )
+        summaries = {}
+        for da, result in zip(da_names, results):
+            if isinstance(result, BaseException):
+                self.debug_stream(f"telemetry {da}: {result}")
+                continue
+            summaries[da] = result
+        return json.dumps(merge_summaries(summaries))
+
     # ------------------------------------------------------------------
     # commands
     # ------------------------------------------------------------------
@@ -199,22 +268,20 @@ class RunConfigurator(ts.Device):
 
         Notes
         -----
-        Will use groups as soon as useful documentation is available
+        The command is sent to all data aggregators at once. They all start
+        on the same tick, 'start_delay' seconds from now.
         """
         self.debug_stream('start recording data')
 
-        for dev_da in self._data_aggregators.values():
-            try:
-                self.debug_stream(f"Try to start device {dev_da.dev_name()}")
-                dev_da.Start()
-            except tango.DevError as err:
-                self.warn_stream(f"{err}")
-                self.set_state(tango.DevState.FAULT)
-                pass
+        self._time_start = time.time() + self.start_delay
+        n_fail, n_all = await self._group_command("StartAt", self._time_start)
 
-        self.set_state(tango.DevState.RUNNING)
-        self._time_start = time.time()
-        self.set_status("start single measurement")
+        # aggregators that failed to configure aren't in the group
+        if n_all and n_fail == n_all:
+            self.set_state(tango.DevState.FAULT)
+        else:
+            self.set_state(tango.DevState.RUNNING)
+        self.set_status(f"start single measurement, {n_fail} failed")
 
     @ts.command()
     async def StopRecording(self):
@@ -223,20 +290,15 @@ class RunConfigurator(ts.Device):
 
         Notes
         -----
-        Will use groups as soon as useful documentation is available
+        The command is sent to all data aggregators at once.
         """
         self.debug_stream('stop recording data')
 
-        for dev_da in self._data_aggregators.values():
-            try:
-                dev_da.Stop()
-            except tango.DevFailed as err:
-                self.warn_stream(f"{err}")
-                self.set_state(tango.DevState.FAULT)
-                pass
+        await self._measure_capacity()
+        n_fail, _ = await self._group_command("Stop")
 
         self.set_state(tango.DevState.ON)
-        self.set_status("stop single measurement")
+        self.set_status(f"stop single measurement, {n_fail} failed")
 
     # ------------------------------------------------------------------
     # internal methods
@@ -251,15 +313,21 @@ class RunConfigurator(ts.Device):
             attrs = data_config[attr_type]
             d_pipe = collections.OrderedDict()
             for attr in attrs:
-                d_pipe[attr[0]] = attr[1::]
-                name_da = attr[3]
-                if name_da not in self._data_aggregators:
-                    self._data_aggregators[name_da] = None
+                d_pipe[attr[0]] = attr[1:4]
+                if len(attr) > 4:
+                    # optional per-attribute settings, pipes carry strings
+                    d_pipe[attr[0]].append(json.dumps(attr[4]))
             return d_pipe
 
         self._var_run = "Attributes", read_config_file("attributes_run")
         self._var_poll = "Attributes", read_config_file("attributes_poll")
         self._var_push = "Attributes", read_config_file("attributes_push")
+        await self._place_attributes()
+
+        for var in (self._var_run, self._var_poll, self._var_push):
+            for value in var[1].values():
+                if value[2] not in self._data_aggregators:
+                    self._data_aggregators[value[2]] = None
         self.set_state(tango.DevState.ON)
         self.set_status(f"loaded config file: {self._config_file}")
 
@@ -288,10 +356,10 @@ class RunConfigurator(ts.Device):
                     data_send[key] = data_dic[1][key]
             return data_send
 
-        for da in self._data_aggregators:
-            self._group_da.add(da)
-            dev_da = tango.DeviceProxy(da)
-            self._data_aggregators[da] = dev_da
+        def configure_da(da, dev_da):
+            if dev_da is None:
+                dev_da = tango.DeviceProxy(da)
+                dev_da.set_timeout_millis(int(self.da_timeout * 1000))
             dev_da.attrs_run = (
                 "Attributes",
                 filter_da_data(da, self._var_run)
@@ -306,10 +374,206 @@ class RunConfigurator(ts.Device):
             )
             dev_da.file_path = self._dir_run
             dev_da.polling_period = self._poll_period
+            return dev_da
+
+        # configure all data aggregators concurrently, proxies are kept
+        # from previous runs
+        loop = asyncio.get_running_loop()
+        da_names = list(self._data_aggregators)
+        self._da_proxies = {
+            da: dev_da for da, dev_da in self._da_proxies.items()
+            if da in self._data_aggregators
+        }
+        results = await asyncio.gather(
+            *(loop.run_in_executor(
+                None, configure_da, da, self._da_proxies.get(da)
+            ) for da in da_names),
+            return_exceptions=True
+        )
+
+        self._group_da.remove_all()
+        self._da_report = {}
+        for da, dev_da in zip(da_names, results):
+            if isinstance(dev_da, tango.DevFailed):
+                self.warn_stream(f"{da}: {dev_da}")
+                self._da_report[da] = f"failed, {dev_da.args[0].desc}"
+                self._da_proxies.pop(da, None)
+                continue
+            elif isinstance(dev_da, BaseException):
+                raise dev_da
+            self._da_proxies[da] = dev_da
+            self._data_aggregators[da] = dev_da
+            self._group_da.add(da)
+            self._da_report[da] = "configured"
 
         self.set_state(tango.DevState.ON)
         da_all = self._group_da.get_device_list()
         self.set_status(f"- configured data aggregators {str(da_all)}\n")
 
+    async def _place_attributes(self):
+        """
+        Assign attributes with data aggregator "auto" to the data aggregator
+        pool, balancing the estimated data rate.
+
+        The data rate of every attribute is estimated from the size of a
+        single value and its rate: 1 / poll period for poll attributes, the
+        option 'rate' for push attributes. Pinned attributes count towards
+        the load of their data aggregator. The relative capacities measured
+        during the previous run are taken into account.
+        """
+        entries = {}
+        for var, attr_type in ((self._var_run, "run"),
+                               (self._var_poll, "poll"),
+                               (self._var_push, "push")):
+            for key, value in var[1].items():
+                entries[(attr_type, key)] = value
+        if not any(v[2] == AUTO for v in entries.values()):
+            self._da_load, self._da_n_attrs = {}, {}
+            return
+
+        def rate_of(attr_type, value):
+            options = json.loads(value[3]) if len(value) > 3 else {}
+            if attr_type == "poll":
+                return 1.0 / float(options.get("poll_period", self._poll_period))
+            elif attr_type == "push":
+                return float(options.get("rate", 1.0 / self._poll_period))
+            return 0.0
+
+        sizes = await self._probe_sizes(
+            {k: f"{v[0]}/{v[1]}" for k, v in entries.items()}
+        )
+        loads = {
+            k: estimate_load(sizes[k], rate_of(k[0], v))
+            for k, v in entries.items()
+        }
+        pinned = {k: v[2] for k, v in entries.items() if v[2] != AUTO}
+        pool = list(self.data_aggregator_pool) or sorted(set(pinned.values()))
+
+        placement, self._da_load = assign(
+            loads, pool, pinned, self._da_capacity
+        )
+        self._da_n_attrs = collections.Counter(placement.values())
+        for k, value in entries.items():
+            value[2] = placement[k]
+        for da, load in self._da_load.items():
+            self.info_stream(f"{da}: estimated load {load / 1024**2:.3f} MB/s")
+
+    async def _probe_sizes(self, attr_ids):
+        """
+        Read every attribute once to find the size of a single value.
+
+        Parameters
+        ----------
+        attr_ids : dict
+            {key: "<device>/<attribute>"}
+
+        Returns
+        -------
+        dict
+            {key: number of bytes}, 0 if the attribute couldn't be read
+        """
+        by_device = collections.defaultdict(list)
+        for key, attr_id in attr_ids.items():
+            dev_name, attr_name = attr_id.rsplit("/", 1)
+            by_device[dev_name].append((key, attr_name))
+
+        def probe(dev_name, items):
+            dev_proxy = tango.DeviceProxy(dev_name)
+            dev_proxy.set_timeout_millis(int(self.da_timeout * 1000))
+            d_attrs = dev_proxy.read_attributes([a for _, a in items])
+            sizes = {}
+            for (key, _), d_attr in zip(items, d_attrs):
+                if d_attr.has_failed or d_attr.value is None:
+                    sizes[key] = 0
+                elif isinstance(d_attr.value, str):
+                    sizes[key] = len(d_attr.value)
+                else:
+                    sizes[key] = np.asarray(d_attr.value).nbytes
+            return sizes
+
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(None, probe, dev_name, items)
+              for dev_name, items in by_device.items()),
+            return_exceptions=True
+        )
+
+        sizes = {key: 0 for key in attr_ids}
+        for dev_name, result in zip(by_device, results):
+            if isinstance(result, tango.DevFailed):
+                self.warn_stream(f"probe {dev_name}: {result.args[0].desc}")
+                continue
+            elif isinstance(result, BaseException):
+                raise result
+            sizes.update(result)
+        return sizes
+
+    async def _measure_capacity(self):
+        """
+        Derive the relative capacity of the data aggregators from their
+        utilization during the current run. The next automatic placement
+        uses it to rebalance.
+        """
+        if not self._da_load:
+            return
+
+        def utilization(dev_da):
+            cycle, buffer, period = dev_da.read_attributes(
+                ["cycle_duration", "buffer_load", "polling_period"]
+            )
+            u_cycle = cycle.value / 1000.0 / max(period.value, 1e-6)
+            return max(u_cycle, buffer.value / 100.0)
+
+        loop = asyncio.get_running_loop()
+        da_names = [da for da in self._da_load if da in self._da_proxies]
+        results = await asyncio.gather(
+            *(loop.run_in_executor(None, utilization, self._da_proxies[da])
+              for da in da_names),
+            return_exceptions=True
+        )
+        measured = {}
+        for da, result in zip(da_names, results):
+            if isinstance(result, BaseException):
+                self.warn_stream(f"measure {da}: {result}")
+                continue
+            measured[da] = result
+        self._da_capacity = capacity_from_run(self._da_load, measured)
+
+    async def _group_command(self, cmd_name, param=None):
+        """
+        Send a command to all data aggregators at once and record the result
+        of each one in the aggregator report.
+
+        Returns
+        -------
+        n_fail : int
+            number of data aggregators the command failed on
+        n_all : int
+            number of data aggregators the command was sent to
+        """
+        def command_inout():
+            self._group_da.set_timeout_millis(int(self.da_timeout * 1000))
+            if param is None:
+                return self._group_da.command_inout(cmd_name)
+            return self._group_da.command_inout(cmd_name, param)
+
+        loop = asyncio.get_running_loop()
+        replies = await loop.run_in_executor(None, command_inout)
+
+        # tango device names are case insensitive
+        da_names = {da.lower(): da for da in self._data_aggregators}
+        n_fail = 0
+        for reply in replies:
+            da = da_names.get(reply.dev_name().lower(), reply.dev_name())
+            if reply.has_failed():
+                n_fail += 1
+                err = reply.get_err_stack()[0].desc
+                self.warn_stream(f"{cmd_name} {da}: {err}")
+                self._da_report[da] = f"{cmd_name} failed, {err}"
+            else:
+                self._da_report[da] = f"{cmd_name} ok"
+        return n_fail, len(replies)
+
+
 if __name__ == "__main__":
-    RunConfigurator.run_server()
\ No newline at end of file
+    RunConfigurator.run_server()
@@ -0,0 +1,387 @@
+"""
+Throughput benchmark of the recording pipeline, against simulated devices.
+
+Simulator devices run in a process of their own (tango's test context, no
+database needed). The pipeline of a data aggregator reads them, in threads
+or in worker processes, and stores the data through its writer thread and
+storage backend. Every case reports samples and bytes stored per second,
+the duration of an acquisition cycle, and memory.
+
+    python -m tango_da.benchmark --n-attrs 10 100 --sizes 1 1000 --duration 10
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import resource
+import tempfile
+import time
+
+import tango
+from tango.test_context import MultiDeviceTestContext
+
+from .DataAggregator import DAData, DAGroup
+from .schedule import Schedule
+from .simulator import Simulator
+from .storage import STORAGE_BACKENDS, create_storage
+from .telemetry import Histogram
+from .worker import DAWorkerPool, _read_cycle, shard
+from .writer import DAWriter
+
+
+logger = logging.getLogger(__name__)
+
+# columns of the report, see run_case()
+REPORT_FIELDS = ("n_attrs", "size", "attr_type", "workers", "samples_s",
+                 "mb_s", "cycle_p50_ms", "cycle_p99_ms", "write_p99_ms",
+                 "n_missed", "n_errors", "n_lost", "n_near_misses", "rss_mb",
+                 "peak_rss_mb")
+
+
+class _Logger:
+    # stands in for the device in StorageBackend
+    def debug_stream(self, msg):
+        logger.debug(msg)
+
+    def info_stream(self, msg):
+        logger.info(msg)
+
+    def warn_stream(self, msg):
+        logger.warning(msg)
+
+
+def simulator_specs(n_attrs, size, rate=0.0, dtype="float64", latency=0.0,
+                    error_rate=0.0):
+    """
+    Returns
+    -------
+    list of dict
+        specs of n_attrs simulated attributes, scalars if size is 1, spectra
+        of size values otherwise, see simulator.attribute_spec()
+    """
+    spec = dict(dtype=dtype, rate=rate, latency=latency,
+                error_rate=error_rate)
+    if size > 1:
+        spec.update(format="SPECTRUM", shape=[size])
+    return [dict(spec, name=f"attr_{i}") for i in range(n_attrs)]
+
+
+def run_case(n_attrs, size, attr_type="poll_attribute", duration=10.0,
+             poll_period=0.1, rate=10.0, n_devices=1, workers=0,
+             backend="hdf5", compression="", path=None, latency=0.0,
+             error_rate=0.0, read_timeout=3.0, drain_adaptive=True):
+    """
+    Record simulated attributes for duration seconds.
+
+    Parameters
+    ----------
+    n_attrs : int
+        number of attributes, spread across n_devices simulator devices
+    size : int
+        values per attribute, 1 for scalars
+    attr_type : str
+        'poll_attribute' or 'push_attribute'
+    poll_period : float
+        seconds between two polls, and at most between two drains of push
+        attributes
+    rate : float
+        change events per second of push attributes
+    workers : int
+        number of worker processes, 0 reads in threads
+    backend, compression
+        storage backend and compression filter
+    path : str, optional
+        directory of the recorded files, a temporary directory if not given
+    latency, error_rate
+        of the simulated attributes
+    drain_adaptive : bool
+        adapt the drain period of push attributes to their buffer load,
+        see schedule.AdaptivePeriod
+
+    Returns
+    -------
+    dict
+        REPORT_FIELDS of the case
+    """
+    specs = simulator_specs(
+        n_attrs, size, rate=rate if attr_type == "push_attribute" else 0.0,
+        latency=latency, error_rate=error_rate
+    )
+    dev_names = [f"sim/bench/{i}" for i in range(n_devices)]
+    devices_info = [{
+        "class": Simulator,
+        "devices": [
+            {"name": dev_name,
+             "properties": {"attributes": json.dumps(specs[i::n_devices])}}
+            for i, dev_name in enumerate(dev_names)
+        ],
+    }]
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            MultiDeviceTestContext(devices_info, process=True) as context:
+        access = [context.get_device_access(name) for name in dev_names]
+        configs = []
+        for i, spec in enumerate(specs):
+            kwargs = {}
+            if attr_type == "push_attribute":
+                kwargs = dict(size_buffer=max(int(4 * rate * poll_period), 16),
+                              drain_period=poll_period)
+                if drain_adaptive:
+                    kwargs["drain_control"] = dict(
+                        period_min=min(0.01, poll_period),
+                        period_max=poll_period
+                    )
+            configs.append((spec["name"], f"{access[i % n_devices]}/"
+                            f"{spec['name']}", attr_type, {}, kwargs))
+
+        storage = create_storage(backend, path or tmp_dir, "bench", _Logger(),
+                                 compression=compression,
+                                 poll_period=poll_period)
+        result = _Recording(storage, configs, poll_period, read_timeout)
+        if workers > 0:
+            result.run_workers(workers, duration, access)
+        else:
+            result.run_threads(duration, access)
+
+    report = result.report()
+    report.update(n_attrs=n_attrs, size=size, attr_type=attr_type,
+                  workers=workers)
+    return report
+
+
+def run_matrix(n_attrs_list, sizes, **kwargs):
+    """
+    Returns
+    -------
+    list of dict
+        run_case() for every combination of number of attributes and size
+    """
+    reports = []
+    for n_attrs in n_attrs_list:
+        for size in sizes:
+            report = run_case(n_attrs, size, **kwargs)
+            logger.info(json.dumps(report))
+            reports.append(report)
+    return reports
+
+
+class _Recording:
+    """
+    The pipeline of a data aggregator: read cycles on a schedule, a writer
+    thread and a storage backend.
+    """
+    def __init__(self, storage, configs, poll_period, read_timeout):
+        self.storage = storage
+        self.configs = configs
+        self.poll_period = poll_period
+        self.read_timeout = read_timeout
+        self.cycle = Histogram()
+        self.write = Histogram()
+        self.n_rows = 0
+        self.n_bytes = 0
+        self.n_missed = 0
+        self.n_errors = 0
+        self.n_pushed = 0
+        self.n_near_misses = {}
+        self.t_record = 0.0
+        self._handles_by_key = {}
+
+    def run_threads(self, duration, access):
+        dev_proxies = {}
+        handles = []
+        for attr_key, tango_id, attr_type, options, kwargs in self.configs:
+            dev_name = tango_id.rsplit("/", 1)[0]
+            if dev_name not in dev_proxies:
+                dev_proxies[dev_name] = tango.DeviceProxy(dev_name)
+            handles.append(DAData(tango_id, attr_key, attr_type=attr_type,
+                                  dev_proxy=dev_proxies[dev_name],
+                                  timeout=self.read_timeout,
+                                  options=options, **kwargs))
+        writer = self._start(handles, access)
+
+        schedule = Schedule(time.time())
+        for dev_name, dev_proxy in dev_proxies.items():
+            polled = [p for p in handles if p.attr_type == "poll_attribute"
+                      and p.dev_name == dev_name]
+            if polled:
+                schedule.add(DAGroup(dev_proxy, polled), self.poll_period)
+        for p_handle in handles:
+            if p_handle.attr_type == "push_attribute":
+                schedule.add(p_handle,
+                             p_handle.drain_period or self.poll_period)
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+        t_stop = schedule.t_start + duration
+        try:
+            while time.time() < t_stop:
+                time.sleep(max(schedule.next_deadline() - time.time(), 0.0))
+                t_cycle = time.time()
+                readers = schedule.pop_due(t_cycle)
+                batch, _, error_dev, _ = _read_cycle(
+                    executor, readers, self.read_timeout, DAGroup
+                )
+                self.cycle.record(time.time() - t_cycle)
+                for reader in readers:
+                    if getattr(reader, "drain", None) is not None:
+                        schedule.set_period(reader, reader.drain.period)
+                self.n_errors += sum(
+                    1 for p in handles
+                    if p.attr_key in error_dev and p.last_error is not None
+                )
+                if batch:
+                    writer.put(batch)
+            # events pushed since the last drain
+            self._stop_events(access)
+            pushed = [p for p in handles if p.attr_type == "push_attribute"]
+            batch, _, _, _ = _read_cycle(executor, pushed, self.read_timeout,
+                                         DAGroup)
+            if batch:
+                writer.put(batch)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.n_missed = schedule.n_missed
+            self.n_near_misses = {
+                p.attr_key: p.n_near_misses for p in handles
+            }
+            self._stop(writer, access, schedule.t_start)
+            for p_handle in handles:
+                p_handle.close()
+
+    def run_workers(self, workers, duration, access):
+        pool = DAWorkerPool(
+            shard(self.configs, workers),
+            dict(poll_period=self.poll_period, read_timeout=self.read_timeout,
+                 read_workers=8),
+            size_shm=64 * 1024 ** 2, name="bench_worker"
+        )
+        handles, _ = pool.connect()
+        writer = self._start(handles, access)
+
+        t_start = time.time()
+        pool.start(t_start)
+        try:
+            while time.time() < t_start + duration:
+                batch, stats = pool.get(timeout=0.1)
+                if stats:
+                    self.cycle.record(stats["t_cycle"])
+                    self.n_errors += len(stats["errors"])
+                    self.n_near_misses.update({
+                        attr_key: counters["n_near_misses"]
+                        for attr_key, counters in stats["events"].items()
+                    })
+                if batch:
+                    writer.put(batch)
+        finally:
+            for batch, _ in pool.stop():
+                if batch:
+                    writer.put(batch)
+            self.n_missed = sum(pool.n_missed.values())
+            self._stop(writer, access, t_start)
+
+    def report(self):
+        t_record = max(self.t_record, 1e-9)
+        rss_mb = 0.0
+        try:
+            with open("/proc/self/statm") as f:
+                n_pages = int(f.read().split()[1])
+            rss_mb = n_pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+        except (OSError, ValueError):
+            pass
+        return dict(
+            samples_s=self.n_rows / t_record,
+            mb_s=self.n_bytes / t_record / 1024 ** 2,
+            cycle_p50_ms=self.cycle.percentile(50) * 1000.0,
+            cycle_p99_ms=self.cycle.percentile(99) * 1000.0,
+            write_p99_ms=self.write.percentile(99) * 1000.0,
+            n_missed=self.n_missed,
+            n_errors=self.n_errors,
+            # events pushed by the simulators but not stored, in worker mode
+            # including the events in flight when the recording stopped
+            n_lost=max(self.n_pushed - self.n_rows, 0),
+            n_near_misses=sum(self.n_near_misses.values()),
+            rss_mb=rss_mb,
+            # of this process, since it started
+            peak_rss_mb=resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024,
+        )
+
+    def _start(self, handles, access):
+        self.storage.open_run(handles, t_start=time.time())
+        self._handles_by_key = {p.attr_key: p for p in handles}
+        writer = DAWriter(self._write_batch, name="bench_writer")
+        writer.start()
+        for dev_name in access:
+            tango.DeviceProxy(dev_name).StartEvents()
+        return writer
+
+    def _stop_events(self, access):
+        if self.n_pushed:
+            return
+        for dev_name in access:
+            dev_proxy = tango.DeviceProxy(dev_name)
+            dev_proxy.StopEvents()
+            self.n_pushed += dev_proxy.n_events
+
+    def _stop(self, writer, access, t_start):
+        self._stop_events(access)
+        self.t_record = time.time() - t_start
+        writer.stop()
+        self.storage.close()
+
+    def _write_batch(self, batch):
+        t_write = time.perf_counter()
+        for attr_key, t_new, d_new in batch:
+            self.n_bytes += self.storage.append(
+                self._handles_by_key[attr_key], t_new, d_new
+            )
+            self.n_rows += len(t_new)
+        self.storage.flush()
+        self.write.record(time.perf_counter() - t_write)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m tango_da.benchmark",
+        description="Throughput benchmark against simulated devices"
+    )
+    parser.add_argument("--n-attrs", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 1000])
+    parser.add_argument("--attr-type", default="poll_attribute",
+                        choices=("poll_attribute", "push_attribute"))
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--poll-period", type=float, default=0.1)
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="events per second of push attributes")
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--backend", default="hdf5", choices=STORAGE_BACKENDS)
+    parser.add_argument("--compression", default="")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--fixed-drain", action="store_true",
+                        help="drain push attributes once per poll period")
+    parser.add_argument("--json", action="store_true",
+                        help="print the reports as json")
+    args = parser.parse_args(argv)
+
+    reports = run_matrix(
+        args.n_attrs, args.sizes, attr_type=args.attr_type,
+        duration=args.duration, poll_period=args.poll_period, rate=args.rate,
+        n_devices=args.devices, workers=args.workers, backend=args.backend,
+        compression=args.compression, latency=args.latency,
+        error_rate=args.error_rate, drain_adaptive=not args.fixed_drain
+    )
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    print(" ".join(f"{name:>12}" for name in REPORT_FIELDS))
+    for report in reports:
+        print(" ".join(
+            f"{report[name]:>12.4g}" if isinstance(report[name], float)
+            else f"{str(report[name]):>12}"
+            for name in REPORT_FIELDS
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import math
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Preallocated buffer for timestamped values of fixed shape and dtype.
+
+    Values are written one at a time, e.g. from an event callback, and
+    drained all at once. Once the buffer is full, the oldest values are
+    overwritten and counted in n_overwritten.
+
+    Parameters
+    ----------
+    capacity : int
+        number of values the buffer can hold
+    shape : tuple
+        shape of a single value
+    dtype : numpy.dtype
+    """
+    def __init__(self, capacity, shape=(), dtype=float):
+        self.capacity = max(int(capacity), 1)
+        self._timestamp = np.zeros(self.capacity, dtype=float)
+        self._data = np.zeros((self.capacity,) + tuple(shape), dtype=dtype)
+        self._start = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+        self.n_overwritten = 0
+
+    @classmethod
+    def from_size(cls, size, shape=(), dtype=float, rate=None, period=None):
+        """
+        Create a buffer that is bound in bytes rather than number of values.
+
+        Parameters
+        ----------
+        size : int
+            maximum number of bytes for values and timestamps
+        shape : tuple
+        dtype : numpy.dtype
+        rate : float, optional
+            expected number of values per second
+        period : float, optional
+            expected time between two drains in seconds
+
+        Returns
+        -------
+        RingBuffer
+            If rate and period are given, the buffer holds twice the number of
+            values expected between two drains, as long as that fits in size.
+        """
+        row_size = max(np.dtype(dtype).itemsize, 8) * math.prod(shape) + 8
+        capacity = max(size // row_size, 1)
+        if rate and period:
+            capacity = min(capacity, max(math.ceil(2.0 * rate * period), 1))
+        return cls(capacity, shape, dtype)
+
+    @property
+    def nbytes(self):
+        return self._timestamp.nbytes + self._data.nbytes
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value, timestamp):
+        with self._lock:
+            i = (self._start + self._count) % self.capacity
+            self._data[i] = value
+            self._timestamp[i] = timestamp
+            if self._count < self.capacity:
+                self._count += 1
+            else:
+                self._start = (self._start + 1) % self.capacity
+                self.n_overwritten += 1
+
+    def drain(self):
+        """
+        Remove and return all buffered values.
+
+        Returns
+        -------
+        timestamp : numpy.ndarray
+            shape (n,)
+        data : numpy.ndarray
+            shape (n,) + shape
+        """
+        with self._lock:
+            i_start, n = self._start, self._count
+            i_stop = i_start + n
+            if i_stop <= self.capacity:
+                timestamp = self._timestamp[i_start:i_stop].copy()
+                data = self._data[i_start:i_stop].copy()
+            else:
+                i_stop -= self.capacity
+                timestamp = np.concatenate(
+                    (self._timestamp[i_start:], self._timestamp[:i_stop])
+                )
+                data = np.concatenate(
+                    (self._data[i_start:], self._data[:i_stop])
+                )
+            self._start = 0
+            self._count = 0
+        return timestamp, data
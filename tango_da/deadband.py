@@ -0,0 +1,111 @@
+import numpy as np
+
+
+# options of a config entry that enable change-only storage
+CHANGE_OPTIONS = ("deadband_abs", "deadband_rel", "heartbeat")
+
+
+class ChangeFilter:
+    """
+    Store values only when they change, plus a heartbeat.
+
+    A value is stored if it differs from the last stored value by more than
+    deadband_abs + deadband_rel * |last stored value| (any element of a
+    spectrum or image), or if the last stored value is older than heartbeat
+    seconds. Values that aren't numbers are stored if they differ at all.
+    Skipped values are equal to the last stored one within the deadband, so
+    holding every stored value until the next one reconstructs the signal.
+
+    Parameters
+    ----------
+    deadband_abs : float
+    deadband_rel : float
+        relative to the last stored value, e.g. 0.01 for 1 %
+    heartbeat : float
+        maximum time between two stored values in seconds, 0 disables it
+    """
+    def __init__(self, deadband_abs=0.0, deadband_rel=0.0, heartbeat=0.0):
+        self.deadband_abs = float(deadband_abs)
+        self.deadband_rel = float(deadband_rel)
+        self.heartbeat = float(heartbeat)
+        self.n_skipped = 0
+        self._t_last = None
+        self._d_last = None
+
+    @classmethod
+    def from_options(cls, options):
+        """
+        Returns
+        -------
+        ChangeFilter or None
+            if the options of a config entry ask for change-only storage,
+            i.e. 'store' is 'change' or a deadband is given
+        """
+        if options.get("store") != "change" and not any(
+                key in options for key in CHANGE_OPTIONS):
+            return None
+        return cls(**{key: options[key] for key in CHANGE_OPTIONS
+                      if key in options})
+
+    def settings(self):
+        return {
+            'storage_mode': "change",
+            'deadband_abs': self.deadband_abs,
+            'deadband_rel': self.deadband_rel,
+            'heartbeat': self.heartbeat,
+        }
+
+    def reset(self):
+        self.n_skipped = 0
+        self._t_last = None
+        self._d_last = None
+
+    def changed(self, value):
+        """
+        Returns
+        -------
+        bool
+            True, if value is outside the deadband around the last stored one
+        """
+        if self._d_last is None:
+            return True
+        if value.dtype.kind not in "biuf":
+            return not np.array_equal(value, self._d_last)
+
+        value = value.astype(float)
+        nan = np.isnan(value)
+        if np.any(nan != np.isnan(self._d_last)):
+            return True
+        limit = self.deadband_abs + self.deadband_rel * np.abs(self._d_last)
+        return bool(np.any(np.abs(value - self._d_last)[~nan] > limit[~nan]))
+
+    def apply(self, t_new, d_new):
+        """
+        Parameters
+        ----------
+        t_new : numpy.ndarray
+            shape (n, 1)
+        d_new : numpy.ndarray
+            shape (n,) + value shape
+
+        Returns
+        -------
+        t_new, d_new : numpy.ndarray
+            rows that have to be stored
+        """
+        keep = []
+        for i in range(len(t_new)):
+            t_value = t_new[i, 0]
+            if (self.changed(d_new[i])
+                    or (self.heartbeat > 0
+                        and t_value - self._t_last >= self.heartbeat)):
+                keep.append(i)
+                self._t_last = t_value
+                self._d_last = d_new[i].copy()
+                if d_new.dtype.kind in "biuf":
+                    self._d_last = self._d_last.astype(float)
+            else:
+                self.n_skipped += 1
+        if len(keep) == len(t_new):
+            return t_new, d_new
+        return t_new[keep], d_new[keep]
@@ -0,0 +1,118 @@
+import numpy as np
+
+
+# statistics per time bin, along the second axis of a decimated stream
+DECIMATION_COLUMNS = ("min", "max", "mean", "count")
+
+
+class Decimator:
+    """
+    Min, max, mean and count of a numeric signal per time bin, updated
+    batch by batch.
+
+    Bins are aligned to multiples of width seconds. A bin is complete once a
+    value of a later bin arrives; it is then returned by update(). Values
+    older than the open bin are counted in the open bin. NaN values are
+    ignored, the count is per element.
+
+    Parameters
+    ----------
+    width : float
+        bin width in seconds
+    shape : tuple
+        shape of a single value, () for scalars
+    """
+    def __init__(self, width, shape=()):
+        self.width = float(width)
+        self.shape = tuple(shape)
+        self._i_bin = None
+        self._stats = None
+
+    def update(self, t_new, d_new):
+        """
+        Parameters
+        ----------
+        t_new : numpy.ndarray
+            shape (n, 1)
+        d_new : numpy.ndarray
+            shape (n,) + value shape
+
+        Returns
+        -------
+        timestamp : numpy.ndarray
+            start of the completed bins, shape (k, 1)
+        data : numpy.ndarray
+            shape (k, 4) + value shape, see DECIMATION_COLUMNS
+        """
+        if len(t_new) == 0:
+            return self._rows([], [])
+
+        i_bin = np.floor(t_new[:, 0] / self.width).astype(np.int64)
+        if self._i_bin is not None:
+            i_bin = np.maximum(i_bin, self._i_bin)
+        order = np.argsort(i_bin, kind="stable")
+        i_bin = i_bin[order]
+        values = d_new[order].astype(float)
+
+        bins, i_start = np.unique(i_bin, return_index=True)
+        valid = ~np.isnan(values)
+        with np.errstate(invalid="ignore"):
+            stats = [
+                np.fmin.reduceat(values, i_start, axis=0),
+                np.fmax.reduceat(values, i_start, axis=0),
+                np.add.reduceat(np.where(valid, values, 0.0), i_start,
+                                axis=0),
+                np.add.reduceat(valid, i_start, axis=0).astype(float),
+            ]
+
+        bins_done, stats_done = [], []
+        if self._i_bin is not None:
+            if bins[0] == self._i_bin:
+                first = _combine(self._stats, [s[0] for s in stats])
+                for s, value in zip(stats, first):
+                    s[0] = value
+            else:
+                bins_done.append(self._i_bin)
+                stats_done.append(self._stats)
+        for i in range(len(bins) - 1):
+            bins_done.append(bins[i])
+            stats_done.append([s[i] for s in stats])
+        self._i_bin = bins[-1]
+        self._stats = [s[-1] for s in stats]
+        return self._rows(bins_done, stats_done)
+
+    def finish(self):
+        """
+        Returns
+        -------
+        timestamp, data : numpy.ndarray
+            the open bin, incomplete, like update()
+        """
+        if self._i_bin is None:
+            return self._rows([], [])
+        rows = self._rows([self._i_bin], [self._stats])
+        self._i_bin = None
+        self._stats = None
+        return rows
+
+    def _rows(self, bins, stats):
+        timestamp = np.asarray(bins, dtype=float).reshape(-1, 1) * self.width
+        if not stats:
+            shape = (0, len(DECIMATION_COLUMNS)) + self.shape
+            return timestamp, np.zeros(shape)
+        data = np.array([
+            [s_min, s_max, _mean(s_sum, count), count]
+            for s_min, s_max, s_sum, count in stats
+        ])
+        return timestamp, data
+
+
+def _combine(a, b):
+    s_min = np.fmin(a[0], b[0])
+    s_max = np.fmax(a[1], b[1])
+    return [s_min, s_max, a[2] + b[2], a[3] + b[3]]
+
+
+def _mean(s_sum, count):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, s_sum / count, np.nan)
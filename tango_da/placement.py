@@ -0,0 +1,114 @@
+import numpy as np
+
+
+# attributes without fixed data aggregator in the config file
+AUTO = "auto"
+
+# bytes per sample on top of the value, i.e. timestamp and protocol overhead
+SAMPLE_OVERHEAD = 64
+
+
+def estimate_load(n_bytes, rate):
+    """
+    Estimated data rate of an attribute.
+
+    Parameters
+    ----------
+    n_bytes : int
+        size of a single value in bytes
+    rate : float
+        samples per second
+
+    Returns
+    -------
+    float
+        bytes per second
+    """
+    return (n_bytes + SAMPLE_OVERHEAD) * rate
+
+
+def assign(loads, pool, pinned=None, capacity=None):
+    """
+    Distribute attributes across data aggregators by their estimated load.
+
+    Pinned attributes stay on their data aggregator. All others are placed
+    largest first, each on the data aggregator with the lowest relative load
+    after placing it (longest processing time first).
+
+    Parameters
+    ----------
+    loads : dict
+        {key: bytes per second}
+    pool : list of str
+        data aggregators available for unpinned attributes
+    pinned : dict, optional
+        {key: data aggregator}
+    capacity : dict, optional
+        {data aggregator: relative capacity}, 1.0 if not given
+
+    Returns
+    -------
+    placement : dict
+        {key: data aggregator}
+    load : dict
+        {data aggregator: bytes per second}
+    """
+    pinned = pinned or {}
+    capacity = capacity or {}
+    placement = dict(pinned)
+    load = {da: 0.0 for da in pool}
+    for key, da in pinned.items():
+        load[da] = load.get(da, 0.0) + loads.get(key, 0.0)
+
+    unpinned = sorted(
+        (key for key in loads if key not in pinned),
+        key=lambda k: loads[k],
+        reverse=True
+    )
+    if unpinned and not pool:
+        raise ValueError("no data aggregators available for placement")
+
+    for key in unpinned:
+        da = min(
+            pool,
+            key=lambda d: (load[d] + loads[key]) / capacity.get(d, 1.0)
+        )
+        placement[key] = da
+        load[da] += loads[key]
+    return placement, load
+
+
+def capacity_from_run(load, utilization):
+    """
+    Relative capacity of data aggregators, measured during a previous run.
+
+    A data aggregator that handled load bytes per second at a utilization
+    u (e.g. cycle duration / poll period, or its buffer load) could handle
+    load / u at full utilization. Data aggregators without measurement get
+    the median capacity of the others.
+
+    Parameters
+    ----------
+    load : dict
+        {data aggregator: bytes per second assigned during the run}
+    utilization : dict
+        {data aggregator: utilization during the run, 0 ... 1}
+
+    Returns
+    -------
+    dict
+        {data aggregator: relative capacity}, normalized to a median of 1
+    """
+    capacity = {
+        da: load[da] / utilization[da]
+        for da in load
+        if load[da] > 0 and utilization.get(da, 0.0) > 0
+    }
+    if not capacity:
+        return {da: 1.0 for da in load}
+
+    c_median = float(np.median(list(capacity.values())))
+    return {
+        da: capacity.get(da, c_median) / c_median
+        for da in load
+    }
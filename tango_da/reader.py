@@ -0,0 +1,633 @@
+import collections
+import os
+import re
+import time
+
+import h5py
+import numpy as np
+
+from .storage import _stream_groups
+
+
+# rows per index block of datasets without chunks, e.g. the virtual
+# datasets of a master file
+BLOCK_ROWS_DEFAULT = 4096
+
+# sidecar file of a closed hdf5 file that caches its timestamp indices
+INDEX_SUFFIX = ".index.npz"
+
+
+class TimeIndex:
+    """
+    Coarse index of the timestamps of a stream: the first timestamp of every
+    block of rows. Blocks are the chunks of the dataset, so a time range
+    maps to the chunks that have to be read. Timestamps are expected to be
+    ascending.
+
+    Parameters
+    ----------
+    t_block : numpy.ndarray
+        first timestamp of every block
+    n_block : int
+        rows per block
+    n_valid : int
+        valid rows of the stream
+    """
+    __slots__ = ("t_block", "n_block", "n_valid")
+
+    def __init__(self, t_block, n_block, n_valid):
+        self.t_block = np.asarray(t_block, dtype=float)
+        self.n_block = int(n_block)
+        self.n_valid = int(n_valid)
+
+    def rows(self, t_start=None, t_stop=None):
+        """
+        Returns
+        -------
+        i_start, i_stop : int
+            block aligned range of rows that holds all timestamps in
+            [t_start, t_stop)
+        """
+        i_start, i_stop = 0, len(self.t_block)
+        if t_start is not None:
+            i_start = max(
+                int(np.searchsorted(self.t_block, t_start, side="right")) - 1,
+                0
+            )
+        if t_stop is not None:
+            i_stop = int(np.searchsorted(self.t_block, t_stop, side="left"))
+        return (min(i_start * self.n_block, self.n_valid),
+                min(i_stop * self.n_block, self.n_valid))
+
+
+class StreamSlice:
+    """
+    Rows i_start:i_stop of a recorded stream, read from the file on access.
+
+    Parameters
+    ----------
+    group : h5py.Group
+        group of the stream, with the datasets 'timestamp' and 'data'
+    i_start, i_stop : int
+    n_block : int
+        rows per chunk, see iter_chunks()
+    """
+    def __init__(self, group, i_start, i_stop, n_block):
+        self.group = group
+        self.i_start = i_start
+        self.i_stop = max(i_stop, i_start)
+        self.n_block = n_block
+
+    def __len__(self):
+        return self.i_stop - self.i_start
+
+    @property
+    def timestamp(self):
+        """
+        Returns
+        -------
+        numpy.ndarray
+            shape (n,)
+        """
+        return self.group["timestamp"][self.i_start:self.i_stop, 0]
+
+    @property
+    def data(self):
+        """
+        Returns
+        -------
+        numpy.ndarray
+            shape (n,) + value shape
+        """
+        return self.group["data"][self.i_start:self.i_stop]
+
+    def iter_chunks(self):
+        """
+        Read the slice chunk by chunk, e.g. to process a long time range
+        in constant memory.
+
+        Yields
+        ------
+        timestamp, data : numpy.ndarray
+            rows of the slice within one chunk of the datasets
+        """
+        i_row = self.i_start
+        while i_row < self.i_stop:
+            i_next = min((i_row // self.n_block + 1) * self.n_block,
+                         self.i_stop)
+            yield (self.group["timestamp"][i_row:i_next, 0],
+                   self.group["data"][i_row:i_next])
+            i_row = i_next
+
+
+class DAReader:
+    """
+    Read the hdf5 file of a data aggregator, or its master file.
+
+    Time ranges are located with a coarse index per stream (see TimeIndex)
+    and a binary search within the chunks it points to, so reading a time
+    window only touches the chunks of that window. Only the valid rows of a
+    stream are read, also while the file is still being recorded. The
+    indices of a closed file are cached in a sidecar file next to it.
+
+    Parameters
+    ----------
+    filename : str
+    cache_index : bool
+        read and write the sidecar file '<filename>.index.npz'
+    swmr : bool
+        open a file that is recorded in swmr mode, see tail()
+    """
+    def __init__(self, filename, cache_index=True, swmr=False):
+        self.filename = filename
+        self.cache_index = cache_index
+        self.swmr = swmr
+        if swmr:
+            self._file = h5py.File(filename, "r", libver="latest", swmr=True)
+        else:
+            self._file = h5py.File(filename, "r")
+        self._indices = {}
+        self._index_changed = False
+        self._load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._save_index()
+        self._file.close()
+
+    @property
+    def attrs(self):
+        return dict(self._file.attrs)
+
+    @property
+    def closed(self):
+        """
+        True, if the recording of the file has finished
+        """
+        return "time_stop" in self._file.attrs
+
+    def keys(self):
+        """
+        Returns
+        -------
+        list of str
+            keys of all recorded streams, including decimated streams
+        """
+        return [key for key, _ in _stream_groups(self._file["data_recorded"])]
+
+    def run_keys(self):
+        return list(self._file["data_run"].keys())
+
+    def run_attribute(self, key):
+        """
+        Returns
+        -------
+        timestamp : float
+        data : numpy.ndarray or scalar
+            value of a run attribute
+        """
+        group = self._file[f"data_run/{key}"]
+        return group["timestamp"][()], group["data"][()]
+
+    def stream_attrs(self, key):
+        return dict(self._group(key).attrs)
+
+    def n_valid(self, key):
+        """
+        Returns
+        -------
+        int
+            rows of a stream that can be read. A file recorded in swmr mode
+            has no 'n_valid' before it is closed, its datasets hold exactly
+            the rows written so far.
+        """
+        group = self._group(key)
+        if "n_valid" in group.attrs:
+            return int(group.attrs["n_valid"])
+        dset_timestamp, dset_data = group["timestamp"], group["data"]
+        if self.swmr:
+            dset_timestamp.refresh()
+            dset_data.refresh()
+        return min(dset_timestamp.shape[0], dset_data.shape[0])
+
+    def index(self, key):
+        """
+        Returns
+        -------
+        TimeIndex
+            of the stream, built on first use. Indices of a file that is
+            still recorded are extended once more rows are valid.
+        """
+        n_valid = self.n_valid(key)
+        index = self._indices.get(key)
+        if index is None or index.n_valid != n_valid:
+            dset = self._group(key)["timestamp"]
+            n_block = dset.chunks[0] if dset.chunks else BLOCK_ROWS_DEFAULT
+            t_known = []
+            if index is not None and index.n_valid < n_valid:
+                t_known = index.t_block
+            # one timestamp per chunk, i.e. the first row of every chunk
+            i_row = len(t_known) * n_block
+            t_new = dset[i_row:n_valid:n_block, 0] if n_valid > i_row else []
+            t_block = np.concatenate((t_known, t_new))
+            index = TimeIndex(t_block, n_block, n_valid)
+            self._indices[key] = index
+            self._index_changed = True
+        return index
+
+    def read(self, key, t_start=None, t_stop=None):
+        """
+        Rows of a stream with timestamps in [t_start, t_stop).
+
+        Parameters
+        ----------
+        key : str
+        t_start, t_stop : float, optional
+            open ended if not given
+
+        Returns
+        -------
+        StreamSlice
+        """
+        group = self._group(key)
+        index = self.index(key)
+        i_start, i_stop = index.rows(t_start, t_stop)
+        dset = group["timestamp"]
+        n_block = index.n_block
+        # only the first and the last block of the range are searched, the
+        # window starts and ends there
+        if t_start is not None and i_stop > i_start:
+            timestamp = dset[i_start:min(i_start + n_block, i_stop), 0]
+            i_start += int(np.searchsorted(timestamp, t_start))
+        if t_stop is not None and i_stop > i_start:
+            i_last = max((i_stop - 1) // n_block * n_block, i_start)
+            timestamp = dset[i_last:i_stop, 0]
+            i_stop = i_last + int(np.searchsorted(timestamp, t_stop))
+        return StreamSlice(group, i_start, i_stop, n_block)
+
+    def tail(self, key, from_start=False):
+        """
+        Follow a stream while it is recorded.
+
+        Parameters
+        ----------
+        key : str
+        from_start : bool
+            the first poll returns all rows so far, instead of only the rows
+            added after this call
+
+        Returns
+        -------
+        StreamTail
+        """
+        return StreamTail(self, key, from_start)
+
+    def _group(self, key):
+        return self._file[f"data_recorded/{key}"]
+
+    def _index_name(self):
+        return self.filename + INDEX_SUFFIX
+
+    def _load_index(self):
+        if not (self.cache_index and self.closed):
+            return
+        name = self._index_name()
+        try:
+            if os.path.getmtime(name) < os.path.getmtime(self.filename):
+                return
+            with np.load(name) as arrays:
+                for key in self.keys():
+                    entry = f"{key}/t_block"
+                    if entry not in arrays:
+                        continue
+                    n_block, n_valid = arrays[f"{key}/n"]
+                    self._indices[key] = TimeIndex(arrays[entry], n_block,
+                                                   n_valid)
+        except (OSError, ValueError, KeyError):
+            self._indices = {}
+
+    def _save_index(self):
+        if not (self.cache_index and self.closed and self._index_changed):
+            return
+        arrays = {}
+        for key, index in self._indices.items():
+            arrays[f"{key}/t_block"] = index.t_block
+            arrays[f"{key}/n"] = np.array([index.n_block, index.n_valid])
+        try:
+            with open(self._index_name(), "wb") as f:
+                np.savez(f, **arrays)
+        except OSError:
+            # e.g. a read-only directory, the index is rebuilt next time
+            pass
+
+
+class StreamTail:
+    """
+    New rows of a stream that is being recorded, see DAReader.tail().
+
+    Every poll only reads the rows added since the last one. Live tailing
+    requires a file recorded in swmr mode, opened with DAReader(..., swmr=
+    True). Other files only grow in the reader's view once they are reopened.
+    """
+    def __init__(self, reader, key, from_start=False):
+        self.reader = reader
+        self.key = key
+        self.i_row = 0 if from_start else reader.n_valid(key)
+
+    def poll(self):
+        """
+        Returns
+        -------
+        timestamp : numpy.ndarray
+            shape (n,)
+        data : numpy.ndarray
+            shape (n,) + value shape, n = 0 without new rows
+        """
+        n_valid = self.reader.n_valid(self.key)
+        window = StreamSlice(self.reader._group(self.key), self.i_row,
+                             n_valid, BLOCK_ROWS_DEFAULT)
+        self.i_row = window.i_stop
+        return window.timestamp, window.data
+
+    def follow(self, interval=1.0, idle_timeout=None):
+        """
+        Poll every interval seconds.
+
+        Parameters
+        ----------
+        interval : float
+            seconds between two polls
+        idle_timeout : float, optional
+            stop once no rows were added for idle_timeout seconds, e.g.
+            because the recording stopped. Follows forever if not given.
+
+        Yields
+        ------
+        timestamp, data : numpy.ndarray
+            new rows, only if there are any
+        """
+        t_last = time.monotonic()
+        while True:
+            timestamp, data = self.poll()
+            if len(timestamp):
+                t_last = time.monotonic()
+                yield timestamp, data
+            elif (idle_timeout is not None
+                    and time.monotonic() - t_last >= idle_timeout):
+                return
+            time.sleep(interval)
+
+
+# methods of RunReader.align()
+ALIGN_METHODS = ("previous", "nearest", "mean")
+
+_SEGMENT_PATTERN = re.compile(r"^(?P<da>.+)_(?P<number>\d+)\.h5$")
+
+
+def run_files(dir_run):
+    """
+    hdf5 files of all data aggregators of a run.
+
+    A master file replaces the closed files it presents, files it doesn't
+    know about, e.g. the file still being recorded, are kept.
+
+    Parameters
+    ----------
+    dir_run : str
+        e.g. '<root>/<experiment>/run_<n>'
+
+    Returns
+    -------
+    dict
+        {data aggregator: [file name, ...]}, in the order of recording
+    """
+    segments = collections.defaultdict(list)
+    masters = {}
+    for name in os.listdir(dir_run):
+        if name.endswith("_master.h5"):
+            masters[name[:-len("_master.h5")]] = name
+            continue
+        match = _SEGMENT_PATTERN.match(name)
+        if match:
+            segments[match["da"]].append((int(match["number"]), name))
+
+    files = {}
+    for da in sorted(set(segments) | set(masters)):
+        names = [name for _, name in sorted(segments[da])]
+        if da in masters:
+            with h5py.File(os.path.join(dir_run, masters[da]), "r") as f:
+                covered = set(f.attrs.get("segments", []))
+            names = [masters[da]] + [n for n in names if n not in covered]
+        files[da] = [os.path.join(dir_run, name) for name in names]
+    return files
+
+
+class RunReader:
+    """
+    Merged view of all files of a run, across all data aggregators.
+
+    The catalog maps the name of every recorded stream to the files that
+    hold it. A stream is named by its key, or by '<data aggregator>/<key>'
+    if several data aggregators record a stream of that key, e.g. packed
+    tables. Streams are read by time range from all their files at once, and
+    can be aligned onto a common time grid.
+
+    Parameters
+    ----------
+    dir_run : str
+    cache_index : bool
+        see DAReader
+    """
+    def __init__(self, dir_run, cache_index=True):
+        self.dir_run = dir_run
+        self.files = run_files(dir_run)
+        self._readers = {
+            filename: DAReader(filename, cache_index=cache_index)
+            for names in self.files.values() for filename in names
+        }
+
+        sources = collections.defaultdict(list)
+        for da, names in self.files.items():
+            for filename in names:
+                for key in self._readers[filename].keys():
+                    sources[key].append((da, filename))
+        self.catalog = {}
+        for key, key_sources in sources.items():
+            das = {da for da, _ in key_sources}
+            if len(das) == 1:
+                self.catalog[key] = [(key, f) for _, f in key_sources]
+                continue
+            for da, filename in key_sources:
+                self.catalog.setdefault(f"{da}/{key}", []).append(
+                    (key, filename)
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for reader in self._readers.values():
+            reader.close()
+
+    def keys(self):
+        return list(self.catalog)
+
+    def run_attributes(self):
+        """
+        Returns
+        -------
+        dict
+            {key: (timestamp, value)} of the run attributes of all data
+            aggregators
+        """
+        values = {}
+        for names in self.files.values():
+            reader = self._readers[names[0]]
+            for key in reader.run_keys():
+                values[key] = reader.run_attribute(key)
+        return values
+
+    def stream_attrs(self, name):
+        key, filename = self.catalog[name][0]
+        return self._readers[filename].stream_attrs(key)
+
+    def read(self, name, t_start=None, t_stop=None):
+        """
+        Rows of a stream with timestamps in [t_start, t_stop), from all files
+        that hold it.
+
+        Returns
+        -------
+        timestamp : numpy.ndarray
+            shape (n,)
+        data : numpy.ndarray
+            shape (n,) + value shape
+        """
+        return self._concat(
+            self._readers[filename].read(key, t_start, t_stop)
+            for key, filename in self.catalog[name]
+        )
+
+    def align(self, names, grid, method="previous"):
+        """
+        Values of several streams on a common time grid.
+
+        Only the rows around the grid are read. With 'previous', a grid
+        point gets the last value at or before it, with 'nearest' the
+        value closest in time. With 'mean', grid points are the start of
+        bins, the last bin as wide as the one before, and get the mean of
+        all values in their bin. Grid points without value are NaN (None
+        for strings).
+
+        Parameters
+        ----------
+        names : list of str
+            see catalog
+        grid : numpy.ndarray
+            ascending timestamps
+        method : str
+            one of ALIGN_METHODS
+
+        Returns
+        -------
+        dict
+            {name: numpy.ndarray of shape (len(grid),) + value shape}
+        """
+        if method not in ALIGN_METHODS:
+            raise ValueError(f"Allowed methods: {ALIGN_METHODS}")
+        grid = np.asarray(grid, dtype=float)
+        if len(grid) == 0:
+            raise ValueError("empty grid")
+        t_stop = grid[-1]
+        if method == "mean":
+            width = grid[-1] - grid[-2] if len(grid) > 1 else 0.0
+            t_stop = grid[-1] + width
+
+        aligned = {}
+        for name in names:
+            slices = []
+            for key, filename in self.catalog[name]:
+                reader = self._readers[filename]
+                window = reader.read(key, grid[0], t_stop)
+                if method != "mean":
+                    # one more row on both sides, the neighbours of the
+                    # first and last grid point
+                    window = StreamSlice(
+                        window.group, max(window.i_start - 1, 0),
+                        min(window.i_stop + 1, reader.n_valid(key)),
+                        window.n_block
+                    )
+                slices.append(window)
+            timestamp, data = self._concat(slices)
+            if method == "mean":
+                aligned[name] = _align_mean(timestamp, data, grid, t_stop)
+            else:
+                aligned[name] = _align_sample(timestamp, data, grid, method)
+        return aligned
+
+    @staticmethod
+    def _concat(slices):
+        parts = [(s.timestamp, s.data) for s in slices]
+        parts = [(t, d) for t, d in parts if len(t)] or parts[:1]
+        timestamp = np.concatenate([t for t, _ in parts])
+        data = np.concatenate([d for _, d in parts])
+        if len(parts) > 1:
+            order = np.argsort(timestamp, kind="stable")
+            timestamp, data = timestamp[order], data[order]
+        return timestamp, data
+
+
+def _missing(data, n):
+    """
+    Returns
+    -------
+    numpy.ndarray
+        n rows shaped like data, filled with NaN or None
+    """
+    shape = (n,) + data.shape[1::]
+    if data.dtype.kind in "biuf":
+        return np.full(shape, np.nan)
+    return np.full(shape, None, dtype=object)
+
+
+def _align_sample(timestamp, data, grid, method):
+    aligned = _missing(data, len(grid))
+    if len(timestamp) == 0:
+        return aligned
+    i_prev = np.searchsorted(timestamp, grid, side="right") - 1
+    if method == "previous":
+        i_value = i_prev
+        valid = i_prev >= 0
+    else:
+        i_next = np.minimum(i_prev + 1, len(timestamp) - 1)
+        i_prev = np.maximum(i_prev, 0)
+        closer = (np.abs(timestamp[i_next] - grid)
+                  < np.abs(grid - timestamp[i_prev]))
+        i_value = np.where(closer, i_next, i_prev)
+        valid = np.ones(len(grid), dtype=bool)
+    aligned[valid] = data[i_value[valid]]
+    return aligned
+
+
+def _align_mean(timestamp, data, grid, t_stop):
+    aligned = _missing(data, len(grid))
+    if data.dtype.kind not in "biuf":
+        raise ValueError("binned mean requires numeric data")
+    inside = (timestamp >= grid[0]) & (timestamp < t_stop)
+    timestamp, data = timestamp[inside], data[inside].astype(float)
+    if len(timestamp) == 0:
+        return aligned
+    i_bin = np.searchsorted(grid, timestamp, side="right") - 1
+    bins, i_start = np.unique(i_bin, return_index=True)
+    count = np.diff(np.append(i_start, len(i_bin)))
+    count = count.reshape((-1,) + (1,) * (data.ndim - 1))
+    aligned[bins] = np.add.reduceat(data, i_start, axis=0) / count
+    return aligned
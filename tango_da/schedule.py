@@ -0,0 +1,172 @@
+import math
+
+
+class Schedule:
+    """
+    Deadline based schedule for items with individual periods.
+
+    Every item owns an absolute tick grid t_start + k * period. Serving an
+    item late doesn't shift its grid: ticks that have passed in the meantime
+    are skipped and counted as missed, so the average rate never drifts.
+    Changing the period of an item restarts its grid at its last tick.
+
+    Parameters
+    ----------
+    t_start : float
+        time of the first tick of every grid, e.g. time.time()
+    """
+    def __init__(self, t_start):
+        self.t_start = t_start
+        self.n_missed = 0
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, item, period):
+        """
+        Add an item, it is due at t_start and every period thereafter.
+        """
+        if period <= 0:
+            raise ValueError("period has to be positive")
+        self._entries.append(_Entry(item, period))
+
+    def items(self):
+        return [entry.item for entry in self._entries]
+
+    def period(self, item):
+        return self._entry(item).period
+
+    def set_period(self, item, period):
+        """
+        Change the period of an item. Its grid restarts at its last tick, the
+        next one is due one new period later.
+        """
+        if period <= 0:
+            raise ValueError("period has to be positive")
+        entry = self._entry(item)
+        if period == entry.period:
+            return
+        if entry.k_next > 0:
+            entry.t_origin += (entry.k_next - 1) * entry.period
+            entry.k_next = 1
+        entry.period = period
+
+    def missed(self, item):
+        """
+        Returns
+        -------
+        int
+            number of ticks of item that have been skipped
+        """
+        return self._entry(item).n_missed
+
+    def next_deadline(self):
+        """
+        Returns
+        -------
+        float
+            time at which the next item becomes due, inf without items
+        """
+        return min(
+            (entry.deadline(self.t_start) for entry in self._entries),
+            default=math.inf
+        )
+
+    def pop_due(self, t_now):
+        """
+        Collect all items that are due and advance their grids past t_now.
+
+        Returns
+        -------
+        list
+            due items, in the order they have been added
+        """
+        due = []
+        for entry in self._entries:
+            if entry.deadline(self.t_start) > t_now:
+                continue
+            due.append(entry.item)
+            t_origin = self.t_start + entry.t_origin
+            k_now = math.floor((t_now - t_origin) / entry.period)
+            k_now = max(k_now, entry.k_next)
+            n_missed = k_now - entry.k_next
+            entry.k_next = k_now + 1
+            entry.n_missed += n_missed
+            self.n_missed += n_missed
+        return due
+
+    def _entry(self, item):
+        for entry in self._entries:
+            if entry.item is item:
+                return entry
+        raise KeyError(item)
+
+
+class AdaptivePeriod:
+    """
+    Period of a drain that follows the load of the buffer it drains.
+
+    A drain that finds the buffer fuller than high_water shortens the period
+    in proportion, so the next one finds it about half way between the
+    water marks. A drain below low_water lengthens the period by half.
+
+    Parameters
+    ----------
+    period : float
+        initial period in seconds
+    period_min, period_max : float
+        bounds of the period
+    high_water, low_water : float
+        fractions of the buffer capacity
+    """
+    def __init__(self, period, period_min, period_max, high_water=0.5,
+                 low_water=0.1):
+        if not 0.0 < period_min <= period_max:
+            raise ValueError("requires 0 < period_min <= period_max")
+        if not 0.0 <= low_water < high_water <= 1.0:
+            raise ValueError("requires 0 <= low_water < high_water <= 1")
+        self.period_min = period_min
+        self.period_max = period_max
+        self.high_water = high_water
+        self.low_water = low_water
+        self.period = self._clip(period)
+
+    def update(self, load):
+        """
+        Parameters
+        ----------
+        load : float
+            fill level of the buffer at a drain, as a fraction of its
+            capacity
+
+        Returns
+        -------
+        float
+            period until the next drain
+        """
+        if load > self.high_water:
+            # a full buffer may have overflowed, its rate is at least that
+            target = 0.5 * (self.high_water + self.low_water)
+            self.period = self._clip(self.period * target / load)
+        elif load < self.low_water:
+            self.period = self._clip(1.5 * self.period)
+        return self.period
+
+    def _clip(self, period):
+        return min(max(period, self.period_min), self.period_max)
+
+
+class _Entry:
+    __slots__ = ("item", "period", "t_origin", "k_next", "n_missed")
+
+    def __init__(self, item, period):
+        self.item = item
+        self.period = period
+        # start of the grid, relative to the start of the schedule
+        self.t_origin = 0.0
+        self.k_next = 0
+        self.n_missed = 0
+
+    def deadline(self, t_start):
+        return t_start + self.t_origin + self.k_next * self.period
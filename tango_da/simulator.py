@@ -0,0 +1,178 @@
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+import tango
+import tango.server as ts
+
+
+# ------------------------------------------------------------------
+# helper methods
+# ------------------------------------------------------------------
+DATA_FORMATS = {
+    "SCALAR": tango.AttrDataFormat.SCALAR,
+    "SPECTRUM": tango.AttrDataFormat.SPECTRUM,
+    "IMAGE": tango.AttrDataFormat.IMAGE,
+}
+
+
+def attribute_spec(spec):
+    """
+    Complete the spec of a simulated attribute with its defaults.
+
+    Parameters
+    ----------
+    spec : dict
+        name, and optionally format ("SCALAR", "SPECTRUM" or "IMAGE"),
+        dtype (numpy dtype name or "str"), shape ([n] for spectra, [n_y,
+        n_x] for images), rate (change events per second, 0 for none),
+        latency (seconds per read) and error_rate (fraction of reads and
+        events that fail)
+
+    Returns
+    -------
+    dict
+    """
+    spec = dict(spec)
+    spec.setdefault("format", "SCALAR")
+    spec.setdefault("dtype", "float64")
+    spec.setdefault("rate", 0.0)
+    spec.setdefault("latency", 0.0)
+    spec.setdefault("error_rate", 0.0)
+    if spec["format"] not in DATA_FORMATS:
+        raise ValueError(f"Allowed formats: {tuple(DATA_FORMATS)}")
+    if spec["format"] == "SCALAR":
+        spec["shape"] = []
+    elif spec["format"] == "SPECTRUM":
+        spec["shape"] = list(spec.get("shape", [100]))[:1]
+    else:
+        spec["shape"] = list(spec.get("shape", [100, 100]))[:2]
+    return spec
+
+
+def simulated_value(spec, t):
+    """
+    Value of a simulated attribute at time t: a sine wave along the time and
+    the value axes, cast to its dtype.
+    """
+    shape = tuple(spec["shape"])
+    phase = np.arange(max(int(np.prod(shape)), 1)).reshape(shape or (1,))
+    value = 100.0 * np.sin(0.1 * phase + t)
+    if spec["dtype"] == "str":
+        value = [f"{v:.3f}" for v in value.reshape(-1)]
+        return value[0] if not shape else value
+    value = value.astype(spec["dtype"])
+    return value.reshape(-1)[0] if not shape else value
+
+
+# ------------------------------------------------------------------
+# device class
+# ------------------------------------------------------------------
+class Simulator(ts.Device):
+    """
+    Stand-in for the devices of a control system, e.g. to benchmark data
+    aggregators without one.
+
+    The device property 'attributes' is a json list of attribute specs, see
+    attribute_spec(). Every attribute can be read, attributes with a rate
+    push change events at that rate.
+    """
+    green_mode = tango.GreenMode.Asyncio
+
+    attributes = ts.device_property(dtype=str, default_value="[]")
+
+    async def init_device(self):
+        await super().init_device()
+        self.set_state(tango.DevState.INIT)
+        self._specs = {}
+        self._tasks = []
+        self._n_events = 0
+        self._n_reads = 0
+        for spec in json.loads(self.attributes):
+            spec = attribute_spec(spec)
+            self._specs[spec["name"]] = spec
+            self._add_simulated(spec)
+        self.set_state(tango.DevState.ON)
+
+    async def delete_device(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await super().delete_device()
+
+    @ts.attribute(dtype=int, doc="change events pushed since init")
+    async def n_events(self):
+        return self._n_events
+
+    @ts.attribute(dtype=int, doc="reads of simulated attributes since init")
+    async def n_reads(self):
+        return self._n_reads
+
+    @ts.command
+    async def StartEvents(self):
+        """
+        Push change events of all attributes with a rate.
+        """
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [
+            loop.create_task(self._push_events(spec))
+            for spec in self._specs.values() if spec["rate"] > 0
+        ]
+
+    @ts.command
+    async def StopEvents(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def _add_simulated(self, spec):
+        dtype = str if spec["dtype"] == "str" else np.dtype(spec["dtype"]).type
+        shape = spec["shape"]
+        kwargs = {}
+        if len(shape) > 0:
+            kwargs["max_dim_x"] = shape[-1]
+        if len(shape) > 1:
+            kwargs["max_dim_y"] = shape[0]
+        attr = ts.attribute(
+            name=spec["name"],
+            dtype=dtype,
+            dformat=DATA_FORMATS[spec["format"]],
+            fget=self._read_simulated,
+            **kwargs
+        )
+        self.add_attribute(attr)
+        if spec["rate"] > 0:
+            self.set_change_event(spec["name"], True, False)
+
+    async def _read_simulated(self, attr):
+        spec = self._specs[attr.get_name()]
+        self._n_reads += 1
+        if spec["latency"] > 0:
+            await asyncio.sleep(spec["latency"])
+        if random.random() < spec["error_rate"]:
+            raise RuntimeError(f"simulated read error of {spec['name']}")
+        attr.set_value(simulated_value(spec, time.time()))
+
+    async def _push_events(self, spec):
+        period = 1.0 / spec["rate"]
+        t_next = time.time()
+        while True:
+            t_next += period
+            await asyncio.sleep(max(t_next - time.time(), 0.0))
+            t_now = time.time()
+            if random.random() < spec["error_rate"]:
+                self.push_change_event(spec["name"], tango.DevFailed(
+                    tango.DevError()
+                ))
+            else:
+                self.push_change_event(spec["name"],
+                                       simulated_value(spec, t_now))
+            self._n_events += 1
+
+
+if __name__ == "__main__":
+    Simulator.run_server()
@@ -0,0 +1,834 @@
+import abc
+import collections
+import json
+import math
+import os
+import time
+
+import h5py
+import numpy as np
+
+
+# chunk layout along the time axis of recorded datasets
+CHUNK_SIZE_TARGET = 1024 ** 2
+CHUNK_SIZE_MIN = 4 * 1024
+CHUNK_TIME_TARGET = 600.0
+
+COMPRESSION_FILTERS = ("", "gzip", "lzf")
+
+# hdf5: one hdf5 file per segment, see HDF5Storage
+# parquet: one directory of parquet files per segment, see ParquetStorage
+STORAGE_BACKENDS = ("hdf5", "parquet")
+
+
+def chunk_rows_auto(row_size, poll_period=None):
+    """
+    Number of rows per chunk along the time axis of a recorded dataset.
+
+    Chunks aim at CHUNK_SIZE_TARGET bytes. Polled data is sampled at a known
+    rate, a chunk then doesn't span much more than CHUNK_TIME_TARGET seconds,
+    unless it would become smaller than CHUNK_SIZE_MIN bytes.
+
+    Parameters
+    ----------
+    row_size : int
+        bytes per row, i.e. per recorded value
+    poll_period : float, optional
+
+    Returns
+    -------
+    int
+    """
+    n_rows = max(CHUNK_SIZE_TARGET // row_size, 1)
+    if poll_period:
+        n_rows_time = math.ceil(CHUNK_TIME_TARGET / poll_period)
+        n_rows = min(n_rows, max(n_rows_time, CHUNK_SIZE_MIN // row_size, 1))
+    return int(n_rows)
+
+
+def create_storage(backend, *args, **kwargs):
+    """
+    Returns
+    -------
+    StorageBackend
+        instance of the storage backend named backend, see STORAGE_BACKENDS
+    """
+    if backend == "hdf5":
+        return HDF5Storage(*args, **kwargs)
+    elif backend == "parquet":
+        return ParquetStorage(*args, **kwargs)
+    raise ValueError(f"Allowed storage backends: {STORAGE_BACKENDS}")
+
+
+class StorageBackend(abc.ABC):
+    """
+    Storage of a recording.
+
+    A recording consists of one or more segments. Run attributes are stored
+    once, in the first segment. Poll and push attributes are streams of
+    timestamped rows, appended to in batches. Once a segment exceeds
+    rollover_size bytes or rollover_time seconds, the recording continues in
+    the next one.
+
+    All methods but open_run() are called in the writer thread. Subclasses
+    implement the methods starting with an underscore.
+
+    Parameters
+    ----------
+    path : str
+        directory of the run
+    name : str
+        name of the data aggregator, prefix of all segments
+    logger : object
+        provides debug_stream(), info_stream() and warn_stream(), e.g. the
+        device
+    chunk_rows, compression, compression_level, shuffle
+        default storage layout, see layout()
+    flush_interval : float
+        seconds between two flushes
+    flush_size : int
+        bytes written since the last flush that trigger a flush
+    rollover_size : int
+        bytes per segment, 0 disables the size limit
+    rollover_time : float
+        seconds per segment, 0 disables the time limit
+    poll_period : float
+        default poll period, used to derive the chunk size
+    file_attrs : dict, optional
+        stored with every segment
+    stream_attrs : callable, optional
+        stream_attrs(p_handle) returns a dict that is stored with the stream
+        of p_handle, whenever a segment is closed
+    """
+    extension = ""
+
+    def __init__(self, path, name, logger, chunk_rows=0, compression="",
+                 compression_level=4, shuffle=True, flush_interval=10.0,
+                 flush_size=64 * 1024 ** 2, rollover_size=0,
+                 rollover_time=0.0, poll_period=3.0, file_attrs=None,
+                 stream_attrs=None):
+        self.path = path
+        self.name = name
+        self.logger = logger
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self.compression_level = compression_level
+        self.shuffle = shuffle
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.rollover_size = rollover_size
+        self.rollover_time = rollover_time
+        self.poll_period = poll_period
+        self.file_attrs = file_attrs or {}
+        self.stream_attrs = stream_attrs
+
+        self.handles = []
+        self.file_name = ""
+        self.segments = []
+        self.size_closed = 0
+        self._file_number = 1
+        self._t_segment = 0.0
+        self._n_bytes_segment = 0
+        self._n_bytes_unflushed = 0
+        self._t_flush = 0.0
+
+    @property
+    def rollover_enabled(self):
+        return self.rollover_size > 0 or self.rollover_time > 0
+
+    @property
+    @abc.abstractmethod
+    def file_size(self):
+        """
+        Returns
+        -------
+        int
+            bytes of the open segment on disk, 0 if there is none
+        """
+
+    def segment_name(self, number):
+        return os.path.join(self.path, f"{self.name}_{number}{self.extension}")
+
+    def open_run(self, handles, t_start=None):
+        """
+        Create the first segment of a recording. Run attributes are stored
+        right away, poll and push attributes start with the value returned by
+        their first get_batch().
+
+        Parameters
+        ----------
+        handles : list
+            DAData or equivalent handles of all attributes
+        t_start : float, optional
+            start time of the run, stored as 'time_start'. Defaults to now.
+
+        Returns
+        -------
+        str
+            name of the first segment
+        """
+        self.segments = []
+        self.size_closed = 0
+        self._file_number = 1
+        while os.path.exists(self.segment_name(self._file_number)):
+            self._file_number += 1
+        self.handles = [
+            p for p in handles if p.attr_type != "run_attribute"
+        ]
+
+        self._open_segment(t_start)
+        for p_handle in handles:
+            t_first, d_first = self.first_batch(p_handle)
+            if p_handle.attr_type == "run_attribute":
+                self.logger.debug_stream("initialize run attributes ...")
+                self._write_run(p_handle, t_first, d_first)
+            else:
+                self.logger.debug_stream("initialize poll and push "
+                                         "attributes ...")
+                self._create_stream(p_handle)
+                self.append(p_handle, t_first, d_first)
+        self._start_segment()
+        self.flush(force=True)
+        return self.file_name
+
+    def append(self, p_handle, t_new, d_new):
+        """
+        Append new rows to the stream of an attribute.
+
+        Returns
+        -------
+        int
+            number of bytes appended
+        """
+        self._append(p_handle, t_new, d_new)
+        n_bytes = t_new.nbytes + d_new.nbytes
+        self._n_bytes_unflushed += n_bytes
+        self._n_bytes_segment += n_bytes
+        return n_bytes
+
+    def flush(self, force=False):
+        """
+        Flush, once the flush interval has passed or enough data has been
+        written since the last flush.
+        """
+        t_now = time.time()
+        if (force
+                or self._n_bytes_unflushed >= self.flush_size
+                or t_now - self._t_flush >= self.flush_interval):
+            self._flush()
+            self._t_flush = t_now
+            self._n_bytes_unflushed = 0
+
+    def rollover_due(self):
+        if self.rollover_size > 0:
+            # buffered data is not part of the file size yet
+            n_bytes = max(self.file_size, self._n_bytes_segment)
+            if n_bytes >= self.rollover_size:
+                return True
+        if self.rollover_time > 0:
+            if time.time() - self._t_segment >= self.rollover_time:
+                return True
+        return False
+
+    def rollover(self):
+        """
+        Close the current segment and continue the recording in the next one.
+        Recorded attributes start with empty streams in the new segment, run
+        attributes are only stored in the first one.
+        """
+        self._close_segment()
+        self._finish()
+
+        self._file_number += 1
+        self._open_segment()
+        for p_handle in self.handles:
+            self._create_stream(p_handle)
+        self._start_segment()
+        self.flush(force=True)
+
+    def close(self):
+        """
+        Close the current segment, the recording is complete.
+        """
+        self._close_segment()
+        self._finish()
+
+    def layout(self, p_handle):
+        """
+        Chunk rows and compression of the stream of an attribute. Settings of
+        the attribute's config entry take precedence over the defaults.
+
+        Returns
+        -------
+        n_rows : int
+            rows per chunk along the time axis
+        compression : str
+            one of COMPRESSION_FILTERS
+        compression_level : int
+        shuffle : bool
+        """
+        opts = p_handle.options
+        n_rows = opts.get("chunk_rows", self.chunk_rows)
+        if n_rows <= 0:
+            poll_period = None
+            if p_handle.attr_type == "poll_attribute":
+                poll_period = float(opts.get("poll_period", self.poll_period))
+            n_rows = chunk_rows_auto(p_handle.row_size, poll_period)
+
+        compression = opts.get("compression", self.compression) or ""
+        if compression not in COMPRESSION_FILTERS:
+            self.logger.warn_stream(
+                f"{p_handle.attr_key}: unknown compression {compression}"
+            )
+            compression = self.compression
+        level = int(opts.get("compression_level", self.compression_level))
+        shuffle = bool(opts.get("shuffle", self.shuffle))
+        return int(n_rows), compression, level, shuffle
+
+    @staticmethod
+    def first_batch(p_handle):
+        """
+        Returns
+        -------
+        timestamp, data : numpy.ndarray
+            a fresh value of p_handle, or the value read when connecting if
+            there is none
+        """
+        t_first, d_first = p_handle.get_batch()
+        if len(t_first) == 0 and hasattr(p_handle, "_d_attr_obj"):
+            t_first, d_first = p_handle.unpack(p_handle._d_attr_obj)
+        return t_first, d_first
+
+    def _stream_attrs(self, p_handle):
+        attrs = {
+            'attribute_id': p_handle.attr_id,
+            'attribute_type': p_handle.attr_type,
+        }
+        if self.stream_attrs is not None:
+            attrs.update(self.stream_attrs(p_handle))
+        return attrs
+
+    # ------------------------------------------------------------------
+    # implemented by subclasses
+    # ------------------------------------------------------------------
+    @abc.abstractmethod
+    def _open_segment(self, t_start=None):
+        pass
+
+    @abc.abstractmethod
+    def _write_run(self, p_handle, t_first, d_first):
+        pass
+
+    @abc.abstractmethod
+    def _create_stream(self, p_handle):
+        pass
+
+    def _start_segment(self):
+        # all streams of the segment exist
+        pass
+
+    @abc.abstractmethod
+    def _append(self, p_handle, t_new, d_new):
+        pass
+
+    @abc.abstractmethod
+    def _flush(self):
+        pass
+
+    @abc.abstractmethod
+    def _close_segment(self):
+        pass
+
+    def _finish(self):
+        pass
+
+
+class HDF5Storage(StorageBackend):
+    """
+    One hdf5 file per segment, '<name>_<n>.h5'.
+
+    Run attributes are stored in 'data_run/<key>', recorded attributes in the
+    datasets 'data_recorded/<key>/timestamp' and 'data_recorded/<key>/data'.
+    Datasets are preallocated, the attribute 'n_valid' of their group marks
+    the number of valid rows. With rollover, '<name>_master.h5' presents all
+    segments as continuous virtual datasets.
+
+    With swmr, a file is written in hdf5's single writer multiple reader
+    mode once all its datasets exist, so readers can follow it while it is
+    recorded (see reader.StreamTail). Datasets then grow by exactly the rows
+    appended and are flushed on every flush. Attributes can't be written in
+    swmr mode: 'n_valid' and the attributes of the groups and of the file
+    are written when the file is closed.
+    """
+    extension = ".h5"
+
+    def __init__(self, *args, swmr=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.swmr = swmr
+        self._h5_file = None
+
+    @property
+    def file_size(self):
+        if self._h5_file is None:
+            return 0
+        try:
+            return os.path.getsize(self.file_name)
+        except OSError:
+            return 0
+
+    def rollover_due(self):
+        if self.rollover_size > 0 and self._h5_file is not None:
+            # data in the chunk cache is not part of the file size yet
+            n_bytes = max(self._h5_file.id.get_filesize(),
+                          self._n_bytes_segment)
+            if n_bytes >= self.rollover_size:
+                return True
+        if self.rollover_time > 0:
+            if time.time() - self._t_segment >= self.rollover_time:
+                return True
+        return False
+
+    def _open_segment(self, t_start=None):
+        t_now = time.time()
+        if t_start is None:
+            t_start = t_now
+        filename = self.segment_name(self._file_number)
+        if self.swmr:
+            f = h5py.File(filename, 'a', libver='latest')
+        else:
+            f = h5py.File(filename, 'a')
+        self.logger.info_stream(f"creating {filename}")
+
+        f.create_group(f"data_run")
+        f.create_group(f"data_recorded")
+
+        f.attrs['time_start'] = t_start
+        f.attrs.update(self.file_attrs)
+        f.attrs['segment'] = len(self.segments)
+        f.attrs['swmr'] = self.swmr
+
+        self._h5_file = f
+        self.file_name = filename
+        self._t_segment = t_now
+        self._n_bytes_segment = 0
+
+    def _write_run(self, p_handle, t_first, d_first):
+        group = self._h5_file.create_group(f"data_run/{p_handle.attr_key}")
+        val = d_first[0]
+        if p_handle.data_format == "SCALAR":
+            val = val.item()
+        group.create_dataset('timestamp', data=t_first[0, 0])
+        group.create_dataset('data', data=val)
+        group.attrs.update(self._stream_attrs(p_handle))
+
+    def _create_stream(self, p_handle):
+        """
+        Create the empty, extendable datasets of a recorded attribute and
+        cache them on its handle.
+        """
+        group = self._h5_file.require_group(
+            f"data_recorded/{p_handle.attr_key}"
+        )
+        n_rows, filters = self._dset_layout(p_handle)
+
+        p_handle.dset_timestamp = group.create_dataset(
+            "timestamp",
+            (0, 1),
+            maxshape=(None, 1),
+            dtype=float,
+            chunks=(n_rows, 1),
+            **filters
+        )
+
+        dtype = p_handle.store_dtype
+        if p_handle.data_type is str:
+            dtype = h5py.string_dtype()
+        p_handle.dset_data = group.create_dataset(
+            "data",
+            (0,) + p_handle.data_shape[1::],
+            maxshape=p_handle.data_shape_max,
+            dtype=dtype,
+            chunks=(n_rows,) + p_handle.data_shape[1::],
+            **filters
+        )
+
+        p_handle.n_rows = 0
+        if not self.swmr:
+            # in swmr mode, readers take the shape of the datasets
+            group.attrs['n_valid'] = 0
+        group.attrs.update(self._stream_attrs(p_handle))
+
+    def _start_segment(self):
+        if self.swmr:
+            self._h5_file.swmr_mode = True
+
+    def _dset_layout(self, p_handle):
+        """
+        Returns
+        -------
+        n_rows : int
+            rows per chunk along the time axis
+        filters : dict
+            keyword arguments for h5py create_dataset()
+        """
+        n_rows, compression, level, shuffle = self.layout(p_handle)
+        filters = {}
+        if compression:
+            filters["compression"] = compression
+            filters["shuffle"] = shuffle
+            if compression == "gzip":
+                filters["compression_opts"] = level
+        return n_rows, filters
+
+    def _append(self, p_handle, t_new, d_new):
+        """
+        Append new rows to the datasets of an attribute.
+
+        Datasets grow geometrically, in multiples of their chunk size, instead
+        of being resized every cycle. Rows beyond p_handle.n_rows are
+        preallocated and not valid yet; the file marks the valid length in
+        the 'n_valid' attribute of the group.
+        """
+        n_start = p_handle.n_rows
+        n_stop = n_start + len(t_new)
+        for dset, d_new in ((p_handle.dset_timestamp, t_new),
+                            (p_handle.dset_data, d_new)):
+            if self.swmr:
+                dset.resize(n_stop, axis=0)
+            elif n_stop > dset.shape[0]:
+                n_chunk = dset.chunks[0]
+                n_alloc = max(n_stop, 2 * dset.shape[0])
+                dset.resize(math.ceil(n_alloc / n_chunk) * n_chunk, axis=0)
+            dset[n_start:n_stop] = d_new
+        p_handle.n_rows = n_stop
+
+    def _flush(self):
+        for p_handle in self.handles:
+            if p_handle.dset_data is None:
+                continue
+            if self.swmr:
+                # data first, readers take the rows of the timestamps
+                p_handle.dset_data.flush()
+                p_handle.dset_timestamp.flush()
+            else:
+                p_handle.dset_data.parent.attrs["n_valid"] = p_handle.n_rows
+        self._h5_file.flush()
+
+    def _close_segment(self):
+        """
+        Finalize, flush and close the hdf5 file of the current segment.
+        Preallocated rows are trimmed from all recorded datasets.
+        """
+        if self._h5_file is None:
+            return
+        f = self._h5_file
+        filename = f.filename
+        if self.swmr:
+            # attributes are written after leaving swmr mode
+            f.close()
+            f = h5py.File(filename, 'a', libver='latest')
+        for p_handle in self.handles:
+            if p_handle.dset_data is None:
+                continue
+            group = f[f"data_recorded/{p_handle.attr_key}"]
+            group["timestamp"].resize(p_handle.n_rows, axis=0)
+            group["data"].resize(p_handle.n_rows, axis=0)
+            group.attrs["n_valid"] = p_handle.n_rows
+            group.attrs.update(self._stream_attrs(p_handle))
+            p_handle.dset_timestamp = None
+            p_handle.dset_data = None
+        f.attrs["time_stop"] = time.time()
+        f.close()
+        self._h5_file = None
+        self.segments.append(filename)
+        self.size_closed += os.path.getsize(filename)
+
+    def _finish(self):
+        """
+        (Re)create the master file of the current recording. It presents
+        the recorded data of all closed files as one continuous virtual
+        dataset per attribute and links to the run attributes of the first
+        file. Without rollover there is only one file and no master file.
+        """
+        if not self.rollover_enabled or not self.segments:
+            return
+
+        sources = collections.defaultdict(list)
+        group_attrs = {}
+        time_stop = 0.0
+        for filename in self.segments:
+            # sources are referenced relative to the master file
+            name_source = os.path.basename(filename)
+            with h5py.File(filename, 'r') as f:
+                time_stop = f.attrs.get('time_stop', time_stop)
+                for key, group in _stream_groups(f['data_recorded']):
+                    group_attrs[key] = dict(group.attrs)
+                    for name in ('timestamp', 'data'):
+                        dset = group[name]
+                        sources[(key, name)].append(h5py.VirtualSource(
+                            name_source, dset.name,
+                            shape=dset.shape, dtype=dset.dtype
+                        ))
+
+        filename = os.path.join(self.path, f"{self.name}_master.h5")
+        with h5py.File(filename, 'w', libver='latest') as f:
+            f['data_run'] = h5py.ExternalLink(
+                os.path.basename(self.segments[0]), 'data_run'
+            )
+            f.create_group('data_recorded')
+            for (key, name), v_sources in sources.items():
+                n_rows = sum(v_source.shape[0] for v_source in v_sources)
+                layout = h5py.VirtualLayout(
+                    shape=(n_rows,) + v_sources[0].shape[1::],
+                    dtype=v_sources[0].dtype
+                )
+                i_row = 0
+                for v_source in v_sources:
+                    i_stop = i_row + v_source.shape[0]
+                    layout[i_row:i_stop] = v_source
+                    i_row = i_stop
+                group = f.require_group(f"data_recorded/{key}")
+                try:
+                    group.create_virtual_dataset(name, layout)
+                except (TypeError, ValueError) as err:
+                    self.logger.warn_stream(
+                        f"{key}/{name}: no virtual dataset, {err}"
+                    )
+                group.attrs.update(group_attrs[key])
+                group.attrs['n_valid'] = n_rows
+
+            with h5py.File(self.segments[0], 'r') as f_first:
+                f.attrs.update(f_first.attrs)
+            f.attrs['time_stop'] = time_stop
+            f.attrs['segments'] = [
+                os.path.basename(filename) for filename in self.segments
+            ]
+
+
+class ParquetStorage(StorageBackend):
+    """
+    One directory per segment, '<name>_<n>.parquet', with a parquet file per
+    attribute: 'data_run/<key>.parquet' and 'data_recorded/<key>.parquet'.
+
+    Every file has the columns 'timestamp' and 'data'. Spectra and images
+    are stored as fixed size lists of their flattened values, the field
+    metadata 'shape' holds the shape of a single value. Rows are written as
+    row groups of the chunk size, so readers can process row groups in
+    parallel. 'attrs.json' holds the attributes of the segment and of all
+    attributes, like the attributes of the hdf5 file and its groups.
+
+    A parquet file becomes readable once it is closed, i.e. at rollover or
+    when the recording stops. Compression 'lzf' is not available in parquet
+    and is mapped to 'snappy', which is as lightweight.
+    """
+    extension = ".parquet"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as err:
+            raise ImportError(
+                "the parquet storage backend requires pyarrow"
+            ) from err
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._dir_segment = None
+        self._attrs = {}
+        self._streams = {}
+
+    @property
+    def file_size(self):
+        if self._dir_segment is None:
+            return 0
+        return _dir_size(self._dir_segment)
+
+    def _open_segment(self, t_start=None):
+        t_now = time.time()
+        if t_start is None:
+            t_start = t_now
+        dir_segment = self.segment_name(self._file_number)
+        self.logger.info_stream(f"creating {dir_segment}")
+        os.makedirs(os.path.join(dir_segment, "data_run"))
+        os.makedirs(os.path.join(dir_segment, "data_recorded"))
+
+        self._attrs = {
+            "file": dict(self.file_attrs, time_start=t_start,
+                         segment=len(self.segments)),
+            "data_run": {},
+            "data_recorded": {},
+        }
+        self._streams = {}
+        self._dir_segment = dir_segment
+        self.file_name = dir_segment
+        self._t_segment = t_now
+        self._n_bytes_segment = 0
+
+    def _schema(self, p_handle):
+        pa = self._pa
+        if p_handle.store_dtype.hasobject:
+            value_type = pa.string()
+        else:
+            value_type = pa.from_numpy_dtype(p_handle.store_dtype)
+        shape = tuple(p_handle.data_shape[1::])
+        if shape != (1,):
+            value_type = pa.list_(value_type, math.prod(shape))
+        return pa.schema([
+            pa.field("timestamp", pa.float64()),
+            pa.field("data", value_type,
+                     metadata={"shape": json.dumps(shape)}),
+        ])
+
+    def _table(self, schema, t_new, d_new):
+        pa = self._pa
+        flat = d_new.reshape(-1)
+        value_type = schema.field("data").type
+        if isinstance(value_type, pa.FixedSizeListType):
+            values = pa.array(flat.tolist() if flat.dtype.hasobject else flat,
+                              type=value_type.value_type)
+            data = pa.FixedSizeListArray.from_arrays(
+                values, value_type.list_size
+            )
+        else:
+            data = pa.array(flat.tolist() if flat.dtype.hasobject else flat,
+                            type=value_type)
+        timestamp = pa.array(t_new.reshape(-1), type=pa.float64())
+        return pa.Table.from_arrays([timestamp, data], schema=schema)
+
+    def _compression(self, p_handle):
+        """
+        Returns
+        -------
+        dict
+            keyword arguments for pyarrow.parquet.ParquetWriter
+        """
+        n_rows, compression, level, _ = self.layout(p_handle)
+        if compression == "gzip":
+            return dict(compression="gzip", compression_level=level)
+        elif compression == "lzf":
+            return dict(compression="snappy")
+        return dict(compression="none")
+
+    def _write_run(self, p_handle, t_first, d_first):
+        schema = self._schema(p_handle)
+        path = os.path.join(self._dir_segment, "data_run",
+                            f"{p_handle.attr_key}.parquet")
+        self._pq.write_table(
+            self._table(schema, t_first[:1], d_first[:1]), path,
+            **self._compression(p_handle)
+        )
+        self._attrs["data_run"][p_handle.attr_key] = self._stream_attrs(
+            p_handle
+        )
+
+    def _create_stream(self, p_handle):
+        schema = self._schema(p_handle)
+        path = os.path.join(self._dir_segment, "data_recorded",
+                            f"{p_handle.attr_key}.parquet")
+        # decimated streams are stored below their attribute
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        writer = self._pq.ParquetWriter(
+            path, schema, **self._compression(p_handle)
+        )
+        n_rows = self.layout(p_handle)[0]
+        self._streams[p_handle.attr_key] = _ParquetStream(
+            writer, schema, n_rows
+        )
+        p_handle.n_rows = 0
+
+    def _append(self, p_handle, t_new, d_new):
+        stream = self._streams[p_handle.attr_key]
+        stream.pending.append((t_new, d_new))
+        stream.n_pending += len(t_new)
+        p_handle.n_rows += len(t_new)
+        if stream.n_pending >= stream.n_rows:
+            self._write_row_group(stream)
+
+    def _write_row_group(self, stream):
+        if not stream.n_pending:
+            return
+        t_new = np.concatenate([t for t, _ in stream.pending])
+        d_new = np.concatenate([d for _, d in stream.pending])
+        stream.writer.write_table(
+            self._table(stream.schema, t_new, d_new),
+            row_group_size=len(t_new)
+        )
+        stream.pending = []
+        stream.n_pending = 0
+
+    def _flush(self):
+        # row groups are only written once they are complete, small row
+        # groups would defeat the purpose of a columnar layout
+        self._write_attrs()
+
+    def _write_attrs(self):
+        for p_handle in self.handles:
+            if p_handle.attr_key in self._streams:
+                attrs = self._stream_attrs(p_handle)
+                attrs["n_valid"] = p_handle.n_rows
+                self._attrs["data_recorded"][p_handle.attr_key] = attrs
+        path = os.path.join(self._dir_segment, "attrs.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self._attrs, f, default=_json_default)
+        os.replace(path + ".tmp", path)
+
+    def _close_segment(self):
+        if self._dir_segment is None:
+            return
+        for stream in self._streams.values():
+            self._write_row_group(stream)
+            stream.writer.close()
+        self._attrs["file"]["time_stop"] = time.time()
+        self._write_attrs()
+        self._streams = {}
+        self.segments.append(self._dir_segment)
+        self.size_closed += _dir_size(self._dir_segment)
+        self._dir_segment = None
+
+
+class _ParquetStream:
+    __slots__ = ("writer", "schema", "n_rows", "pending", "n_pending")
+
+    def __init__(self, writer, schema, n_rows):
+        self.writer = writer
+        self.schema = schema
+        self.n_rows = n_rows
+        self.pending = []
+        self.n_pending = 0
+
+
+def _stream_groups(group):
+    """
+    Returns
+    -------
+    list of tuple
+        [(key, group), ...] of all groups below group with recorded data,
+        i.e. with a 'timestamp' dataset, parents first
+    """
+    streams = []
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Group) and "timestamp" in obj:
+            streams.append((name, obj))
+
+    group.visititems(visit)
+    return streams
+
+
+def _dir_size(path):
+    n_bytes = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                n_bytes += os.path.getsize(os.path.join(dir_path, file_name))
+            except OSError:
+                pass
+    return n_bytes
+
+
+def _json_default(value):
+    # numpy scalars in attributes, e.g. event counters
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value)} is not json serializable")
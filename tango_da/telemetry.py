@@ -0,0 +1,245 @@
+import math
+import threading
+
+import numpy as np
+
+
+class Histogram:
+    """
+    Histogram with a fixed number of logarithmic buckets.
+
+    Recording a value costs a logarithm and an increment, memory stays
+    constant no matter how many values are recorded. Percentiles are
+    accurate to the width of a bucket, about 33 % with 8 buckets per decade.
+
+    Parameters
+    ----------
+    v_min : float
+        upper edge of the lowest bucket, smaller values are counted there
+    v_max : float
+        lower edge of the highest bucket, larger values are counted there
+    n_per_decade : int
+        buckets per factor of 10
+    """
+    def __init__(self, v_min=1e-6, v_max=100.0, n_per_decade=8):
+        self.v_min = v_min
+        self.v_max = v_max
+        self.n_per_decade = n_per_decade
+        n_buckets = math.ceil(math.log10(v_max / v_min) * n_per_decade)
+        # bucket i > 0 holds values up to v_min * 10 ** (i / n_per_decade)
+        self.counts = np.zeros(n_buckets + 2, dtype=np.int64)
+        self.total = 0.0
+        self.maximum = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Inverse of to_dict(), e.g. to merge histograms of other processes.
+        """
+        hist = cls(d["v_min"], d["v_max"], d["n_per_decade"])
+        hist.counts[:] = d["counts"]
+        hist.total = d["total"]
+        hist.maximum = d["max"]
+        return hist
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    @property
+    def mean(self):
+        count = self.count
+        return self.total / count if count else 0.0
+
+    def record(self, value):
+        if value <= self.v_min:
+            i = 0
+        else:
+            i = math.ceil(math.log10(value / self.v_min) * self.n_per_decade)
+            i = min(i, len(self.counts) - 1)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += value
+            self.maximum = max(self.maximum, value)
+
+    def percentile(self, q):
+        """
+        Parameters
+        ----------
+        q : float
+            0 ... 100
+
+        Returns
+        -------
+        float
+            geometric center of the bucket holding the q-th percentile,
+            0.0 without values
+        """
+        count = self.count
+        if count == 0:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(self.counts), q / 100.0 * count))
+        i = min(i, len(self.counts) - 1)
+        if i == 0:
+            return self.v_min
+        elif i == len(self.counts) - 1:
+            return self.maximum
+        value = self.v_min * 10 ** ((i - 0.5) / self.n_per_decade)
+        return min(value, self.maximum)
+
+    def merge(self, other):
+        """
+        Add the counts of a histogram with the same buckets.
+        """
+        if len(other.counts) != len(self.counts):
+            raise ValueError("histograms have different buckets")
+        with self._lock:
+            self.counts += other.counts
+            self.total += other.total
+            self.maximum = max(self.maximum, other.maximum)
+
+    def to_dict(self):
+        return dict(
+            v_min=self.v_min,
+            v_max=self.v_max,
+            n_per_decade=self.n_per_decade,
+            counts=self.counts.tolist(),
+            total=self.total,
+            max=self.maximum,
+            count=self.count,
+            mean=self.mean,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+        )
+
+
+class AttributeStats:
+    """
+    Counters and histograms of a single attribute.
+    """
+    __slots__ = ("read_latency", "write_time", "n_received", "n_errors",
+                 "n_bytes", "n_event_errors", "n_lost", "n_overflows",
+                 "n_gaps", "max_gap", "drain_period", "n_near_misses",
+                 "n_skipped")
+
+    # event accounting of push attributes, see DAData.event_counters()
+    EVENT_COUNTERS = ("n_event_errors", "n_lost", "n_overflows", "n_gaps",
+                      "max_gap", "drain_period", "n_near_misses")
+
+    def __init__(self):
+        self.read_latency = Histogram()
+        self.write_time = Histogram()
+        self.n_received = 0
+        self.n_errors = 0
+        self.n_bytes = 0
+        self.n_event_errors = 0
+        self.n_lost = 0
+        self.n_overflows = 0
+        self.n_gaps = 0
+        self.max_gap = 0.0
+        self.drain_period = 0.0
+        self.n_near_misses = 0
+        # values not stored by the change filter of a poll attribute
+        self.n_skipped = 0
+
+    def update_events(self, counters):
+        for name in self.EVENT_COUNTERS:
+            setattr(self, name, counters[name])
+
+    def event_counters(self):
+        return {name: getattr(self, name) for name in self.EVENT_COUNTERS}
+
+    def to_dict(self):
+        return dict(
+            read_p50=self.read_latency.percentile(50),
+            read_p99=self.read_latency.percentile(99),
+            write_p99=self.write_time.percentile(99),
+            n_received=self.n_received,
+            n_errors=self.n_errors,
+            n_bytes=self.n_bytes,
+            n_skipped=self.n_skipped,
+            **self.event_counters(),
+        )
+
+
+class Telemetry:
+    """
+    Performance metrics of a recording, per attribute and per stage.
+
+    Stages are 'cycle' (duration of an acquisition cycle), 'write' (hdf5
+    write time of a batch) and 'queue_depth' (batches waiting for the
+    writer). Times are in seconds.
+    """
+    STAGES = ("cycle", "write", "queue_depth")
+
+    def __init__(self):
+        self.attrs = {}
+        self.stages = {
+            "cycle": Histogram(),
+            "write": Histogram(),
+            "queue_depth": Histogram(v_min=1.0, v_max=1e5, n_per_decade=4),
+        }
+        self._lock = threading.Lock()
+
+    def attr(self, attr_key):
+        """
+        Returns
+        -------
+        AttributeStats
+            of attr_key, created on first use
+        """
+        stats = self.attrs.get(attr_key)
+        if stats is None:
+            with self._lock:
+                stats = self.attrs.setdefault(attr_key, AttributeStats())
+        return stats
+
+    def summary(self):
+        """
+        Returns
+        -------
+        dict
+            json serializable summary of all stages and attributes
+        """
+        return dict(
+            stages={
+                name: hist.to_dict() for name, hist in self.stages.items()
+            },
+            attributes={
+                key: stats.to_dict() for key, stats in list(self.attrs.items())
+            },
+        )
+
+
+def merge_summaries(summaries):
+    """
+    Combine the summaries of several data aggregators.
+
+    Parameters
+    ----------
+    summaries : dict
+        {data aggregator: Telemetry.summary()}
+
+    Returns
+    -------
+    dict
+        stages merged across all data aggregators, attribute metrics keyed
+        by '<data aggregator>/<attribute key>'
+    """
+    stages = {}
+    attributes = {}
+    for da, summary in summaries.items():
+        for name, d in summary["stages"].items():
+            hist = Histogram.from_dict(d)
+            if name in stages:
+                stages[name].merge(hist)
+            else:
+                stages[name] = hist
+        for key, d in summary["attributes"].items():
+            attributes[f"{da}/{key}"] = d
+    return dict(
+        stages={name: hist.to_dict() for name, hist in stages.items()},
+        attributes=attributes,
+    )
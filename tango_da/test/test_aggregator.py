@@ -0,0 +1,100 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import logging
+from tango.test_context import DeviceTestContext
+
+from tango_da.DataAggregator import (DAConnectionCache, DataAggregator,
+                                     DAData)
+from tango_da.simulator import Simulator
+from tango_da.telemetry import Telemetry
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+SPECS = [
+    {"name": "x"},
+    {"name": "w", "format": "SPECTRUM", "shape": [8], "dtype": "int32"},
+    {"name": "ev", "rate": 20.0},
+]
+
+
+@pytest.fixture(scope="module")
+def dev_name():
+    context = DeviceTestContext(
+        Simulator, process=True,
+        properties={"attributes": json.dumps(SPECS)}
+    )
+    with context:
+        yield context.get_device_access()
+
+
+class _Aggregator:
+    """
+    The recording internals of a DataAggregator, without the tango device:
+    its pipes need a database.
+    """
+    _attr_configs = DataAggregator._attr_configs
+    _drain_control = DataAggregator._drain_control
+    _connect = DataAggregator._connect
+
+    _size_buffer_stream = 100
+    _poll_period = 1.0
+    _read_timeout = 3.0
+    event_mode = "buffer"
+    push_buffer_size = 64.0
+    drain_adaptive = True
+    drain_period_min = 0.01
+    drain_period_max = 0.0
+    drain_high_water = 0.5
+    drain_low_water = 0.1
+
+    def __init__(self, dev_name, poll=(), push=()):
+        self._var_run = ("Run Attributes", [])
+        self._var_poll = ("Polled Attributes", self._entries(dev_name, poll))
+        self._var_push = ("Pushed Attributes", self._entries(dev_name, push))
+        self._cache = DAConnectionCache()
+        self._executor = ThreadPoolExecutor(max_workers=4)
+        self._telemetry = Telemetry()
+        self._proxy_handles = []
+        self.status = ""
+
+    @staticmethod
+    def _entries(dev_name, attrs):
+        return [
+            {"name": attr_name, "value": [dev_name, attr_name, "da", ""]}
+            for attr_name in attrs
+        ]
+
+    def connect(self):
+        return asyncio.run(self._connect())
+
+    def close(self):
+        self._cache.evict()
+        self._executor.shutdown()
+
+    def debug_stream(self, msg):
+        log_root.debug(msg)
+
+    def warn_stream(self, msg):
+        log_root.warning(msg)
+
+    def set_status(self, status):
+        self.status = status
+
+
+class TestConnect:
+    def test_push_default(self, dev_name):
+        da = _Aggregator(dev_name, poll=["x"], push=["ev"])
+        try:
+            dev_proxies, attr_fail = da.connect()
+            assert attr_fail == []
+            handles = {p.attr_key: p for p in da._proxy_handles}
+            assert handles["ev"].drain is not None
+            assert handles["ev"].drain_period == 1.0
+            assert len(da._cache.handles) == 2
+        finally:
+            da.close()
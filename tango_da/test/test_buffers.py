@@ -0,0 +1,37 @@
+import numpy as np
+
+import pytest
+import logging
+
+from tango_da.buffers import RingBuffer
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+class TestRingBuffer:
+    def test_drain(self):
+        ring = RingBuffer(4, shape=(3,), dtype=np.int32)
+        for i in range(3):
+            ring.append(np.full(3, i), float(i))
+        timestamp, data = ring.drain()
+        assert timestamp.tolist() == [0.0, 1.0, 2.0]
+        assert data[:, 0].tolist() == [0, 1, 2]
+        assert len(ring) == 0
+
+    def test_overwrite(self):
+        ring = RingBuffer(4)
+        for i in range(10):
+            ring.append(i, float(i))
+        timestamp, data = ring.drain()
+        assert ring.n_overwritten == 6
+        assert data.tolist() == [6, 7, 8, 9]
+        assert timestamp.tolist() == [6.0, 7.0, 8.0, 9.0]
+
+    def test_from_size(self):
+        ring = RingBuffer.from_size(1024 ** 2, shape=(1000,), dtype=np.float64)
+        assert ring.capacity == 1024 ** 2 // 8008
+        ring = RingBuffer.from_size(1024 ** 2, shape=(1000,), dtype=np.float64,
+                                    rate=10.0, period=3.0)
+        assert ring.capacity == 60
+        log_root.info(f"ring buffer of {ring.nbytes} bytes")
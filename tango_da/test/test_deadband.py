@@ -0,0 +1,67 @@
+import numpy as np
+import logging
+
+from tango_da.deadband import ChangeFilter
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+def _rows(values, t_start=0.0):
+    t_new = t_start + np.arange(len(values), dtype=float).reshape(-1, 1)
+    return t_new, np.asarray(values)
+
+
+class TestChangeFilter:
+    def test_from_options(self):
+        assert ChangeFilter.from_options({}) is None
+        assert ChangeFilter.from_options({"poll_period": 1.0}) is None
+        assert ChangeFilter.from_options({"store": "change"}) is not None
+        change_filter = ChangeFilter.from_options(
+            {"deadband_rel": 0.01, "heartbeat": 60}
+        )
+        assert change_filter.settings() == {
+            'storage_mode': "change",
+            'deadband_abs': 0.0,
+            'deadband_rel': 0.01,
+            'heartbeat': 60.0,
+        }
+
+    def test_change_only(self):
+        change_filter = ChangeFilter()
+        t_new, d_new = change_filter.apply(*_rows([1, 1, 2, 2, 2, 1]))
+        assert np.array_equal(t_new[:, 0], [0, 2, 5])
+        assert np.array_equal(d_new, [1, 2, 1])
+        assert change_filter.n_skipped == 3
+
+    def test_deadband(self):
+        change_filter = ChangeFilter(deadband_abs=0.5)
+        _, d_new = change_filter.apply(*_rows([0.0, 0.4, 0.6, 1.0, 1.2]))
+        assert np.array_equal(d_new, [0.0, 0.6, 1.2])
+
+        change_filter = ChangeFilter(deadband_rel=0.1)
+        _, d_new = change_filter.apply(*_rows([100.0, 109.0, 111.0, 115.0]))
+        assert np.array_equal(d_new, [100.0, 111.0])
+
+    def test_heartbeat(self):
+        change_filter = ChangeFilter(heartbeat=3.0)
+        t_new, _ = change_filter.apply(*_rows([5] * 8))
+        log_root.info(f"{t_new[:, 0]}")
+        assert np.array_equal(t_new[:, 0], [0, 3, 6])
+
+        # state is kept across batches
+        t_new, _ = change_filter.apply(*_rows([5, 5, 5], t_start=8.0))
+        assert np.array_equal(t_new[:, 0], [9])
+
+    def test_spectrum_nan(self):
+        change_filter = ChangeFilter(deadband_abs=1.0)
+        values = [[0.0, 0.0], [0.5, 0.5], [0.5, np.nan], [0.5, np.nan],
+                  [0.5, 2.0]]
+        _, d_new = change_filter.apply(*_rows(values))
+        assert len(d_new) == 3
+        assert np.isnan(d_new[1, 1])
+
+        # values that aren't numbers are stored if they differ
+        change_filter = ChangeFilter(deadband_abs=1.0)
+        _, d_new = change_filter.apply(*_rows(["a", "a", "b"]))
+        assert list(d_new) == ["a", "b"]
@@ -0,0 +1,47 @@
+import numpy as np
+import logging
+
+from tango_da.decimation import Decimator
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+class TestDecimator:
+    def test_bins_across_batches(self):
+        decimator = Decimator(1.0)
+        t = (np.arange(30) / 10.0 + 0.05).reshape(-1, 1)
+        d = np.arange(30, dtype=float)
+
+        t_bins, d_bins = decimator.update(t[:15], d[:15])
+        assert np.array_equal(t_bins[:, 0], [0.0])
+        assert np.array_equal(d_bins[0], [0, 9, 4.5, 10])
+
+        t_bins, d_bins = decimator.update(t[15:], d[15:])
+        assert np.array_equal(t_bins[:, 0], [1.0])
+        assert np.array_equal(d_bins[0], [10, 19, 14.5, 10])
+
+        t_bins, d_bins = decimator.finish()
+        assert np.array_equal(t_bins[:, 0], [2.0])
+        assert np.array_equal(d_bins[0], [20, 29, 24.5, 10])
+        assert len(decimator.finish()[0]) == 0
+
+    def test_late_and_nan(self):
+        decimator = Decimator(10.0)
+        decimator.update(np.array([[12.0], [15.0]]), np.array([1.0, np.nan]))
+        # a value older than the open bin is counted in the open bin
+        t_bins, d_bins = decimator.update(np.array([[8.0], [21.0]]),
+                                          np.array([5.0, 0.0]))
+        log_root.info(f"{d_bins}")
+        assert np.array_equal(t_bins[:, 0], [10.0])
+        assert np.array_equal(d_bins[0], [1.0, 5.0, 3.0, 2])
+
+    def test_spectrum(self):
+        decimator = Decimator(1.0, shape=(3,))
+        t = np.array([[0.1], [0.2], [1.5]])
+        d = np.array([[0, 1, 2], [2, 3, np.nan], [0, 0, 0]])
+        t_bins, d_bins = decimator.update(t, d)
+        assert d_bins.shape == (1, 4, 3)
+        assert np.array_equal(d_bins[0, 2], [1, 2, 2])
+        assert np.array_equal(d_bins[0, 3], [2, 2, 1])
+        assert decimator.update(t[:0], d[:0])[1].shape == (0, 4, 3)
@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+
+import numpy as np
+import logging
+
+from tango_da.DataAggregator import DAData
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+def _attr_value(value, t):
+    return SimpleNamespace(
+        value=value, dim_x=1, dim_y=0, has_failed=False,
+        data_format=SimpleNamespace(name="SCALAR"),
+        time=SimpleNamespace(totime=lambda: t),
+    )
+
+
+class _Proxy:
+    def __init__(self):
+        self.events = []
+
+    def read_attribute(self, attr_name):
+        return _attr_value(0.0, 0.0)
+
+    def subscribe_event(self, attr_name, event_type, cb_or_size):
+        return 1
+
+    def get_events(self, event_id):
+        events, self.events = self.events, []
+        return events
+
+    def push(self, value, t, err=False):
+        self.events.append(
+            SimpleNamespace(err=err, attr_value=_attr_value(value, t))
+        )
+
+
+class TestEvents:
+    def test_buffer_accounting(self):
+        proxy = _Proxy()
+        p_handle = DAData("sys/dev/1/x", "x", "push_attribute",
+                          size_buffer=4, dev_proxy=proxy,
+                          options={"max_gap": 1.5})
+        for t in (1.0, 2.0, 5.0):
+            proxy.push(t, t)
+        proxy.push(0.0, 0.0, err=True)
+        t_new, d_new = p_handle.get_batch()
+        assert np.array_equal(t_new[:, 0], [1.0, 2.0, 5.0])
+        assert p_handle.n_event_errors == 1
+        assert p_handle.n_overflows == 1
+        assert p_handle.n_gaps == 1
+
+        # gaps are detected across drains
+        proxy.push(9.0, 9.0)
+        p_handle.get_batch()
+        counters = p_handle.event_counters()
+        log_root.info(f"{counters}")
+        assert counters["n_gaps"] == 2
+        assert counters["max_gap"] == 4.0
+        assert counters["n_overflows"] == 1
+
+        p_handle.reset()
+        assert p_handle.event_counters()["n_gaps"] == 0
+
+    def test_callback_lost(self):
+        proxy = _Proxy()
+        p_handle = DAData("sys/dev/1/x", "x", "push_attribute",
+                          dev_proxy=proxy, event_mode="callback",
+                          size_ring=1024, options={"rate": 1.0},
+                          drain_period=1.0)
+        for t in range(5):
+            p_handle.push_event(
+                SimpleNamespace(err=False, attr_value=_attr_value(t, t))
+            )
+        p_handle.push_event(SimpleNamespace(err=True))
+        t_new, _ = p_handle.get_batch()
+        assert len(t_new) == p_handle.ring.capacity
+        assert p_handle.n_lost == 5 - p_handle.ring.capacity
+        assert p_handle.n_event_errors == 1
+
+    def test_adaptive_drain(self):
+        proxy = _Proxy()
+        p_handle = DAData("sys/dev/1/x", "x", "push_attribute",
+                          size_buffer=10, dev_proxy=proxy,
+                          options={"rate": 10.0}, drain_period=2.0,
+                          drain_control=dict(period_min=0.1, period_max=2.0))
+        # the rate limits the first period to half a buffer
+        assert p_handle.drain_period == 0.5
+        for t in range(10):
+            proxy.push(float(t), 0.1 * t)
+        p_handle.get_batch()
+        counters = p_handle.event_counters()
+        assert counters["n_near_misses"] == 1
+        assert counters["drain_period"] < 0.5
+
+        # idle drains lengthen the period up to its maximum
+        for _ in range(10):
+            p_handle.get_batch()
+        assert p_handle.event_counters()["drain_period"] == 2.0
+
+        p_handle.reset()
+        assert p_handle.event_counters()["n_near_misses"] == 0
+
+    def test_reset_reads_shape(self):
+        proxy = _Proxy()
+        values = [np.zeros(3)]
+
+        def read_attribute(attr_name):
+            value = values[-1]
+            return SimpleNamespace(
+                value=value, dim_x=len(value), dim_y=0, has_failed=False,
+                data_format=SimpleNamespace(name="SPECTRUM"),
+                time=SimpleNamespace(totime=lambda: 1.0),
+            )
+
+        proxy.read_attribute = read_attribute
+        p_handle = DAData("sys/dev/1/x", "x", "poll_attribute",
+                          dev_proxy=proxy)
+        assert p_handle.data_shape == (1, 3)
+        # the spectrum changes its length between two runs
+        values.append(np.ones(5))
+        p_handle.reset()
+        assert p_handle.data_shape == (1, 5)
+        t_new, d_new = p_handle.get_batch()
+        assert d_new.shape == (1, 5)
+
+    def test_read_timeout(self):
+        proxy = _Proxy()
+        timeouts = []
+        proxy.set_timeout_millis = timeouts.append
+        DAData("sys/dev/1/x", "x", "poll_attribute", dev_proxy=proxy,
+               timeout=3.0)
+        assert timeouts == [3000]
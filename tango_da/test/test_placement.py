@@ -0,0 +1,46 @@
+import pytest
+import logging
+
+from tango_da.placement import assign, capacity_from_run, estimate_load
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+class TestPlacement:
+    def test_balance(self):
+        loads = {"a": 8.0, "b": 7.0, "c": 6.0, "d": 5.0, "e": 4.0}
+        placement, load = assign(loads, ["da1", "da2"])
+        log_root.info(f"{placement}, {load}")
+        assert set(placement) == set(loads)
+        assert sum(load.values()) == sum(loads.values())
+        assert max(load.values()) - min(load.values()) <= 4.0
+
+    def test_pinned(self):
+        loads = {"a": 10.0, "b": 1.0, "c": 1.0}
+        placement, load = assign(loads, ["da1", "da2"], pinned={"a": "da1"})
+        assert placement == {"a": "da1", "b": "da2", "c": "da2"}
+        assert load == {"da1": 10.0, "da2": 2.0}
+
+    def test_capacity(self):
+        loads = {k: 1.0 for k in "abcdef"}
+        _, load = assign(loads, ["da1", "da2"],
+                         capacity={"da1": 2.0, "da2": 1.0})
+        assert load == {"da1": 4.0, "da2": 2.0}
+
+    def test_empty_pool(self):
+        with pytest.raises(ValueError):
+            assign({"a": 1.0}, [])
+
+    def test_capacity_from_run(self):
+        capacity = capacity_from_run(
+            {"da1": 100.0, "da2": 100.0, "da3": 0.0},
+            {"da1": 0.25, "da2": 0.5}
+        )
+        assert capacity["da1"] == pytest.approx(4.0 / 3.0)
+        assert capacity["da2"] == pytest.approx(2.0 / 3.0)
+        assert capacity["da3"] == pytest.approx(1.0)
+
+    def test_estimate_load(self):
+        assert estimate_load(1000, 0.0) == 0.0
+        assert estimate_load(1000, 2.0) > 2000.0
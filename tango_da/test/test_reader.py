@@ -0,0 +1,185 @@
+import os
+
+import numpy as np
+import pytest
+import logging
+
+from tango_da.reader import DAReader, INDEX_SUFFIX, RunReader, TimeIndex
+from tango_da.storage import create_storage
+from tango_da.test.test_storage import _Logger, _handle
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+def _record(path, n_rows=1000, **kwargs):
+    """
+    Record a spectrum with timestamps 0.0, 0.1, ... in chunks of 64 rows.
+    """
+    p_handle = _handle("spectrum", "poll_attribute", (4,),
+                       options={"chunk_rows": 64})
+    storage = create_storage("hdf5", str(path), "da", _Logger(), **kwargs)
+    storage.open_run([p_handle], t_start=0.0)
+    t_new = np.arange(1, n_rows, dtype=float).reshape(-1, 1) / 10.0
+    d_new = np.repeat(t_new, 4, axis=1)
+    for i in range(0, len(t_new), 100):
+        storage.append(p_handle, t_new[i:i + 100], d_new[i:i + 100])
+        storage.flush()
+        if storage.rollover_due():
+            storage.rollover()
+    return storage
+
+
+class TestReader:
+    def test_time_index(self):
+        index = TimeIndex([0.0, 10.0, 20.0], 10, 25)
+        assert index.rows() == (0, 25)
+        assert index.rows(12.0, 15.0) == (10, 20)
+        assert index.rows(10.0, 20.0) == (10, 20)
+        assert index.rows(-5.0, 1.0) == (0, 10)
+        assert index.rows(30.0) == (20, 25)
+
+    def test_read_range(self, tmp_path):
+        _record(tmp_path).close()
+        with DAReader(str(tmp_path / "da_1.h5")) as reader:
+            assert reader.keys() == ["spectrum"]
+            index = reader.index("spectrum")
+            assert index.n_block == 64
+            assert index.n_valid == 1000
+
+            window = reader.read("spectrum", 30.0, 60.0)
+            timestamp = window.timestamp
+            assert len(window) == 300
+            assert timestamp[0] == pytest.approx(30.0)
+            assert timestamp[-1] == pytest.approx(59.9)
+            assert np.array_equal(window.data[:, 0], timestamp)
+
+            chunks = list(window.iter_chunks())
+            assert sum(len(t) for t, _ in chunks) == 300
+            # all but the first chunk start at a chunk boundary
+            i_row = window.i_start + len(chunks[0][0])
+            assert i_row % 64 == 0
+
+            assert len(reader.read("spectrum")) == 1000
+            assert len(reader.read("spectrum", 200.0)) == 0
+            assert len(reader.read("spectrum", t_stop=0.0)) == 0
+        assert os.path.exists(tmp_path / ("da_1.h5" + INDEX_SUFFIX))
+
+        # the cached index is used
+        with DAReader(str(tmp_path / "da_1.h5")) as reader:
+            assert "spectrum" in reader._indices
+            assert len(reader.read("spectrum", 30.0, 60.0)) == 300
+
+    def test_read_while_recording(self, tmp_path):
+        storage = _record(tmp_path)
+        storage.flush(force=True)
+        with DAReader(str(tmp_path / "da_1.h5"), cache_index=False) as reader:
+            assert not reader.closed
+            # preallocated rows beyond n_valid are not read
+            assert reader.index("spectrum").n_valid == 1000
+            assert len(reader.read("spectrum", 90.0)) == 100
+        storage.close()
+
+    def test_master_file(self, tmp_path):
+        _record(tmp_path, rollover_size=4096).close()
+        with DAReader(str(tmp_path / "da_master.h5")) as reader:
+            window = reader.read("spectrum", 30.0, 60.0)
+            assert len(window) == 300
+            assert window.timestamp[0] == pytest.approx(30.0)
+
+
+def _record_da(path, name, handles, t_new, **kwargs):
+    storage = create_storage("hdf5", str(path), name, _Logger(), **kwargs)
+    storage.open_run(handles, t_start=0.0)
+    for i in range(0, len(t_new), 10):
+        for p_handle in handles:
+            if p_handle.attr_type == "run_attribute":
+                continue
+            t_batch = t_new[i:i + 10]
+            d_batch = np.repeat(t_batch, p_handle.data_shape[1], axis=1)
+            storage.append(p_handle, t_batch, d_batch)
+        if storage.rollover_due():
+            storage.rollover()
+    storage.close()
+
+
+class TestRunReader:
+    @pytest.fixture
+    def dir_run(self, tmp_path):
+        # da_a: rollover with master file, da_b: a single file
+        t_new = np.arange(1, 100, dtype=float).reshape(-1, 1)
+        _record_da(tmp_path, "da_a", [
+            _handle("serial", "run_attribute", (1,)),
+            _handle("fast", "push_attribute", (1,)),
+            _handle("table", "poll_attribute", (2,)),
+        ], t_new, rollover_size=512)
+        _record_da(tmp_path, "da_b", [
+            _handle("slow", "poll_attribute", (1,)),
+            _handle("table", "poll_attribute", (2,)),
+        ], t_new[::10] + 0.5)
+        return tmp_path
+
+    def test_catalog(self, dir_run):
+        with RunReader(str(dir_run)) as run:
+            assert list(run.files) == ["da_a", "da_b"]
+            assert run.files["da_a"][0].endswith("da_a_master.h5")
+            assert sorted(run.keys()) == [
+                "da_a/table", "da_b/table", "fast", "slow"
+            ]
+            assert "serial" in run.run_attributes()
+
+            timestamp, data = run.read("fast", 10.0, 20.0)
+            assert np.array_equal(timestamp, np.arange(10.0, 20.0))
+            assert data.shape == (10, 1)
+
+    def test_align(self, dir_run):
+        grid = np.arange(10.0, 40.0, 10.0)
+        with RunReader(str(dir_run)) as run:
+            aligned = run.align(["fast", "slow"], grid, "previous")
+            assert np.array_equal(aligned["fast"][:, 0], grid)
+            assert np.array_equal(aligned["slow"][:, 0], [1.5, 11.5, 21.5])
+
+            aligned = run.align(["slow"], grid, "nearest")
+            assert np.array_equal(aligned["slow"][:, 0], [11.5, 21.5, 31.5])
+
+            aligned = run.align(["fast", "da_b/table"], grid, "mean")
+            assert np.array_equal(aligned["fast"][:, 0], grid + 4.5)
+            assert aligned["da_b/table"].shape == (3, 2)
+
+            # before the first value
+            aligned = run.align(["slow"], [-1.0, -0.5], "previous")
+            assert np.all(np.isnan(aligned["slow"]))
+            with pytest.raises(ValueError):
+                run.align(["slow"], grid, "linear")
+
+
+class TestTail:
+    def test_swmr_tail(self, tmp_path):
+        p_handle = _handle("fast", "push_attribute", (1,))
+        storage = create_storage("hdf5", str(tmp_path), "da", _Logger(),
+                                 swmr=True)
+        storage.open_run([p_handle], t_start=0.0)
+
+        reader = DAReader(str(tmp_path / "da_1.h5"), swmr=True)
+        assert reader.n_valid("fast") == 1
+        tail = reader.tail("fast", from_start=True)
+        timestamp, _ = tail.poll()
+        assert np.array_equal(timestamp, [0.0])
+
+        for i in range(3):
+            t_new = np.arange(1 + 10 * i, 11 + 10 * i, dtype=float)
+            storage.append(p_handle, t_new.reshape(-1, 1),
+                           t_new.reshape(-1, 1))
+            storage.flush(force=True)
+            timestamp, data = tail.poll()
+            assert np.array_equal(timestamp, t_new)
+            assert np.array_equal(data[:, 0], t_new)
+        assert len(tail.poll()[0]) == 0
+        assert len(reader.read("fast", 5.0, 15.0)) == 10
+        assert list(tail.follow(interval=0.01, idle_timeout=0.05)) == []
+        reader.close()
+        storage.close()
+
+        with DAReader(str(tmp_path / "da_1.h5")) as reader:
+            assert reader.closed
+            assert reader.stream_attrs("fast")["n_valid"] == 31
@@ -0,0 +1,83 @@
+import pytest
+import logging
+
+from tango_da.schedule import AdaptivePeriod, Schedule
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+class TestSchedule:
+    def test_multi_rate(self):
+        schedule = Schedule(100.0)
+        schedule.add("fast", 0.5)
+        schedule.add("slow", 2.0)
+
+        served = []
+        for _ in range(6):
+            t_now = schedule.next_deadline()
+            served.append((t_now, schedule.pop_due(t_now)))
+        assert served[0] == (100.0, ["fast", "slow"])
+        assert [t for t, _ in served] == [100.0, 100.5, 101.0, 101.5,
+                                          102.0, 102.5]
+        assert served[4][1] == ["fast", "slow"]
+        assert schedule.n_missed == 0
+
+    def test_no_drift(self):
+        schedule = Schedule(0.0)
+        schedule.add("a", 1.0)
+        # served late, the grid stays in place
+        assert schedule.pop_due(0.3) == ["a"]
+        assert schedule.next_deadline() == 1.0
+        # a cycle that took too long skips ticks
+        assert schedule.pop_due(3.7) == ["a"]
+        assert schedule.missed("a") == 2
+        assert schedule.next_deadline() == 4.0
+
+    def test_empty(self):
+        schedule = Schedule(0.0)
+        assert schedule.next_deadline() == float("inf")
+        with pytest.raises(ValueError):
+            schedule.add("a", 0.0)
+
+    def test_set_period(self):
+        schedule = Schedule(0.0)
+        schedule.add("a", 1.0)
+        schedule.add("b", 1.0)
+        assert schedule.pop_due(0.0) == ["a", "b"]
+        assert schedule.pop_due(1.2) == ["a", "b"]
+        # the grid of 'a' restarts at its last tick
+        schedule.set_period("a", 0.25)
+        assert schedule.next_deadline() == 1.25
+        assert schedule.pop_due(1.25) == ["a"]
+        assert schedule.pop_due(1.6) == ["a"]
+        assert schedule.missed("a") == 0
+        schedule.set_period("a", 2.0)
+        assert schedule.next_deadline() == 2.0
+        assert schedule.pop_due(2.0) == ["b"]
+        assert schedule.pop_due(3.5) == ["a", "b"]
+        assert schedule.n_missed == 0
+        with pytest.raises(ValueError):
+            schedule.set_period("a", -1.0)
+
+
+class TestAdaptivePeriod:
+    def test_adapt(self):
+        drain = AdaptivePeriod(1.0, 0.1, 2.0, high_water=0.5, low_water=0.1)
+        # between the water marks nothing changes
+        assert drain.update(0.3) == 1.0
+        # shortened, so the next drain finds the buffer 30 % full
+        assert drain.update(0.6) == pytest.approx(0.5)
+        assert drain.update(1.0) == pytest.approx(0.15)
+        assert drain.update(1.0) == pytest.approx(0.1)
+        # idle, lengthened up to the maximum
+        for _ in range(10):
+            drain.update(0.0)
+        assert drain.period == 2.0
+
+    def test_bounds(self):
+        assert AdaptivePeriod(5.0, 0.1, 2.0).period == 2.0
+        with pytest.raises(ValueError):
+            AdaptivePeriod(1.0, 0.0, 2.0)
+        with pytest.raises(ValueError):
+            AdaptivePeriod(1.0, 0.1, 2.0, high_water=0.1, low_water=0.5)
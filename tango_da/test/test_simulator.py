@@ -0,0 +1,56 @@
+import json
+
+import numpy as np
+import pytest
+import tango
+import logging
+from tango.test_context import DeviceTestContext
+
+from tango_da.benchmark import run_case
+from tango_da.simulator import Simulator, attribute_spec, simulated_value
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+class TestSimulator:
+    def test_spec(self):
+        spec = attribute_spec({"name": "x"})
+        assert spec["format"] == "SCALAR"
+        assert spec["shape"] == []
+        assert isinstance(simulated_value(spec, 0.0), np.float64)
+
+        spec = attribute_spec({"name": "img", "format": "IMAGE",
+                               "shape": [3, 4], "dtype": "int16"})
+        value = simulated_value(spec, 1.0)
+        assert value.shape == (3, 4)
+        assert value.dtype == np.int16
+        with pytest.raises(ValueError):
+            attribute_spec({"name": "x", "format": "CUBE"})
+
+    def test_device(self):
+        specs = [
+            {"name": "x"},
+            {"name": "w", "format": "SPECTRUM", "shape": [8],
+             "dtype": "int32"},
+            {"name": "bad", "error_rate": 1.0},
+        ]
+        context = DeviceTestContext(
+            Simulator, process=True,
+            properties={"attributes": json.dumps(specs)}
+        )
+        with context:
+            device = context.device
+            assert isinstance(device.x, float)
+            assert device.w.shape == (8,)
+            with pytest.raises(tango.DevFailed):
+                device.bad
+            assert device.n_reads == 3
+
+    def test_benchmark_case(self):
+        report = run_case(4, 16, duration=1.0, poll_period=0.1,
+                          n_devices=2)
+        log_root.info(f"{report}")
+        assert report["samples_s"] > 0
+        assert report["n_errors"] == 0
+        assert report["cycle_p99_ms"] > 0
@@ -0,0 +1,210 @@
+import json
+import os
+
+import h5py
+import numpy as np
+import pytest
+import logging
+
+from tango_da.storage import HDF5Storage, StorageBackend, create_storage
+from tango_da.worker import DAWorkerHandle
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+class _Logger:
+    def debug_stream(self, msg):
+        log_root.debug(msg)
+
+    def info_stream(self, msg):
+        log_root.info(msg)
+
+    def warn_stream(self, msg):
+        log_root.warning(msg)
+
+
+def _handle(attr_key, attr_type, shape, dtype=float, options=None):
+    dtype = np.dtype(dtype)
+    data_shape = (1,) + shape
+    return DAWorkerHandle(dict(
+        attr_id=f"sys/tg_test/1/{attr_key}", attr_key=attr_key,
+        attr_type=attr_type, options=options or {}, size_buffer=100,
+        data_format="SCALAR" if shape == (1,) else "SPECTRUM",
+        data_type=str if dtype.hasobject else dtype, data_shape=data_shape,
+        store_dtype=dtype, row_size=max(dtype.itemsize, 8) * np.prod(shape),
+        first=(np.zeros((1, 1)), np.zeros(data_shape, dtype=dtype)),
+        i_worker=0,
+    ))
+
+
+def _batch(n, i_start, shape, dtype=float):
+    t_new = np.arange(i_start, i_start + n, dtype=float).reshape(-1, 1)
+    d_new = np.ones((n,) + shape, dtype=dtype) * i_start
+    return t_new, d_new
+
+
+def _record(backend, path, n_batches=10, **kwargs):
+    handles = [
+        _handle("serial", "run_attribute", (1,), options={}),
+        _handle("spectrum", "poll_attribute", (16,),
+                options={"chunk_rows": 8}),
+        _handle("scalar", "push_attribute", (1,), dtype=np.int32),
+    ]
+    storage = create_storage(
+        backend, str(path), "da", _Logger(),
+        file_attrs={"poll_period": 1.0},
+        stream_attrs=lambda p: {"n_gaps": 0}, **kwargs
+    )
+    storage.open_run(handles, t_start=0.0)
+    for i in range(n_batches):
+        for p_handle in handles[1:]:
+            storage.append(p_handle,
+                           *_batch(5, 1 + 5 * i, p_handle.data_shape[1:],
+                                   p_handle.store_dtype))
+        storage.flush()
+        if storage.rollover_due():
+            storage.rollover()
+    storage.close()
+    return storage
+
+
+class TestStorage:
+    def test_hdf5(self, tmp_path):
+        storage = _record("hdf5", tmp_path)
+        assert storage.segments == [str(tmp_path / "da_1.h5")]
+        with h5py.File(storage.segments[0], "r") as f:
+            group = f["data_recorded/spectrum"]
+            assert group["data"].shape == (51, 16)
+            assert group.attrs["n_valid"] == 51
+            assert group.attrs["n_gaps"] == 0
+            assert f["data_recorded/scalar/data"].dtype == np.int32
+            assert "serial" in f["data_run"]
+            assert f.attrs["poll_period"] == 1.0
+            assert "time_stop" in f.attrs
+        assert not os.path.exists(tmp_path / "da_master.h5")
+
+    def test_hdf5_next_number(self, tmp_path):
+        _record("hdf5", tmp_path)
+        storage = _record("hdf5", tmp_path)
+        assert storage.segments == [str(tmp_path / "da_2.h5")]
+
+    @pytest.mark.parametrize("swmr", [False, True])
+    def test_hdf5_rollover(self, tmp_path, swmr):
+        storage = _record("hdf5", tmp_path, rollover_size=1024, swmr=swmr)
+        log_root.info(f"segments {storage.segments}")
+        assert len(storage.segments) > 1
+        with h5py.File(tmp_path / "da_master.h5", "r") as f:
+            timestamp = f["data_recorded/spectrum/timestamp"][:, 0]
+            assert len(timestamp) == 51
+            assert np.all(np.diff(timestamp) > 0)
+
+    def test_parquet(self, tmp_path):
+        pq = pytest.importorskip("pyarrow.parquet")
+        storage = _record("parquet", tmp_path)
+        dir_segment = tmp_path / "da_1.parquet"
+        assert storage.segments == [str(dir_segment)]
+
+        pq_file = pq.ParquetFile(dir_segment / "data_recorded/spectrum.parquet")
+        assert pq_file.metadata.num_rows == 51
+        assert pq_file.metadata.num_row_groups > 1
+        table = pq_file.read()
+        field = table.schema.field("data")
+        assert json.loads(field.metadata[b"shape"]) == [16]
+        data = np.stack(table.column("data").to_numpy(zero_copy_only=False))
+        assert data.shape == (51, 16)
+
+        table = pq.read_table(dir_segment / "data_recorded/scalar.parquet")
+        assert str(table.schema.field("data").type) == "int32"
+        with open(dir_segment / "attrs.json") as f:
+            attrs = json.load(f)
+        assert attrs["data_recorded"]["spectrum"]["n_valid"] == 51
+        assert attrs["file"]["poll_period"] == 1.0
+        assert "serial" in attrs["data_run"]
+        assert storage.size_closed > 0
+
+    def test_unknown_backend(self, tmp_path):
+        with pytest.raises(ValueError):
+            create_storage("csv", str(tmp_path), "da", _Logger())
+
+    def test_incomplete_backend(self, tmp_path):
+        class NoFlush(StorageBackend):
+            file_size = HDF5Storage.file_size
+            _open_segment = HDF5Storage._open_segment
+            _write_run = HDF5Storage._write_run
+            _create_stream = HDF5Storage._create_stream
+            _append = HDF5Storage._append
+            _close_segment = HDF5Storage._close_segment
+
+        with pytest.raises(TypeError):
+            NoFlush(str(tmp_path), "da", _Logger())
+
+    def test_packed_table(self, tmp_path):
+        from tango_da.DataAggregator import DAPackedTable
+
+        columns = [
+            _handle(f"gauge_{i}", "poll_attribute", (1,), dtype=dtype)
+            for i, dtype in enumerate((float, np.int32, bool))
+        ]
+        table = DAPackedTable("scalars_1s", columns, 1.0)
+        storage = create_storage(
+            "hdf5", str(tmp_path), "da", _Logger(),
+            stream_attrs=lambda p: p.stream_attrs()
+        )
+        storage.open_run([table], t_start=0.0)
+        for i in range(1, 4):
+            for j, p_handle in enumerate(columns):
+                if i == 2 and j == 1:
+                    continue
+                table.put(p_handle.attr_key, np.array([[i + 0.1 * j]]),
+                          np.array([[i]], dtype=p_handle.store_dtype))
+            storage.append(table, *table.pop_row())
+        storage.close()
+
+        with h5py.File(tmp_path / "da_1.h5", "r") as f:
+            group = f["data_recorded/scalars_1s"]
+            data = group["data"][()]
+            assert data.shape == (4, 3)
+            assert np.isnan(data[2, 1])
+            assert data[3, 2] == 1.0
+            assert group["timestamp"][1, 0] == pytest.approx(1.1)
+            assert list(group.attrs["columns"]) == [
+                "gauge_0", "gauge_1", "gauge_2"
+            ]
+            assert list(group.attrs["column_dtypes"]) == [
+                "float64", "int32", "bool"
+            ]
+
+    @pytest.mark.parametrize("rollover_size", [0, 1024])
+    def test_decimated_stream(self, tmp_path, rollover_size):
+        from tango_da.DataAggregator import DADecimatedStream
+
+        p_handle = _handle("scalar", "push_attribute", (1,))
+        stream = DADecimatedStream(p_handle, 10.0)
+        handles = [p_handle, stream]
+        storage = create_storage(
+            "hdf5", str(tmp_path), "da", _Logger(),
+            rollover_size=rollover_size,
+            stream_attrs=lambda p: getattr(p, "stream_attrs", dict)()
+        )
+        storage.open_run(handles, t_start=0.0)
+        for i in range(10):
+            t_new = np.arange(5 * i, 5 * i + 5, dtype=float).reshape(-1, 1)
+            d_new = t_new.copy()
+            storage.append(p_handle, t_new, d_new)
+            storage.append(stream, *stream.update(t_new, d_new))
+            if storage.rollover_due():
+                storage.rollover()
+        storage.append(stream, *stream.finish())
+        storage.close()
+
+        name = "da_master.h5" if rollover_size else "da_1.h5"
+        with h5py.File(tmp_path / name, "r") as f:
+            group = f["data_recorded/scalar/decimated_10s"]
+            assert group.attrs["source"] == "scalar"
+            data = group["data"][()]
+            log_root.info(f"{data}")
+            assert np.array_equal(group["timestamp"][:, 0],
+                                  [0, 10, 20, 30, 40])
+            # min, max, mean, count
+            assert np.array_equal(data[1], [10, 19, 14.5, 10])
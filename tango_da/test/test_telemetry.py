@@ -0,0 +1,44 @@
+import json
+
+import numpy as np
+import pytest
+import logging
+
+from tango_da.telemetry import Histogram, Telemetry, merge_summaries
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+class TestTelemetry:
+    def test_percentiles(self):
+        hist = Histogram()
+        values = np.random.default_rng(1).uniform(1e-3, 1e-1, 10000)
+        for value in values:
+            hist.record(value)
+        assert hist.count == len(values)
+        assert hist.mean == pytest.approx(values.mean())
+        for q in (50, 90, 99):
+            exact = np.percentile(values, q)
+            log_root.info(f"p{q}: {hist.percentile(q)} vs {exact}")
+            assert hist.percentile(q) == pytest.approx(exact, rel=0.2)
+
+    def test_out_of_range(self):
+        hist = Histogram(v_min=1e-3, v_max=1.0)
+        hist.record(0.0)
+        hist.record(1e6)
+        assert hist.counts[0] == 1 and hist.counts[-1] == 1
+        assert hist.percentile(100) == 1e6
+        assert Histogram().percentile(50) == 0.0
+
+    def test_merge_summaries(self):
+        summaries = {}
+        for da, value in (("da_1", 0.01), ("da_2", 1.0)):
+            telemetry = Telemetry()
+            telemetry.stages["cycle"].record(value)
+            telemetry.attr("x").n_received += 3
+            summaries[da] = json.loads(json.dumps(telemetry.summary()))
+        merged = merge_summaries(summaries)
+        assert merged["stages"]["cycle"]["count"] == 2
+        assert merged["stages"]["cycle"]["max"] == 1.0
+        assert merged["attributes"]["da_2/x"]["n_received"] == 3
@@ -0,0 +1,81 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+import logging
+
+from tango_da.worker import (DAWorkerHandle, DAWorkerPool, pack_batch, shard,
+                             unpack_batch)
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+class TestWorker:
+    def test_shard_keeps_devices(self):
+        configs = [
+            (f"{dev}_{i}", f"sys/{dev}/1/attr_{i}", "poll_attribute", {}, {})
+            for dev in ("a", "b", "c") for i in range(3)
+        ]
+        shards = shard(configs, 2)
+        log_root.info(f"{[[c[0] for c in s] for s in shards]}")
+        assert len(shards) == 2
+        assert sorted(sum(shards, [])) == sorted(configs)
+        for s in shards:
+            devs = {c[1].rsplit("/", 1)[0] for c in s}
+            for c in configs:
+                if c[1].rsplit("/", 1)[0] in devs:
+                    assert c in s
+
+    def test_shard_no_empty(self):
+        configs = [("x", "sys/a/1/x", "poll_attribute", {}, {})]
+        assert len(shard(configs, 4)) == 1
+
+    def test_pack_roundtrip(self):
+        batch = [
+            ("scalar", np.arange(3.0).reshape(3, 1), np.arange(3)),
+            ("image", np.ones((2, 1)), np.ones((2, 4, 5), dtype=np.uint16)),
+            ("str", np.zeros((1, 1)), np.array(["abc"], dtype=object)),
+        ]
+        shm = shared_memory.SharedMemory(create=True, size=4096)
+        try:
+            specs = pack_batch(shm.buf, batch)
+            assert specs[2][2][0] == "obj"
+            unpacked = unpack_batch(shm.buf, specs)
+        finally:
+            shm.close()
+            shm.unlink()
+        for (k, t, d), (k_u, t_u, d_u) in zip(batch, unpacked):
+            assert k == k_u
+            assert np.array_equal(t, t_u) and np.array_equal(d, d_u)
+            assert d.dtype == d_u.dtype
+
+    def test_pack_overflow(self):
+        batch = [("big", np.zeros((1, 1)), np.zeros(1000))]
+        specs = pack_batch(memoryview(bytearray(64)), batch)
+        assert specs[0][1][0] == "shm"
+        assert specs[0][2][0] == "obj"
+
+    def test_handle_first_value(self):
+        meta = dict(
+            attr_id="sys/tg_test/1/double_scalar", attr_key="ds",
+            attr_type="poll_attribute", options={}, size_buffer=1000,
+            data_format="SCALAR", data_type=float, data_shape=(1, 1),
+            store_dtype=np.dtype(float), row_size=8,
+            first=(np.ones((1, 1)), np.ones(1)), i_worker=0,
+        )
+        p_handle = DAWorkerHandle(meta)
+        assert p_handle.attr_name == "double_scalar"
+        assert p_handle.data_shape_max == (None, 1)
+        assert len(p_handle.get_batch()[0]) == 1
+        assert len(p_handle.get_batch()[0]) == 0
+
+    def test_connect_timeout(self):
+        pool = DAWorkerPool(
+            [[], []], dict(poll_period=1.0, read_timeout=1.0, read_workers=1),
+            size_shm=1024 ** 2
+        )
+        # spawning a worker takes longer than that
+        with pytest.raises(RuntimeError, match=r"workers \[0, 1\]"):
+            pool.connect(timeout=0.001)
+        assert not any(p.is_alive() for p in pool._processes)
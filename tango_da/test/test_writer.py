@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+import logging
+
+from tango_da.writer import DAWriter
+
+logging.basicConfig(level=logging.DEBUG)
+log_root = logging.getLogger(__name__)
+
+
+class TestWriter:
+    @staticmethod
+    def _slow_writer(written, gate):
+        def write_batch(batch):
+            gate.wait()
+            written.append(batch)
+        return write_batch
+
+    def test_block(self):
+        written = []
+        writer = DAWriter(written.append, size_queue=2)
+        writer.start()
+        for i in range(20):
+            writer.put(i)
+        writer.stop()
+        assert written == list(range(20))
+
+    def test_drop_oldest(self):
+        written, gate = [], threading.Event()
+        writer = DAWriter(self._slow_writer(written, gate),
+                          size_queue=2, policy="drop_oldest")
+        for i in range(10):
+            writer.put(i)
+        writer.start()
+        gate.set()
+        writer.stop()
+        assert writer.n_dropped == 8
+        assert written == [8, 9]
+
+    def test_spill_keeps_order(self, tmp_path):
+        written, gate = [], threading.Event()
+        writer = DAWriter(self._slow_writer(written, gate),
+                          size_queue=2, policy="spill",
+                          dir_spill=str(tmp_path / "spill"))
+        writer.start()
+        for i in range(20):
+            writer.put([i])
+        log_root.info(f"queue depth {writer.queue_depth}")
+        assert writer.n_spilled > 0
+        gate.set()
+        writer.stop()
+        assert written == [[i] for i in range(20)]
+        assert not (tmp_path / "spill").exists()
+
+    def test_policy(self):
+        with pytest.raises(ValueError):
+            DAWriter(print, policy="spill")
+
+    def test_spill_drains_while_putting(self, tmp_path):
+        written = []
+        writer = DAWriter(written.append, size_queue=1, policy="spill",
+                          dir_spill=str(tmp_path / "spill"))
+        for i in range(50):
+            writer.put([i])
+        assert writer.n_spilled == 49
+        writer.start()
+        # a producer at about 100 batches per second catches up
+        t_start = time.perf_counter()
+        for i in range(50, 100):
+            writer.put([i])
+            time.sleep(0.01)
+        while writer.queue_depth > 0 and time.perf_counter() - t_start < 5:
+            time.sleep(0.01)
+        t_drain = time.perf_counter() - t_start
+        log_root.info(f"drained in {t_drain} s")
+        assert writer.queue_depth == 0
+        assert t_drain < 2.0
+        writer.stop()
+        assert written == [[i] for i in range(100)]
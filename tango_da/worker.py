@@ -0,0 +1,533 @@
+import concurrent.futures
+import math
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .placement import assign
+from .schedule import Schedule
+
+
+# shared memory is aligned to this many bytes per array
+_ALIGN = 64
+
+
+def shard(attr_configs, n_workers):
+    """
+    Split attributes into shards of about equal size. All attributes of a
+    device end up in the same shard, so they can still be read with a single
+    read_attributes() call.
+
+    Parameters
+    ----------
+    attr_configs : list of tuple
+        (attr_key, tango_id, attr_type, options, kwargs)
+    n_workers : int
+
+    Returns
+    -------
+    list of list
+        attr_configs per worker, empty shards are omitted
+    """
+    by_device = {}
+    for config in attr_configs:
+        by_device.setdefault(config[1].rsplit("/", 1)[0], []).append(config)
+    placement, _ = assign(
+        {dev_name: len(configs) for dev_name, configs in by_device.items()},
+        list(range(n_workers))
+    )
+    shards = [[] for _ in range(n_workers)]
+    for dev_name, configs in by_device.items():
+        shards[placement[dev_name]].extend(configs)
+    return [s for s in shards if s]
+
+
+def pack_batch(buf, batch):
+    """
+    Copy the arrays of a batch into a buffer.
+
+    Parameters
+    ----------
+    buf : memoryview
+        e.g. the slot of a shared memory block
+    batch : list of tuple
+        [(attr_key, t_new, d_new), ...]
+
+    Returns
+    -------
+    list of tuple
+        [(attr_key, t_spec, d_spec), ...], picklable description of the
+        batch. An array that doesn't fit into buf or holds python objects is
+        part of its spec instead.
+    """
+    specs = []
+    offset = 0
+    for attr_key, t_new, d_new in batch:
+        spec = []
+        for array in (t_new, d_new):
+            n_bytes = array.nbytes
+            if array.dtype.hasobject or offset + n_bytes > len(buf):
+                spec.append(("obj", array))
+                continue
+            view = np.ndarray(array.shape, array.dtype, buffer=buf,
+                              offset=offset)
+            view[...] = array
+            spec.append(("shm", offset, array.shape, array.dtype.str))
+            offset += math.ceil(n_bytes / _ALIGN) * _ALIGN
+        specs.append((attr_key, spec[0], spec[1]))
+    return specs
+
+
+def unpack_batch(buf, specs):
+    """
+    Inverse of pack_batch(), arrays are copied out of buf.
+
+    Returns
+    -------
+    list of tuple
+        [(attr_key, t_new, d_new), ...]
+    """
+    def extract(spec):
+        if spec[0] == "obj":
+            return spec[1]
+        _, offset, shape, dtype = spec
+        return np.ndarray(shape, dtype, buffer=buf, offset=offset).copy()
+
+    return [
+        (attr_key, extract(t_spec), extract(d_spec))
+        for attr_key, t_spec, d_spec in specs
+    ]
+
+
+class DAWorkerHandle:
+    """
+    Stand-in for the DAData handle of an attribute that is read in a worker
+    process. It carries everything the writing process needs to create and
+    fill the datasets of the attribute.
+    """
+    def __init__(self, meta):
+        self.attr_id = meta["attr_id"]
+        self.attr_key = meta["attr_key"]
+        self.attr_type = meta["attr_type"]
+        self.options = meta["options"]
+        self.dev_name, self.attr_name = self.attr_id.rsplit("/", 1)
+        self.size_buffer = meta["size_buffer"]
+        self.data_format = meta["data_format"]
+        self.data_type = meta["data_type"]
+        self.data_shape = meta["data_shape"]
+        self.store_dtype = meta["store_dtype"]
+        self.row_size = meta["row_size"]
+        self.i_worker = meta["i_worker"]
+        self.last_error = None
+        self._first = meta["first"]
+
+        self.dset_timestamp = None
+        self.dset_data = None
+        self.n_rows = 0
+
+    @property
+    def data_shape_max(self):
+        return (None,) + self.data_shape[1::]
+
+    def get_batch(self):
+        """
+        Returns
+        -------
+        timestamp, data : numpy.ndarray
+            the value read by the worker when connecting, only once
+        """
+        t_first, d_first = self._first
+        self._first = (t_first[:0], d_first[:0])
+        return t_first, d_first
+
+
+class DAWorkerPool:
+    """
+    Read attributes in worker processes, each with a shard of its own.
+
+    Workers connect to their attributes, poll and drain them on the tick grid
+    of their own Schedule, and convert the data to arrays. Batches are handed
+    back through a shared memory block per worker, split into slots. A worker
+    waits for a free slot, so a slow consumer throttles the workers.
+
+    Parameters
+    ----------
+    shards : list of list
+        attr_configs per worker, see shard()
+    settings : dict
+        poll_period, read_timeout, read_workers
+    size_shm : int
+        bytes of shared memory per worker
+    n_slots : int
+        number of batches per worker in flight
+    """
+    def __init__(self, shards, settings, size_shm=64 * 1024 ** 2, n_slots=4,
+                 name="worker"):
+        ctx = multiprocessing.get_context("spawn")
+        self._out_queue = ctx.Queue()
+        self._stop_event = ctx.Event()
+        self._shms = []
+        self._free_slots = []
+        self._cmd_queues = []
+        self._processes = []
+        self._size_slot = max(size_shm // n_slots, _ALIGN)
+        self.n_missed = {}
+        for i_worker, configs in enumerate(shards):
+            shm = shared_memory.SharedMemory(
+                create=True, size=self._size_slot * n_slots
+            )
+            free_slots = ctx.Queue()
+            for i_slot in range(n_slots):
+                free_slots.put(i_slot)
+            cmd_queue = ctx.Queue()
+            self._shms.append(shm)
+            self._free_slots.append(free_slots)
+            self._cmd_queues.append(cmd_queue)
+            self._processes.append(ctx.Process(
+                target=_worker_main,
+                args=(i_worker, configs, settings, shm.name, self._size_slot,
+                      cmd_queue, self._out_queue, free_slots,
+                      self._stop_event),
+                name=f"{name}_{i_worker}",
+                daemon=True
+            ))
+            self.n_missed[i_worker] = 0
+
+    def __len__(self):
+        return len(self._processes)
+
+    def connect(self, timeout=60.0):
+        """
+        Start the workers and wait for them to connect to their attributes.
+
+        Returns
+        -------
+        handles : list of DAWorkerHandle
+        attr_fail : list of str
+            attributes that could not be connected
+
+        Raises
+        ------
+        RuntimeError
+            if a worker failed or didn't connect within timeout seconds, all
+            workers are stopped
+        """
+        for process in self._processes:
+            process.start()
+        handles, attr_fail = [], []
+        t_stop = time.time() + timeout
+        connected = set()
+        while len(connected) < len(self._processes):
+            try:
+                msg = self._out_queue.get(
+                    timeout=max(t_stop - time.time(), 0.0)
+                )
+            except queue.Empty:
+                missing = [
+                    i for i in range(len(self._processes))
+                    if i not in connected
+                ]
+                self.stop()
+                raise RuntimeError(
+                    f"workers {missing} didn't connect within {timeout} s"
+                )
+            if msg[0] == "error":
+                self.stop()
+                raise RuntimeError(f"worker {msg[1]}: {msg[2]}")
+            _, i_worker, metas, fail = msg
+            handles.extend(DAWorkerHandle(meta) for meta in metas)
+            attr_fail.extend(fail)
+            connected.add(i_worker)
+        return handles, attr_fail
+
+    def start(self, t_start):
+        """
+        Let all workers begin recording on the tick grid starting at t_start.
+        """
+        for cmd_queue in self._cmd_queues:
+            cmd_queue.put(("start", t_start))
+
+    def get(self, timeout=None):
+        """
+        Receive the next batch of any worker.
+
+        Returns
+        -------
+        batch : list of tuple or None
+            [(attr_key, t_new, d_new), ...], None if nothing arrived in time
+        stats : dict
+            i_worker, t_cycle, buffer_load (maximum over all push attributes,
+            as of their last drain), error_dev (attributes without data at
+            their last read), errors (attributes that failed in the cycle),
+            latency (read latency per
+            attribute), events (event counters per push attribute), skipped
+            (values skipped by the change filter per attribute, since the
+            start) and n_missed of the cycle
+        """
+        try:
+            msg = self._out_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None, {}
+        if msg[0] == "error":
+            raise RuntimeError(f"worker {msg[1]}: {msg[2]}")
+        if msg[0] == "connected":
+            # late, after connect() gave up on the worker
+            return None, {}
+        _, i_worker, i_slot, specs, stats = msg
+        if i_slot is None:
+            batch = unpack_batch(None, specs)
+        else:
+            i_start = i_slot * self._size_slot
+            buf = self._shms[i_worker].buf[i_start:i_start + self._size_slot]
+            batch = unpack_batch(buf, specs)
+            del buf
+            self._free_slots[i_worker].put(i_slot)
+        self.n_missed[i_worker] = stats["n_missed"]
+        return batch, stats
+
+    def stop(self, timeout=10.0):
+        """
+        Stop all workers.
+
+        Returns
+        -------
+        list
+            (batch, stats) of all batches still in transit
+        """
+        self._stop_event.set()
+        pending = []
+        t_stop = time.time() + timeout
+        while any(p.is_alive() for p in self._processes):
+            if time.time() > t_stop:
+                break
+            batch, stats = self.get(timeout=0.1)
+            if batch is not None:
+                pending.append((batch, stats))
+        while True:
+            batch, stats = self.get(timeout=0.1)
+            if batch is None:
+                break
+            pending.append((batch, stats))
+
+        for process in self._processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self._shms = []
+        return pending
+
+
+# ----------------------------------------------------------------------
+# worker process
+# ----------------------------------------------------------------------
+def _worker_main(i_worker, configs, settings, shm_name, size_slot, cmd_queue,
+                 out_queue, free_slots, stop_event):
+    try:
+        _worker_run(i_worker, configs, settings, shm_name, size_slot,
+                    cmd_queue, out_queue, free_slots, stop_event)
+    except Exception as err:
+        out_queue.put(("error", i_worker, repr(err)))
+
+
+def _worker_run(i_worker, configs, settings, shm_name, size_slot, cmd_queue,
+                out_queue, free_slots, stop_event):
+    import tango
+    from .DataAggregator import DAData, DAGroup
+
+    read_timeout = settings["read_timeout"]
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=settings["read_workers"]
+    )
+
+    # connect
+    dev_proxies = {}
+    handles, metas, attr_fail = [], [], []
+    for attr_key, tango_id, attr_type, options, kwargs in configs:
+        dev_name = tango_id.rsplit("/", 1)[0]
+        try:
+            if dev_name not in dev_proxies:
+                dev_proxy = tango.DeviceProxy(dev_name)
+                dev_proxy.set_timeout_millis(int(read_timeout * 1000))
+                dev_proxies[dev_name] = dev_proxy
+            p_handle = DAData(
+                tango_id, attr_key, attr_type=attr_type,
+                dev_proxy=dev_proxies[dev_name], timeout=read_timeout,
+                options=options, **kwargs
+            )
+        except tango.DevFailed:
+            attr_fail.append(tango_id)
+            continue
+        if attr_type == "run_attribute":
+            first = p_handle.get_batch()
+        else:
+            first = p_handle.unpack(p_handle._d_attr_obj)
+        metas.append(dict(
+            attr_id=p_handle.attr_id,
+            attr_key=attr_key,
+            attr_type=attr_type,
+            options=options,
+            size_buffer=p_handle.size_buffer,
+            data_format=p_handle.data_format,
+            data_type=p_handle.data_type,
+            data_shape=p_handle.data_shape,
+            store_dtype=p_handle.store_dtype,
+            row_size=p_handle.row_size,
+            first=first,
+            i_worker=i_worker,
+        ))
+        if attr_type != "run_attribute":
+            handles.append(p_handle)
+    out_queue.put(("connected", i_worker, metas, attr_fail))
+
+    # wait for the start of the recording
+    t_start = None
+    while t_start is None and not stop_event.is_set():
+        try:
+            _, t_start = cmd_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+
+    handles_by_key = {p.attr_key: p for p in handles}
+    poll_period = settings["poll_period"]
+    schedule = Schedule(t_start or time.time())
+    poll_handles = {}
+    for p in handles:
+        if p.attr_type == "poll_attribute":
+            period = float(p.options.get("poll_period", poll_period))
+            poll_handles.setdefault((p.dev_name, period), []).append(p)
+        else:
+            schedule.add(p, p.drain_period or poll_period)
+    for (dev_name, period), group in poll_handles.items():
+        schedule.add(DAGroup(dev_proxies[dev_name], group), period)
+
+    # buffer load and missing data of every attribute as of its last read,
+    # readers on different periods are due in different cycles
+    loads, no_data = {}, {}
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        while not stop_event.is_set():
+            t_wait = min(schedule.next_deadline() - time.time(), poll_period)
+            if stop_event.wait(max(t_wait, 0.0)):
+                break
+            t_cycle = time.time()
+            readers = schedule.pop_due(t_cycle)
+            batch, buffer_load, error_dev, latency = _read_cycle(
+                executor, readers, read_timeout, DAGroup
+            )
+            for reader in readers:
+                if getattr(reader, "drain", None) is not None:
+                    schedule.set_period(reader, reader.drain.period)
+            loads.update(buffer_load)
+            for attr_key in latency:
+                if attr_key in error_dev:
+                    no_data[attr_key] = True
+                else:
+                    no_data.pop(attr_key, None)
+            stats = dict(
+                i_worker=i_worker,
+                t_cycle=time.time() - t_cycle,
+                buffer_load=max(loads.values(), default=0.0),
+                error_dev=list(no_data),
+                errors=[
+                    key for key in error_dev
+                    if handles_by_key[key].last_error is not None
+                ],
+                latency=latency,
+                events={
+                    p.attr_key: p.event_counters()
+                    for p in handles if p.attr_type == "push_attribute"
+                },
+                skipped={
+                    p.attr_key: p.change_filter.n_skipped
+                    for p in handles if p.change_filter is not None
+                },
+                n_missed=schedule.n_missed,
+            )
+            if not batch:
+                out_queue.put(("batch", i_worker, None, [], stats))
+                continue
+
+            # wait for a free slot, a slow consumer throttles this worker
+            i_slot = None
+            while i_slot is None and not stop_event.is_set():
+                try:
+                    i_slot = free_slots.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            if i_slot is None:
+                specs = pack_batch(memoryview(bytearray()), batch)
+            else:
+                i_start = i_slot * size_slot
+                buf = shm.buf[i_start:i_start + size_slot]
+                specs = pack_batch(buf, batch)
+                del buf
+            out_queue.put(("batch", i_worker, i_slot, specs, stats))
+    finally:
+        for p_handle in handles:
+            p_handle.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+        shm.close()
+
+
+def _read_cycle(executor, readers, read_timeout, group_type):
+    """
+    Read all due readers concurrently, like DataAggregator._store_data().
+
+    Returns
+    -------
+    batch : list of tuple
+        [(attr_key, t_new, d_new), ...]
+    buffer_load : dict
+        {attr_key: fill level of the event buffer} of the push attributes
+        that have been drained
+    error_dev : list of str
+        attributes without new data
+    latency : dict
+        {attr_key: read latency in seconds}
+    """
+    def timed(get_batch):
+        t_read = time.perf_counter()
+        batches = get_batch()
+        return batches, time.perf_counter() - t_read
+
+    futures = {
+        executor.submit(timed, reader.get_batch): reader for reader in readers
+    }
+    done, _ = concurrent.futures.wait(futures, timeout=read_timeout)
+
+    batch, error_dev = [], []
+    latency = {}
+    buffer_load = {}
+    for future, reader in futures.items():
+        is_group = isinstance(reader, group_type)
+        handles = reader.handles if is_group else [reader]
+        if future in done and future.exception() is None:
+            batches, t_read = future.result()
+            if not is_group:
+                batches = [batches]
+        else:
+            for p_handle in handles:
+                p_handle.last_error = f"no reply within {read_timeout} s"
+            batches = [p_handle._to_array([], []) for p_handle in handles]
+            t_read = read_timeout
+
+        for p_handle, (t_new, d_new) in zip(handles, batches):
+            latency[p_handle.attr_key] = t_read
+            n_new = len(t_new)
+            if p_handle.attr_type == "push_attribute":
+                buffer_load[p_handle.attr_key] = n_new / p_handle.size_buffer
+            if n_new == 0:
+                error_dev.append(p_handle.attr_key)
+                continue
+            if p_handle.change_filter is not None:
+                t_new, d_new = p_handle.change_filter.apply(t_new, d_new)
+                if len(t_new) == 0:
+                    continue
+            batch.append((p_handle.attr_key, t_new, d_new))
+    return batch, buffer_load, error_dev, latency
@@ -0,0 +1,155 @@
+import collections
+import os
+import pickle
+import queue
+import shutil
+import threading
+import time
+
+
+BACKPRESSURE_POLICIES = ("block", "drop_oldest", "spill")
+
+
+class DAWriter(threading.Thread):
+    """
+    Writes batches of recorded data in a thread of its own.
+
+    Batches are handed over through a bounded queue. If the queue is full, the
+    back-pressure policy decides what happens to a new batch:
+
+    - block: the producer waits until the writer has caught up
+    - drop_oldest: the oldest queued batch is discarded
+    - spill: the batch is stored in a spill directory and written as soon as
+      the queue has been drained. Batches keep their order.
+
+    Parameters
+    ----------
+    write_batch : callable
+        write_batch(batch) stores a single batch, called in the writer thread
+    size_queue : int
+        maximum number of queued batches
+    policy : str
+        one of BACKPRESSURE_POLICIES
+    dir_spill : str, optional
+        directory for spilled batches, mandatory for the 'spill' policy
+    """
+    def __init__(self, write_batch, size_queue=100, policy="block",
+                 dir_spill=None, name=None):
+        super().__init__(name=name, daemon=True)
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Allowed policies: {BACKPRESSURE_POLICIES}")
+        if policy == "spill" and not dir_spill:
+            raise ValueError("policy 'spill' requires a spill directory")
+
+        self._write_batch = write_batch
+        self._queue = queue.Queue(maxsize=max(size_queue, 1))
+        self._policy = policy
+        self._dir_spill = dir_spill
+        self._spilled = collections.deque()
+        self._n_spill = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        self.write_latency = 0.0
+        self.n_written = 0
+        self.n_dropped = 0
+        self.n_spilled = 0
+        self.last_error = None
+
+    @property
+    def queue_depth(self):
+        """
+        Returns
+        -------
+        int
+            number of batches waiting to be written, including spilled ones
+        """
+        return self._queue.qsize() + len(self._spilled)
+
+    def put(self, batch):
+        """
+        Hand a batch over to the writer. Blocks, if the policy is 'block' and
+        the queue is full.
+        """
+        if self._policy == "block":
+            self._queue.put(batch)
+            return
+
+        with self._lock:
+            if self._policy == "spill" and self._spilled:
+                # keep the order, once batches have been spilled
+                self._spill(batch)
+                return
+            try:
+                self._queue.put_nowait(batch)
+                return
+            except queue.Full:
+                pass
+
+            if self._policy == "spill":
+                self._spill(batch)
+            else:
+                try:
+                    self._queue.get_nowait()
+                    self.n_dropped += 1
+                except queue.Empty:
+                    pass
+                self._queue.put_nowait(batch)
+
+    def stop(self):
+        """
+        Write all pending batches and end the thread.
+        """
+        self._stopping.set()
+        self.join()
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                if self._stopping.is_set() and self.queue_depth == 0:
+                    break
+                continue
+
+            t_start = time.perf_counter()
+            try:
+                self._write_batch(batch)
+                self.n_written += 1
+            except Exception as err:
+                self.last_error = err
+            t_write = time.perf_counter() - t_start
+            self.write_latency = (self.write_latency + t_write) / 2.0
+
+        if self._dir_spill and os.path.isdir(self._dir_spill):
+            shutil.rmtree(self._dir_spill, ignore_errors=True)
+
+    def _next_batch(self):
+        # while batches are spilled, new batches are spilled too: the queue
+        # only holds batches older than the spilled ones and doesn't grow
+        with self._lock:
+            spilled = bool(self._spilled)
+        if not spilled:
+            try:
+                return self._queue.get(timeout=0.1)
+            except queue.Empty:
+                return None
+
+        with self._lock:
+            try:
+                return self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            path = self._spilled.popleft()
+        with open(path, "rb") as f:
+            batch = pickle.load(f)
+        os.remove(path)
+        return batch
+
+    def _spill(self, batch):
+        os.makedirs(self._dir_spill, exist_ok=True)
+        path = os.path.join(self._dir_spill, f"{self._n_spill:09d}.pkl")
+        with open(path, "wb") as f:
+            pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._n_spill += 1
+        self._spilled.append(path)
+        self.n_spilled += 1